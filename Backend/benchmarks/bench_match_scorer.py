@@ -0,0 +1,246 @@
+# Team-search scoring benchmark
+#
+# Scores synthetic profiles with the original per-profile scorer (kept here as
+# the reference) and with matching.RankingEngine, one profile at a time, as a
+# batch rank() and as team search pages it (ranking() once, then page_after()
+# per cursor), checks that all return the same results, and reports throughput.
+#
+#   python benchmarks/bench_match_scorer.py [--profiles 100000] [--seed 7]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matching  # noqa: E402
+from matching import RankingEngine, page_after, profile_match_fields  # noqa: E402
+
+SKILLS = [
+    "Python", "JavaScript", "TypeScript", "React", "React Native", "Node.js", "Django",
+    "FastAPI", "Flask", "Go", "Rust", "Java", "Kotlin", "Swift", "C++", "C#", "SQL",
+    "PostgreSQL", "MongoDB", "Redis", "AWS", "GCP", "Azure", "Docker", "Kubernetes",
+    "Terraform", "Machine Learning", "Deep Learning", "NLP", "Computer Vision",
+    "Data Analysis", "Data Engineering", "UI Design", "UX Research", "Figma",
+    "Product Management", "Marketing", "Sales", "Finance", "Blockchain", "Solidity",
+    "DevOps", "Security", "Android", "iOS", "GraphQL", "Next.js", "Vue", "Angular", "R",
+]
+INTERESTS = [
+    "FinTech", "HealthTech", "EdTech", "Climate", "AI", "SaaS", "E-commerce", "Gaming",
+    "Social Impact", "Web3", "Robotics", "AgriTech", "Media", "Travel", "Logistics",
+]
+ROLES = [
+    "Software Engineer", "Frontend Developer", "Backend Developer", "Full Stack Developer",
+    "Data Scientist", "Product Manager", "Designer", "Marketing Lead", "Founder", "Student",
+]
+EXPERIENCE = ["Junior", "Mid", "Senior", "Lead"]
+AVAILABILITY = ["Full-time", "Part-time", "Weekends", "Flexible"]
+LOCATIONS = ["Remote", "Bangalore, India", "Mumbai, India", "New York, USA", "London, UK", "Berlin"]
+
+def reference_score(profile: dict, requirements: dict) -> tuple:
+    """The scorer team search used before RankingEngine, verbatim apart from None guards"""
+    score = 0
+    matched_skills = []
+    matched_interests = []
+
+    def normalize_text(text: str) -> str:
+        return text.lower().strip()
+
+    def is_skill_match(profile_skill: str, req_skill: str) -> bool:
+        p_skill = normalize_text(profile_skill)
+        r_skill = normalize_text(req_skill)
+        if p_skill == r_skill:
+            return True
+        if len(r_skill) >= 3:
+            if r_skill in p_skill or p_skill in r_skill:
+                overlap = min(len(r_skill), len(p_skill))
+                if overlap / max(len(r_skill), len(p_skill)) >= 0.7:
+                    return True
+        return False
+
+    req_skills = requirements.get("required_skills") or []
+    if req_skills:
+        profile_skills = profile.get("skills", [])
+        for req_skill in req_skills:
+            for profile_skill in profile_skills:
+                if is_skill_match(profile_skill, req_skill):
+                    if profile_skill not in matched_skills:
+                        matched_skills.append(profile_skill)
+                    break
+        score += len(matched_skills) / len(req_skills) * 60
+    else:
+        score += 30
+
+    req_role = (requirements.get("current_role") or "").strip()
+    profile_role = (profile.get("role") or "").strip()
+    if req_role and profile_role:
+        req_role_norm = normalize_text(req_role)
+        profile_role_norm = normalize_text(profile_role)
+        if req_role_norm == profile_role_norm or req_role_norm in profile_role_norm or \
+                profile_role_norm in req_role_norm:
+            score += 15
+        elif set(req_role_norm.split()) & set(profile_role_norm.split()):
+            score += 7.5
+
+    req_experience = (requirements.get("experience") or "").strip()
+    profile_experience = (profile.get("experience") or "").strip()
+    if req_experience and profile_experience:
+        if normalize_text(req_experience) == normalize_text(profile_experience):
+            score += 10
+        else:
+            exp_levels = ["junior", "mid", "senior"]
+            try:
+                req_idx = exp_levels.index(normalize_text(req_experience))
+                prof_idx = exp_levels.index(normalize_text(profile_experience))
+                if abs(req_idx - prof_idx) == 1:
+                    score += 5
+            except ValueError:
+                pass
+    elif not req_experience:
+        score += 5
+
+    req_availability = (requirements.get("availability") or "").strip()
+    profile_availability = (profile.get("availability") or "").strip()
+    if req_availability and profile_availability:
+        if normalize_text(req_availability) == normalize_text(profile_availability):
+            score += 5
+    elif not req_availability:
+        score += 2.5
+
+    req_location = (requirements.get("location") or "").strip()
+    profile_location = (profile.get("location") or "").strip()
+    if req_location and profile_location:
+        req_loc_norm = normalize_text(req_location)
+        prof_loc_norm = normalize_text(profile_location)
+        if "remote" in req_loc_norm and "remote" in prof_loc_norm:
+            score += 5
+        elif req_loc_norm in prof_loc_norm or prof_loc_norm in req_loc_norm:
+            score += 5
+        elif set(req_loc_norm.split()) & set(prof_loc_norm.split()):
+            score += 2.5
+    elif not req_location:
+        score += 2.5
+
+    req_interests = requirements.get("interests") or []
+    if req_interests:
+        profile_interests = profile.get("interests", [])
+        for req_interest in req_interests:
+            for profile_interest in profile_interests:
+                if is_skill_match(profile_interest, req_interest):
+                    if profile_interest not in matched_interests:
+                        matched_interests.append(profile_interest)
+                    break
+        score += len(matched_interests) / len(req_interests) * 5
+
+    return min(100, max(0, int(score))), matched_skills, matched_interests
+
+def synthetic_profile(rng: random.Random) -> dict:
+    profile = {
+        "skills": rng.sample(SKILLS, rng.randint(2, 10)),
+        "interests": rng.sample(INTERESTS, rng.randint(1, 4)),
+        "role": rng.choice(ROLES),
+        "experience": rng.choice(EXPERIENCE),
+        "availability": rng.choice(AVAILABILITY),
+        "location": rng.choice(LOCATIONS),
+        "user_id": f"{rng.getrandbits(96):024x}",
+    }
+    # Stored the way update_user_profile writes it
+    match_index = {}
+    for dotted_key, value in profile_match_fields(profile).items():
+        match_index[dotted_key.split(".", 1)[1]] = value
+    profile["match_index"] = match_index
+    return profile
+
+def timed(label: str, fn, profiles: list) -> tuple:
+    start = time.perf_counter()
+    results = [fn(profile) for profile in profiles]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {elapsed * 1000:9.1f} ms  {len(profiles) / elapsed:12,.0f} profiles/s")
+    return results, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    profiles = [synthetic_profile(rng) for _ in range(args.profiles)]
+    requirements = {
+        "required_skills": ["python", "React", "machine learn", "Docker", "sql", "Go"],
+        "current_role": "Backend Developer",
+        "experience": "Mid",
+        "availability": "Part-time",
+        "location": "Bangalore",
+        "interests": ["fintech", "AI"],
+    }
+
+    print(f"Scoring {args.profiles:,} synthetic profiles")
+    reference, reference_time = timed("reference", lambda p: reference_score(p, requirements), profiles)
+
+    compile_start = time.perf_counter()
+    engine = RankingEngine(requirements)
+    compile_ms = (time.perf_counter() - compile_start) * 1000
+    compiled, compiled_time = timed("engine", engine.score, profiles)
+
+    mismatches = sum(1 for expected, actual in zip(reference, compiled) if expected != actual)
+
+    # Batch mode, as team search uses it: rank the whole set against the threshold
+    expected_ranking = sorted(
+        (i for i, result in enumerate(reference) if result[0] >= matching.MIN_MATCH_SCORE),
+        key=lambda i: -reference[i][0]
+    )
+    positions = {id(profile): i for i, profile in enumerate(profiles)}
+    numpy_installed = matching.np
+    for label, numpy_module in (("rank numpy", matching.np), ("rank python", None)):
+        if label == "rank numpy" and numpy_module is None:
+            print("rank numpy   skipped (numpy not installed)")
+            continue
+        matching.np = numpy_module
+        start = time.perf_counter()
+        ranked = RankingEngine(requirements).rank(profiles)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<12} {elapsed * 1000:9.1f} ms  {len(profiles) / elapsed:12,.0f} profiles/s")
+        ranking = [positions[id(profile)] for _, profile, _, _ in ranked]
+        if ranking != expected_ranking or any(
+            (score, skills, interests) != reference[positions[id(profile)]]
+            for score, profile, skills, interests in ranked
+        ):
+            print(f"FAIL: {label} ranking differs from the reference")
+            mismatches += 1
+    matching.np = numpy_installed
+
+    # Paged, as team search serves it: rank once per query, then cut each page from the list by cursor
+    start = time.perf_counter()
+    ranking = RankingEngine(requirements).ranking(profiles)
+    ranking_time = time.perf_counter() - start
+    start = time.perf_counter()
+    walked, after, has_more = [], None, True
+    while has_more:
+        page, has_more = page_after(ranking, after, 20)
+        walked.extend(page)
+        after = page[-1] if page else None
+    pages = max(1, -(-len(ranking) // 20))
+    page_time = (time.perf_counter() - start) / pages
+    print(f"{'ranking':<12} {ranking_time * 1000:9.1f} ms  {len(profiles) / ranking_time:12,.0f} profiles/s")
+    print(f"{'page_after':<12} {page_time * 1000:9.3f} ms  per page of 20 ({pages:,} pages)")
+    expected_pages = sorted(
+        ((reference[i][0], profile["user_id"]) for i, profile in enumerate(profiles)
+         if reference[i][0] >= matching.MIN_MATCH_SCORE),
+        key=lambda entry: (-entry[0], int(entry[1], 16))
+    )
+    if walked != expected_pages:
+        print("FAIL: paged ranking differs from the reference")
+        mismatches += 1
+
+    print(f"compile      {compile_ms:9.3f} ms")
+    print(f"speedup      {reference_time / compiled_time:9.2f}x (per profile)")
+
+    if mismatches:
+        print(f"FAIL: {mismatches} mismatch(es)")
+        sys.exit(1)
+    print("OK: identical scores, matched terms, ranking and pages")
+
+if __name__ == "__main__":
+    main()
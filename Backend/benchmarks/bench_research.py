@@ -0,0 +1,155 @@
+# /research-papers benchmark
+#
+# Sends research requests to a running API and reports end-to-end latency and
+# the per-stage durations the endpoint returns in its Server-Timing header:
+# terms (search-term generation), fetch_<source> and parse_<source> per
+# academic API, fetch (all sources, in parallel), dedup_rank and save (only
+# when authenticated). With --server-pid it also reports the API process's
+# resident memory before and after the run and its peak.
+#
+# To run fully offline, start the API against the mock services:
+#
+#   python benchmarks/mock_academic.py --latency-ms 300 &
+#   python benchmarks/mock_groq.py --latency-ms 200 &
+#   SEMANTIC_SCHOLAR_API=http://127.0.0.1:8091/graph/v1/paper/search \
+#   ARXIV_API=http://127.0.0.1:8091/api/query CROSSREF_API=http://127.0.0.1:8091/works \
+#   SEMANTIC_SCHOLAR_MIN_INTERVAL_SECONDS=0 \
+#   GROQ_BASE_URL=http://127.0.0.1:8090/openai/v1 GROQ_API_KEY=mock uvicorn main:app --port 8000 &
+#   python benchmarks/bench_research.py --requests 50 --server-pid $! --history benchmarks/research_history.jsonl
+#
+# --history appends one JSON line per run (with the git commit) so results can
+# be compared over time.
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from load_test import summarize
+
+IDEAS = [
+    "A marketplace that matches home cooks with nearby office workers for affordable daily lunches",
+    "An AI tutor that adapts maths exercises to each student's mistakes in real time",
+    "A platform that predicts crop disease from smartphone photos for smallholder farmers",
+    "A logistics service that consolidates last-mile deliveries for small online shops",
+    "A mobile app that helps renters split utility bills and track shared expenses",
+]
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    timings = {}
+    for metric in filter(None, (part.strip() for part in header.split(","))):
+        name, *params = [piece.strip() for piece in metric.split(";")]
+        for param in params:
+            key, _, value = param.partition("=")
+            if key == "dur":
+                timings[name] = float(value)
+    return timings
+
+def read_memory_kb(pid: int) -> Optional[Dict[str, int]]:
+    """VmRSS / VmHWM (peak) of a process, from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return None
+    return {key: int(fields[key].split()[0]) for key in ("VmRSS", "VmHWM") if key in fields}
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args) -> Dict:
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = defaultdict(list)
+    papers: List[int] = []
+    errors: Dict[str, int] = defaultdict(int)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, timeout=args.timeout) as client:
+        async def one(i: int, record: bool):
+            async with semaphore:
+                body = {"idea": IDEAS[i % len(IDEAS)], "max_results": 10}
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/research-papers", json=body)
+                except httpx.HTTPError as e:
+                    errors[type(e).__name__] += 1
+                    return
+                elapsed = (time.perf_counter() - start) * 1000
+            if not record:
+                return
+            if response.status_code != 200:
+                errors[str(response.status_code)] += 1
+                return
+            latencies.append(elapsed)
+            papers.append(len(response.json().get("papers", [])))
+            for name, duration in parse_server_timing(response.headers.get("server-timing", "")).items():
+                stages[name].append(duration)
+
+        await asyncio.gather(*(one(i, record=False) for i in range(args.warmup)))
+        memory_before = read_memory_kb(args.server_pid) if args.server_pid else None
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i, record=True) for i in range(args.requests)))
+        wall = time.perf_counter() - started
+        memory_after = read_memory_kb(args.server_pid) if args.server_pid else None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "config": {"requests": args.requests, "concurrency": args.concurrency, "base_url": args.base_url},
+        "throughput_rps": len(latencies) / wall if wall else 0,
+        "end_to_end_ms": summarize(latencies),
+        "stages_ms": {name: summarize(samples) for name, samples in sorted(stages.items())},
+        "papers_per_response": summarize(papers),
+        "memory_kb": {"before": memory_before, "after": memory_after},
+        "errors": dict(errors),
+    }
+
+def print_report(report: Dict):
+    row = "{:<24} {:>6} {:>9} {:>9} {:>9}"
+    print(row.format("stage", "n", "p50 ms", "p95 ms", "p99 ms"))
+    for name, stats in [("end-to-end", report["end_to_end_ms"]), *report["stages_ms"].items()]:
+        print(row.format(name, stats["count"], f"{stats['p50']:.1f}", f"{stats['p95']:.1f}", f"{stats['p99']:.1f}"))
+    print(f"throughput: {report['throughput_rps']:.2f} req/s, "
+          f"papers/response p50: {report['papers_per_response']['p50']}")
+    memory = report["memory_kb"]
+    if memory["before"] and memory["after"]:
+        print(f"server RSS: {memory['before'].get('VmRSS', 0) / 1024:.1f} MB -> "
+              f"{memory['after'].get('VmRSS', 0) / 1024:.1f} MB (peak {memory['after'].get('VmHWM', 0) / 1024:.1f} MB)")
+    if report["errors"]:
+        print(f"errors: {report['errors']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /research-papers end to end and per stage")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--token", help="JWT; authenticated runs include the save stage")
+    parser.add_argument("--server-pid", type=int, help="API process id, for memory figures")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--history", help="append the report as one JSON line to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.history:
+        with open(args.history, "a") as f:
+            f.write(json.dumps(report) + "\n")
+    sys.exit(1 if report["errors"] else 0)
+
+if __name__ == "__main__":
+    main()
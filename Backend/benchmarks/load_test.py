@@ -0,0 +1,195 @@
+# End-to-end load test for the LLM-backed endpoints
+#
+# Drives /validate-idea-enhanced, /generate-roadmap, /chat-with-idea and
+# /research-papers at a fixed arrival rate (open loop: requests are sent on
+# schedule whether or not earlier ones finished, and latency is measured from
+# the scheduled send time, so a stalled server can't hide its queueing), and
+# reports p50/p95/p99 per endpoint plus event-loop lag:
+#
+#   * server lag - latency of GET /health probes sent alongside the load. The
+#     handler does no I/O, so its latency above the idle baseline is time the
+#     API's event loop spent blocked.
+#   * client lag - how late this harness's own timer fires; if it is high the
+#     harness, not the API, is the bottleneck.
+#
+# Run against the API wired to benchmarks/mock_groq.py to see our own overhead:
+#
+#   python benchmarks/mock_groq.py --latency-ms 500 &
+#   GROQ_BASE_URL=http://127.0.0.1:8090/openai/v1 GROQ_API_KEY=mock uvicorn main:app --port 8000 &
+#   python benchmarks/load_test.py --rps 5 --duration 30 [--endpoints validate,chat] [--json out.json]
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+IDEA = (
+    "A mobile app that connects home cooks with office workers nearby, letting them order "
+    "affordable home-made lunches that are delivered by bicycle couriers before noon."
+)
+
+ENDPOINTS = {
+    "validate": ("/validate-idea-enhanced", {"prompt": IDEA}),
+    "roadmap": ("/generate-roadmap", {"prompt": IDEA, "timeframe": "6 months"}),
+    "chat": ("/chat-with-idea", {
+        "message": "How should I price the first month for early customers?",
+        "idea_context": IDEA,
+        "session_id": "load-test"
+    }),
+    "research": ("/research-papers", {"idea": IDEA, "max_results": 10}),
+}
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    rank = max(1, min(len(ordered), round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+        "max": max(samples) if samples else float("nan"),
+    }
+
+async def drive_endpoint(client: httpx.AsyncClient, name: str, rps: float, deadline: float,
+                         latencies: Dict[str, List[float]], errors: Dict[str, Dict[str, int]],
+                         inflight: asyncio.Semaphore):
+    path, body = ENDPOINTS[name]
+    interval = 1 / rps
+    tasks = []
+
+    async def fire(scheduled: float):
+        if inflight.locked():
+            errors[name]["dropped"] += 1
+            return
+        async with inflight:
+            try:
+                response = await client.post(path, json=body)
+                outcome = str(response.status_code) if response.status_code >= 400 else None
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+        if outcome:
+            errors[name][outcome] += 1
+        else:
+            latencies[name].append((time.perf_counter() - scheduled) * 1000)
+
+    scheduled = time.perf_counter()
+    while scheduled < deadline:
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        tasks.append(asyncio.create_task(fire(scheduled)))
+        scheduled += interval
+    await asyncio.gather(*tasks)
+
+async def probe_server(client: httpx.AsyncClient, interval: float, deadline: float, samples: List[float]):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            await client.get("/health")
+            samples.append((time.perf_counter() - start) * 1000)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+async def monitor_client_lag(interval: float, deadline: float, samples: List[float]):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - start - interval) * 1000)
+
+async def idle_baseline(client: httpx.AsyncClient, count: int = 20) -> float:
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        await client.get("/health")
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+async def run(args) -> Dict:
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    limits = httpx.Limits(max_connections=args.max_inflight, max_keepalive_connections=args.max_inflight)
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, limits=limits,
+                                 timeout=args.timeout) as client, \
+            httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as probe_client:
+        baseline = await idle_baseline(probe_client)
+
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        probes: List[float] = []
+        client_lag: List[float] = []
+        inflight = asyncio.Semaphore(args.max_inflight)
+
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *(drive_endpoint(client, name, args.rps, deadline, latencies, errors, inflight)
+              for name in args.endpoints),
+            probe_server(probe_client, args.probe_interval, deadline, probes),
+            monitor_client_lag(0.01, deadline, client_lag),
+        )
+
+    return {
+        "config": {
+            "base_url": args.base_url,
+            "rps_per_endpoint": args.rps,
+            "duration_s": args.duration,
+            "endpoints": args.endpoints,
+        },
+        "endpoints": {
+            name: {**summarize(latencies[name]), "errors": dict(errors[name])}
+            for name in args.endpoints
+        },
+        "server_lag_ms": {**summarize([max(0.0, p - baseline) for p in probes]), "idle_probe_ms": baseline},
+        "client_lag_ms": summarize(client_lag),
+    }
+
+def print_report(report: Dict):
+    row = "{:<14} {:>7} {:>9} {:>9} {:>9} {:>9}  {}"
+    print(row.format("endpoint", "ok", "p50 ms", "p95 ms", "p99 ms", "max ms", "errors"))
+    for name, stats in report["endpoints"].items():
+        print(row.format(name, stats["count"], f"{stats['p50']:.1f}", f"{stats['p95']:.1f}",
+                         f"{stats['p99']:.1f}", f"{stats['max']:.1f}", stats["errors"] or "-"))
+    for label, key in (("server lag", "server_lag_ms"), ("client lag", "client_lag_ms")):
+        stats = report[key]
+        print(row.format(label, stats["count"], f"{stats['p50']:.1f}", f"{stats['p95']:.1f}",
+                         f"{stats['p99']:.1f}", f"{stats['max']:.1f}", ""))
+    print(f"idle /health probe: {report['server_lag_ms']['idle_probe_ms']:.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the LLM-backed endpoints")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rps", type=float, default=2, help="requests per second, per endpoint")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help=f"comma-separated subset of {', '.join(ENDPOINTS)}")
+    parser.add_argument("--token", help="JWT to send (the endpoints also work anonymously)")
+    parser.add_argument("--max-inflight", type=int, default=200, help="requests beyond this are dropped")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="seconds between /health probes")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    args.endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in args.endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoint(s): {', '.join(unknown)}")
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = sum(sum(stats["errors"].values()) for stats in report["endpoints"].values())
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
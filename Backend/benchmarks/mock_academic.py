@@ -0,0 +1,249 @@
+# Local stand-ins for the Semantic Scholar, arXiv and CrossRef search APIs
+#
+# Serves fixture responses in each service's own format so /research-papers'
+# fetch, parse, dedup and ranking run unchanged but offline and reproducibly.
+# Fixtures come from --fixtures DIR (semantic_scholar.json, arxiv.xml,
+# crossref.json - record real ones with the `record` command) or, by default,
+# are generated deterministically from --seed, with a share of titles repeated
+# across sources (punctuation and case varied) so dedup has work to do.
+#
+#   python benchmarks/mock_academic.py --port 8091 --latency-ms 400 --throttle-rate 0.05
+#   SEMANTIC_SCHOLAR_API=http://127.0.0.1:8091/graph/v1/paper/search \
+#   ARXIV_API=http://127.0.0.1:8091/api/query CROSSREF_API=http://127.0.0.1:8091/works \
+#   SEMANTIC_SCHOLAR_MIN_INTERVAL_SECONDS=0 uvicorn main:app
+#
+#   python benchmarks/mock_academic.py record --out benchmarks/fixtures --query "food delivery logistics"
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+from typing import Dict, List
+from xml.sax.saxutils import escape
+
+SOURCES = ("semantic_scholar", "arxiv", "crossref")
+
+UPSTREAMS = {
+    "semantic_scholar": "https://api.semanticscholar.org/graph/v1/paper/search",
+    "arxiv": "https://export.arxiv.org/api/query",
+    "crossref": "https://api.crossref.org/works",
+}
+
+FIXTURE_FILES = {
+    "semantic_scholar": "semantic_scholar.json",
+    "arxiv": "arxiv.xml",
+    "crossref": "crossref.json",
+}
+
+TOPICS = [
+    "Recommendation Systems", "Last-Mile Delivery", "Food Supply Chains", "Gig Economy Platforms",
+    "Demand Forecasting", "Route Optimization", "Mobile Payments", "Trust in Online Marketplaces",
+    "Urban Logistics", "Consumer Behaviour", "Federated Learning", "Graph Neural Networks",
+]
+FRAMINGS = [
+    "A Survey of {}", "{}: A Large-Scale Empirical Study", "Towards Scalable {}",
+    "Learning-Based Approaches to {}", "Revisiting {} in Emerging Markets", "{} Under Uncertainty",
+]
+SURNAMES = ["Chen", "Patel", "Garcia", "Okafor", "Kim", "Novak", "Silva", "Rao", "Müller", "Haddad"]
+GIVEN = ["A.", "B.", "C.", "D.", "E.", "F.", "G.", "H."]
+
+# =====================
+# FIXTURES
+# =====================
+def synthetic_papers(seed: int, count: int) -> Dict[str, List[dict]]:
+    """Source-neutral paper records per source; ~30% of titles appear in more than one source"""
+    rng = random.Random(seed)
+    shared = [_paper(rng, i) for i in range(count // 3)]
+    papers = {}
+    for source in SOURCES:
+        records = [dict(paper) for paper in rng.sample(shared, len(shared) // 2)]
+        for record in records:
+            # Same paper, different punctuation/case - dedup must still catch it
+            record["title"] = rng.choice([record["title"].upper(), record["title"] + ".", record["title"].replace(":", " -")])
+        records += [_paper(rng, f"{source}-{i}") for i in range(count - len(records))]
+        rng.shuffle(records)
+        papers[source] = records
+    return papers
+
+def _paper(rng: random.Random, key) -> dict:
+    year = rng.randint(2008, 2025)
+    return {
+        "key": str(key),
+        "title": rng.choice(FRAMINGS).format(rng.choice(TOPICS)) + f" ({key})",
+        "authors": [f"{rng.choice(GIVEN)} {rng.choice(SURNAMES)}" for _ in range(rng.randint(1, 6))],
+        "abstract": " ".join(
+            rng.choice(["We study", "This paper examines", "We propose", "Results show"]) + " "
+            + rng.choice(TOPICS).lower() + "." for _ in range(rng.randint(0, 12))
+        ),
+        "year": year,
+        "doi": f"10.{rng.randint(1000, 9999)}/mock.{key}" if rng.random() < 0.7 else None,
+        "citations": rng.randint(0, 2000),
+    }
+
+def render_semantic_scholar(papers: List[dict]) -> bytes:
+    return json.dumps({"total": len(papers), "offset": 0, "data": [
+        {
+            "paperId": paper["key"],
+            "title": paper["title"],
+            "authors": [{"name": name} for name in paper["authors"]],
+            "abstract": paper["abstract"] or None,
+            "year": paper["year"],
+            "url": f"https://www.semanticscholar.org/paper/{paper['key']}",
+            "externalIds": {"DOI": paper["doi"]} if paper["doi"] else {},
+            "citationCount": paper["citations"],
+        }
+        for paper in papers
+    ]}).encode("utf-8")
+
+def render_arxiv(papers: List[dict]) -> bytes:
+    entries = []
+    for paper in papers:
+        authors = "".join(f"<author><name>{escape(name)}</name></author>" for name in paper["authors"])
+        entries.append(
+            f"<entry><id>http://arxiv.org/abs/{escape(paper['key'])}</id>"
+            f"<published>{paper['year']}-01-15T00:00:00Z</published>"
+            f"<title>{escape(paper['title'])}</title>"
+            f"<summary>{escape(paper['abstract'])}</summary>{authors}</entry>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<feed xmlns="http://www.w3.org/2005/Atom"><title>arXiv Query</title>'
+        + "".join(entries) + "</feed>"
+    ).encode("utf-8")
+
+def render_crossref(papers: List[dict]) -> bytes:
+    items = []
+    for paper in papers:
+        item = {
+            "title": [paper["title"]],
+            "author": [
+                {"given": name.split(" ", 1)[0], "family": name.split(" ", 1)[-1]} for name in paper["authors"]
+            ],
+            "created": {"date-parts": [[paper["year"], 1, 15]]},
+            "URL": f"https://doi.org/{paper['doi']}" if paper["doi"] else "",
+            "DOI": paper["doi"],
+            "is-referenced-by-count": paper["citations"],
+        }
+        if paper["abstract"]:
+            item["abstract"] = f"<jats:p>{paper['abstract']}</jats:p>"
+        items.append(item)
+    return json.dumps({"status": "ok", "message": {"total-results": len(items), "items": items}}).encode("utf-8")
+
+RENDERERS = {
+    "semantic_scholar": render_semantic_scholar,
+    "arxiv": render_arxiv,
+    "crossref": render_crossref,
+}
+
+def load_fixtures(fixtures_dir: str, seed: int, count: int) -> Dict[str, bytes]:
+    generated = None
+    fixtures = {}
+    for source in SOURCES:
+        path = os.path.join(fixtures_dir, FIXTURE_FILES[source]) if fixtures_dir else None
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                fixtures[source] = f.read()
+            continue
+        generated = generated or synthetic_papers(seed, count)
+        fixtures[source] = RENDERERS[source](generated[source])
+    return fixtures
+
+# =====================
+# SERVER
+# =====================
+def create_app(fixtures: Dict[str, bytes], latency_ms: Dict[str, float], jitter_ms: float,
+               error_rate: float, throttle_rate: float, seed: int):
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse, Response
+
+    app = FastAPI(title="Mock academic APIs")
+    rng = random.Random(seed)
+
+    async def serve(source: str, media_type: str):
+        await asyncio.sleep(max(0.0, latency_ms[source] + rng.uniform(-jitter_ms, jitter_ms)) / 1000)
+        roll = rng.random()
+        if roll < throttle_rate:
+            return JSONResponse({"message": "Too Many Requests"}, status_code=429, headers={"Retry-After": "1"})
+        if roll < throttle_rate + error_rate:
+            return JSONResponse({"message": "Internal Server Error"}, status_code=500)
+        return Response(fixtures[source], media_type=media_type)
+
+    @app.get("/graph/v1/paper/search")
+    async def semantic_scholar_search():
+        return await serve("semantic_scholar", "application/json")
+
+    @app.get("/api/query")
+    async def arxiv_query():
+        return await serve("arxiv", "application/atom+xml")
+
+    @app.get("/works")
+    async def crossref_works():
+        return await serve("crossref", "application/json")
+
+    return app
+
+def record(out_dir: str, query: str, rows: int):
+    """Save one real response per service as fixtures (needs network access)"""
+    import httpx
+
+    params = {
+        "semantic_scholar": {
+            "query": query, "limit": rows,
+            "fields": "title,authors,abstract,year,url,externalIds,publicationDate,citationCount",
+        },
+        "arxiv": {"search_query": f"all:{query}", "start": 0, "max_results": rows},
+        "crossref": {
+            "query": query, "rows": rows,
+            "select": "title,author,abstract,created,URL,DOI,published-print,published-online,is-referenced-by-count",
+        },
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    with httpx.Client(timeout=60, follow_redirects=True) as client:
+        for source in SOURCES:
+            response = client.get(UPSTREAMS[source], params=params[source])
+            response.raise_for_status()
+            with open(os.path.join(out_dir, FIXTURE_FILES[source]), "wb") as f:
+                f.write(response.content)
+            print(f"{source}: {len(response.content):,} bytes")
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "record":
+        parser = argparse.ArgumentParser(description="Record real API responses as fixtures")
+        parser.add_argument("command")
+        parser.add_argument("--out", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+        parser.add_argument("--query", required=True)
+        parser.add_argument("--rows", type=int, default=100)
+        args = parser.parse_args()
+        record(args.out, args.query, args.rows)
+        return
+
+    parser = argparse.ArgumentParser(description="Mock Semantic Scholar / arXiv / CrossRef server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--fixtures", help="directory with recorded fixtures (missing ones are generated)")
+    parser.add_argument("--papers", type=int, default=100, help="papers per source when generating")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--source-latency", action="append", default=[], metavar="SOURCE=MS",
+                        help=f"per-source latency override ({', '.join(SOURCES)})")
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="fraction of requests answered with 429")
+    args = parser.parse_args()
+
+    latency_ms = {source: args.latency_ms for source in SOURCES}
+    for override in args.source_latency:
+        source, _, value = override.partition("=")
+        if source not in latency_ms:
+            parser.error(f"unknown source: {source}")
+        latency_ms[source] = float(value)
+
+    import uvicorn
+
+    fixtures = load_fixtures(args.fixtures, args.seed, args.papers)
+    app = create_app(fixtures, latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
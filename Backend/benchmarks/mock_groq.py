@@ -0,0 +1,176 @@
+# Local stand-in for Groq's OpenAI-compatible chat completions API
+#
+# Replays canned completions - picked by which of our prompts a request carries
+# (idea validation, roadmap, search terms, idea chat) - after a configurable
+# delay, and streams them as server-sent events when the request sets
+# "stream": true. Run it and point the API at it:
+#
+#   python benchmarks/mock_groq.py --port 8090 --latency-ms 800 --jitter-ms 200
+#   GROQ_BASE_URL=http://127.0.0.1:8090/openai/v1 GROQ_API_KEY=mock uvicorn main:app
+#
+# --completions FILE replaces the canned texts with a JSON object keyed by
+# kind ("validation", "roadmap", "search_terms", "chat").
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CANNED_VALIDATION = {
+    "overall_score": 72,
+    "scores": {
+        "feasibility": 78,
+        "market_demand": 70,
+        "uniqueness": 64,
+        "strength": 74,
+        "risk_factors": 58
+    },
+    "analysis": {
+        "verdict": "A credible idea with a clear customer and a reachable first market. Differentiation is moderate, so execution speed matters.",
+        "feasibility": "Buildable with a small team on standard web and mobile tooling.",
+        "market_demand": "Demand is evidenced by existing paid alternatives in adjacent segments.",
+        "uniqueness": "Similar products exist; the niche focus is the main differentiator.",
+        "strength": "Solves a frequent, concrete pain point for a well-defined audience.",
+        "risk_factors": "Customer acquisition cost and incumbents copying the niche focus.",
+        "risk_mitigation": "Start with one city or vertical and build referral loops early.",
+        "existing_competitors": "ExampleCo (example.com), SampleApp (sample.app)"
+    },
+    "suggestions": {
+        "critical": ["Interview 20 target users before building"],
+        "recommended": ["Ship a landing page to measure interest"],
+        "optional": ["Explore partnerships with local businesses"]
+    }
+}
+
+CANNED_ROADMAP = {
+    "overview": "The roadmap moves from validation to a focused MVP, then to early traction and scaling. Each phase ends with a measurable milestone.",
+    "phases": [
+        {
+            "title": f"Phase {number}: {timeframe} - {name}",
+            "timeframe": timeframe,
+            "description": f"{name} for the first target segment, with clear exit criteria.",
+            "tasks": ["Define success metrics", "Build the core workflow", "Recruit pilot users", "Review results"],
+            "implementation": ["Plan the sprint", "Build", "Test with users", "Iterate"],
+            "resources": ["Cloud hosting", "Analytics", "Design tooling"],
+            "team": ["Founder", "Full-stack developer", "Designer"],
+            "challenges": ["Scope creep - keep a strict MVP list", "Slow feedback - schedule user calls"]
+        }
+        for number, (timeframe, name) in enumerate(
+            [("2-4 weeks", "Validation"), ("6-8 weeks", "MVP Development"), ("4-6 weeks", "Launch and Traction")],
+            start=1
+        )
+    ]
+}
+
+CANNED_COMPLETIONS = {
+    "validation": json.dumps(CANNED_VALIDATION),
+    "roadmap": json.dumps(CANNED_ROADMAP),
+    "search_terms": "machine learning, recommendation systems, user engagement",
+    "chat": (
+        "Start by narrowing the first customer segment to one you can reach directly this month. "
+        "Run ten interviews, then build only the workflow those users describe as most painful.\n\n"
+        "For funding, a small pre-seed round or a grant is realistic once you have usage data from a pilot."
+    )
+}
+
+def completion_kind(messages: list) -> str:
+    """Which canned completion a request gets, from the system prompt our API sends"""
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    if "overall_score" in system:
+        return "validation"
+    if "Roadmap Generator" in system:
+        return "roadmap"
+    if "search terms" in system:
+        return "search_terms"
+    return "chat"
+
+def create_app(completions: dict, latency_ms: float, jitter_ms: float,
+               first_token_ms: float, chunk_chars: int, chunk_delay_ms: float) -> FastAPI:
+    app = FastAPI(title="Mock Groq")
+
+    def delay() -> float:
+        return max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        content = completions[completion_kind(payload.get("messages", []))]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = payload.get("model", "mock")
+        usage = {
+            "prompt_tokens": sum(len(m.get("content", "")) for m in payload.get("messages", [])) // 4,
+            "completion_tokens": len(content) // 4
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not payload.get("stream"):
+            await asyncio.sleep(delay())
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+
+        async def events():
+            await asyncio.sleep(first_token_ms / 1000)
+            for start in range(0, len(content), chunk_chars):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": content[start:start + chunk_chars]}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(chunk_delay_ms / 1000)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "x_groq": {"usage": usage}
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Groq chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=800, help="delay before a non-streamed response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="uniform +/- jitter on --latency-ms")
+    parser.add_argument("--first-token-ms", type=float, default=200, help="delay before the first streamed chunk")
+    parser.add_argument("--chunk-chars", type=int, default=16, help="characters per streamed chunk")
+    parser.add_argument("--chunk-delay-ms", type=float, default=10, help="delay between streamed chunks")
+    parser.add_argument("--completions", help="JSON file overriding the canned completions by kind")
+    args = parser.parse_args()
+
+    completions = dict(CANNED_COMPLETIONS)
+    if args.completions:
+        with open(args.completions) as f:
+            completions.update(json.load(f))
+
+    app = create_app(completions, args.latency_ms, args.jitter_ms,
+                     args.first_token_ms, args.chunk_chars, args.chunk_delay_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
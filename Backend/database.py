@@ -1,6 +1,6 @@
 # Clean database.py - Team Finder Functionality
 import os
-from pymongo import MongoClient, errors
+from pymongo import MongoClient, errors, ReturnDocument, UpdateOne, InsertOne
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 from bson.objectid import ObjectId
@@ -8,8 +8,19 @@ from datetime import datetime, timedelta
 import jwt
 import logging
 import re
-from typing import List, Dict, Tuple
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Iterator, Optional, Callable
 import bcrypt
+from indexes import ensure_indexes
+from message_archive import ARCHIVE_COLLECTION, read_archived_messages
+from matching import RankingEngine, normalize_text, profile_match_fields, MATCH_INDEX_VERSION, MATCH_SOURCE_FIELDS
+from profile_embeddings import embedding_index, EMBEDDING_SOURCE_FIELDS
+from metrics import MongoCommandMetrics, record_cache_lookup
+from tracing import traced
 
 load_dotenv()
 
@@ -19,12 +30,21 @@ MONGO_DB = os.getenv("MONGO_DB")
 JWT_SECRET = os.getenv("JWT_SECRET", "R9AwDobUDMrtgJ_KBySMyOQkpAZAo3Eh0JFXPdUfEBI")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXPIRES_MINUTES = int(os.getenv("JWT_EXPIRES_MINUTES", "60"))
+REQUEST_RETRY_COOLDOWN_HOURS = 24
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "500"))
+DELETE_PARALLELISM = int(os.getenv("DELETE_PARALLELISM", "4"))
+# Connection requests answered per transaction by the batch respond path
+RESPOND_BATCH_SIZE = int(os.getenv("RESPOND_BATCH_SIZE", "100"))
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "5000"))
+CONVERSATION_CACHE_TTL_SECONDS = int(os.getenv("CONVERSATION_CACHE_TTL_SECONDS", "300"))
+TEAM_SEARCH_CACHE_SIZE = int(os.getenv("TEAM_SEARCH_CACHE_SIZE", "1000"))
+TEAM_SEARCH_CACHE_TTL_SECONDS = int(os.getenv("TEAM_SEARCH_CACHE_TTL_SECONDS", "600"))
 
 if not MONGO_URI or not MONGO_DB:
     raise Exception("MONGO_URI and MONGO_DB must be set in environment")
 
 # MongoDB connection
-client = MongoClient(MONGO_URI)
+client = MongoClient(MONGO_URI, event_listeners=[MongoCommandMetrics()])
 db = client[MONGO_DB]
 
 # Collections
@@ -41,30 +61,13 @@ connection_requests_collection = db["connection_requests"]
 support_tickets_collection = db["support_tickets"]
 admin_users_collection = db["admin_users"]
 ticket_responses_collection = db["ticket_responses"]
-# Create indexes for better performance
-try:
-    users_collection.create_index("email", unique=True)
-    profiles_collection.create_index("user_id", unique=True)
-    roadmaps_collection.create_index("user_id")
-    research_collection.create_index("user_id")
-    team_searches_collection.create_index("user_id")
-    team_searches_collection.create_index("created_at")
-    messages_collection.create_index("conversation_id")
-    messages_collection.create_index("sender_id")
-    messages_collection.create_index("timestamp")
-    conversations_collection.create_index("participant_ids")
-    conversations_collection.create_index("last_message_time")
-    connection_requests_collection.create_index([("sender_id", 1), ("receiver_id", 1)])
-    connection_requests_collection.create_index("status")
-    connection_requests_collection.create_index("created_at")
-    connections_collection.create_index([("user_id", 1), ("target_user_id", 1)])
-    connections_collection.create_index("status")
-    connections_collection.create_index([("user_id", 1), ("created_at", -1)])
-    connections_collection.create_index([("status", 1)])
-    connections_collection.create_index([("ticket_id", 1)], unique=True)
-
-except Exception as e:
-    print(f"Index creation error: {e}")
+user_stats_collection = db["user_stats"]
+pair_states_collection = db["pair_states"]
+migrations_collection = db["migrations"]
+counters_collection = db["counters"]
+message_archives_collection = db[ARCHIVE_COLLECTION]
+# Create indexes for better performance (declared in indexes.py)
+ensure_indexes(db)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -148,30 +151,79 @@ def get_user_profile(user_id: str):
     """Get user profile"""
     try:
         user_obj_id = ObjectId(user_id) if isinstance(user_id, str) else user_id
-        return profiles_collection.find_one({"user_id": user_obj_id})
+        return profiles_collection.find_one({"user_id": user_obj_id}, {"match_index": 0})
     except Exception as e:
         logging.error(f"Error getting user profile for {user_id}: {e}")
         return None
 
+# Fields shown on profile cards (requests, connections, search results)
+PROFILE_CARD_FIELDS = (
+    "phone", "role", "skills", "interests", "preferred_role",
+    "experience", "availability", "location"
+)
+
+def hydrate_profiles(user_ids: List, profile_fields=PROFILE_CARD_FIELDS) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Batch-load users and their profiles: one $in on users and one on profiles,
+    projected to the displayed fields (skipped when profile_fields is empty).
+    Returns ({user_id: user}, {user_id: profile}).
+    """
+    user_oids = list({ObjectId(uid) if isinstance(uid, str) else uid for uid in user_ids})
+    if not user_oids:
+        return {}, {}
+
+    users = {
+        str(user["_id"]): user
+        for user in users_collection.find({"_id": {"$in": user_oids}}, {"name": 1, "email": 1})
+    }
+
+    profiles = {}
+    if profile_fields:
+        projection = {"_id": 0, "user_id": 1, **{field: 1 for field in profile_fields}}
+        for profile in profiles_collection.find({"user_id": {"$in": user_oids}}, projection):
+            profile["user_id"] = str(profile["user_id"])
+            profiles[profile["user_id"]] = profile
+
+    return users, profiles
+
 def update_user_profile(user_id: str, profile_data: dict):
     """Update or create user profile"""
     try:
         user_obj_id = ObjectId(user_id) if isinstance(user_id, str) else user_id
         profile_data["updated_at"] = datetime.utcnow()
         
+        # Keep the pre-normalized match terms in step with skills / interests
         result = profiles_collection.update_one(
             {"user_id": user_obj_id},
-            {"$set": profile_data},
+            {"$set": {**profile_data, **profile_match_fields(profile_data)}},
             upsert=True
         )
+        if result.upserted_id is not None:
+            user_stats_collection.update_one({"_id": user_obj_id}, {"$set": {"profile_exists": True}})
+        
+        bump_profile_version()
+        if any(field in profile_data for field in EMBEDDING_SOURCE_FIELDS):
+            refresh_profile_embedding(user_obj_id, profile_data)
         return result
     except Exception as e:
         logging.error(f"Error updating profile for user {user_id}: {e}")
         raise
 
+def refresh_profile_embedding(user_obj_id: ObjectId, profile_data: dict):
+    """Re-embed a profile for team recommendations after its skills, interests or role change"""
+    try:
+        if not all(field in profile_data for field in EMBEDDING_SOURCE_FIELDS):
+            profile_data = profiles_collection.find_one(
+                {"user_id": user_obj_id}, {field: 1 for field in EMBEDDING_SOURCE_FIELDS}
+            ) or {}
+        embedding_index.upsert(str(user_obj_id), profile_data)
+    except Exception as e:
+        logging.error(f"Failed to refresh profile embedding for {user_obj_id}: {e}")
+
 # =====================
 # IDEAS FUNCTIONS
 # =====================
+@traced("db.save_idea_validation")
 def save_idea_validation(user_id: str, idea_data: dict) -> str:
     """Save a validated idea to the database"""
     try:
@@ -188,6 +240,7 @@ def save_idea_validation(user_id: str, idea_data: dict) -> str:
         }
         
         result = ideas_collection.insert_one(idea_doc)
+        bump_user_stats(user_obj_id, "ideas", when=idea_doc["created_at"])
         logging.info(f"Successfully saved idea validation with ID: {result.inserted_id}")
         return str(result.inserted_id)
         
@@ -216,6 +269,7 @@ def get_user_ideas(user_id: str, limit: int = 10) -> list:
 # =====================
 # ROADMAP FUNCTIONS
 # =====================
+@traced("db.create_roadmap")
 def create_roadmap(user_id: str, roadmap_data: dict) -> str:
     """Create a new roadmap"""
     try:
@@ -232,6 +286,7 @@ def create_roadmap(user_id: str, roadmap_data: dict) -> str:
         }
         
         result = roadmaps_collection.insert_one(roadmap_doc)
+        bump_user_stats(user_obj_id, "roadmaps", when=now)
         logging.info(f"Successfully saved roadmap with ID: {result.inserted_id}")
         return str(result.inserted_id)
         
@@ -260,6 +315,7 @@ def get_user_roadmaps(user_id: str) -> list:
 # =====================
 # RESEARCH FUNCTIONS
 # =====================
+@traced("db.save_research")
 def save_research(user_id: str, research_data: dict) -> str:
     """Save a new research document"""
     try:
@@ -275,6 +331,7 @@ def save_research(user_id: str, research_data: dict) -> str:
         }
         
         result = research_collection.insert_one(research_doc)
+        bump_user_stats(user_obj_id, "research", when=research_doc["created_at"])
         logging.info(f"Successfully saved research with ID: {result.inserted_id}")
         return str(result.inserted_id)
         
@@ -303,48 +360,147 @@ def get_user_research_history(user_id: str, limit: int = 10) -> list:
 # =====================
 # USER ACTIVITY FUNCTIONS
 # =====================
+# Per-user counters live in one user_stats document keyed by the user's ObjectId:
+#   {_id, ideas, roadmaps, research, profile_exists, days: {"YYYY-MM-DD": {ideas, ...}},
+#    counted_until, rebuilt_at}
+# Saves $inc the totals and today's bucket, so reading stats is a single _id lookup.
+#
+# The doc is built on first read without losing concurrent saves: the rebuild
+# first inserts an empty doc stamped counted_until = now, then $incs in the
+# counts of everything created before that instant. A save only counts items
+# created at or after counted_until, so each item is counted exactly once -
+# by the rebuild's aggregation or by its own bump - whichever way they race.
+STATS_KINDS = ("ideas", "roadmaps", "research")
+STATS_RECENT_DAYS = 30
+# A doc still without rebuilt_at this long after counted_until was left by a failed rebuild
+STATS_REBUILD_STALE_SECONDS = 60
+
+def _stats_day(when: datetime) -> str:
+    return when.strftime("%Y-%m-%d")
+
+def bump_user_stats(user_id, kind: str, delta: int = 1, when: Optional[datetime] = None) -> None:
+    """Atomically adjust a user's activity counter for an item created at `when`"""
+    try:
+        user_obj_id = ObjectId(user_id) if isinstance(user_id, str) else user_id
+        when = when or datetime.utcnow()
+        # No upsert: a missing doc is rebuilt from the collections on first read, and
+        # items created before its counted_until are already in the rebuilt counts
+        # ($nor rather than $lte so docs built before counted_until existed still count)
+        user_stats_collection.update_one(
+            {"_id": user_obj_id, "$nor": [{"counted_until": {"$gt": when}}]},
+            {"$inc": {kind: delta, f"days.{_stats_day(when)}.{kind}": delta}}
+        )
+    except Exception as e:
+        logging.error(f"Failed to update {kind} stats for {user_id}: {e}")
+
+def _rebuild_user_stats(user_obj_id: ObjectId) -> Optional[dict]:
+    """
+    Build the counters doc with one $facet aggregation per collection. Returns
+    None if another rebuild claimed the doc first.
+    """
+    # Mongo dates have millisecond precision: round up so items saved earlier in this millisecond fall before it
+    now = datetime.utcnow()
+    counted_until = now.replace(microsecond=now.microsecond // 1000 * 1000) + timedelta(milliseconds=1)
+    try:
+        user_stats_collection.insert_one({
+            "_id": user_obj_id, "counted_until": counted_until,
+            **{kind: 0 for kind in STATS_KINDS}, "profile_exists": False, "days": {}
+        })
+    except errors.DuplicateKeyError:
+        return None
+
+    since = counted_until - timedelta(days=STATS_RECENT_DAYS)
+    increments = {}
+    for kind, collection in zip(STATS_KINDS, (ideas_collection, roadmaps_collection, research_collection)):
+        facets = next(collection.aggregate([
+            {"$match": {"user_id": user_obj_id, "created_at": {"$lt": counted_until}}},
+            {"$facet": {
+                "total": [{"$count": "n"}],
+                "days": [
+                    {"$match": {"created_at": {"$gte": since}}},
+                    {"$group": {
+                        "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                        "n": {"$sum": 1}
+                    }}
+                ]
+            }}
+        ]), {"total": [], "days": []})
+
+        increments[kind] = facets["total"][0]["n"] if facets["total"] else 0
+        for bucket in facets["days"]:
+            increments[f"days.{bucket['_id']}.{kind}"] = bucket["n"]
+
+    # $max, not $set: update_user_profile may have flipped it on since the doc was inserted
+    profile_exists = profiles_collection.count_documents({"user_id": user_obj_id}, limit=1) > 0
+    return user_stats_collection.find_one_and_update(
+        {"_id": user_obj_id},
+        {
+            "$inc": increments,
+            "$max": {"profile_exists": profile_exists},
+            "$set": {"rebuilt_at": datetime.utcnow()}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+
+def _load_user_stats(user_obj_id: ObjectId) -> dict:
+    stats_doc = user_stats_collection.find_one({"_id": user_obj_id})
+    if stats_doc is not None and "rebuilt_at" not in stats_doc:
+        stale_before = datetime.utcnow() - timedelta(seconds=STATS_REBUILD_STALE_SECONDS)
+        if stats_doc.get("counted_until", stale_before) > stale_before:
+            return stats_doc  # Another request is rebuilding it; its counts are partial for a moment
+        # A rebuild died half way: start over
+        user_stats_collection.delete_one({"_id": user_obj_id, "rebuilt_at": {"$exists": False}})
+        stats_doc = None
+    if stats_doc is None:
+        stats_doc = _rebuild_user_stats(user_obj_id) or user_stats_collection.find_one({"_id": user_obj_id}) or {}
+    return stats_doc
+
+def _activity_from_stats(stats_doc: dict) -> dict:
+    return {
+        "ideas": stats_doc.get("ideas", 0),
+        "roadmaps": stats_doc.get("roadmaps", 0),
+        "research": stats_doc.get("research", 0),
+        "profile_exists": bool(stats_doc.get("profile_exists", False))
+    }
+
 def get_user_activity(user_id: str) -> dict:
     """Get user activity summary"""
     try:
-        user_obj_id = ObjectId(user_id)
-        return {
-            "ideas": ideas_collection.count_documents({"user_id": user_obj_id}),
-            "roadmaps": roadmaps_collection.count_documents({"user_id": user_obj_id}),
-            "research": research_collection.count_documents({"user_id": user_obj_id}),
-            "profile_exists": profiles_collection.count_documents({"user_id": user_obj_id}) > 0
-        }
+        return _activity_from_stats(_load_user_stats(ObjectId(user_id)))
     except Exception as e:
         logging.error(f"Failed to get user activity for {user_id}: {e}")
         return {"ideas": 0, "roadmaps": 0, "research": 0, "profile_exists": False}
 
 def get_user_stats(user_id: str) -> dict:
-    """Get comprehensive user statistics"""
+    """Get comprehensive user statistics from the per-user counters doc"""
     try:
-        activity = get_user_activity(user_id)
         user_obj_id = ObjectId(user_id)
-        
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        
-        recent_ideas = ideas_collection.count_documents({
-            "user_id": user_obj_id,
-            "created_at": {"$gte": thirty_days_ago}
-        })
-        
-        recent_roadmaps = roadmaps_collection.count_documents({
-            "user_id": user_obj_id,
-            "created_at": {"$gte": thirty_days_ago}
-        })
-        
-        recent_research = research_collection.count_documents({
-            "user_id": user_obj_id,
-            "created_at": {"$gte": thirty_days_ago}
-        })
-        
+        stats_doc = _load_user_stats(user_obj_id)
+
+        # Day buckets make "recent" day-granular: everything since the cutoff date
+        cutoff = _stats_day(datetime.utcnow() - timedelta(days=STATS_RECENT_DAYS))
+        days = stats_doc.get("days", {})
+        recent = {kind: 0 for kind in STATS_KINDS}
+        expired = []
+        for day, counts in days.items():
+            if day < cutoff:
+                expired.append(day)
+                continue
+            for kind in STATS_KINDS:
+                recent[kind] += counts.get(kind, 0)
+
+        if expired:
+            user_stats_collection.update_one(
+                {"_id": user_obj_id},
+                {"$unset": {f"days.{day}": "" for day in expired}}
+            )
+
+        activity = _activity_from_stats(stats_doc)
         return {
             **activity,
-            "recent_ideas": recent_ideas,
-            "recent_roadmaps": recent_roadmaps,
-            "recent_research": recent_research,
+            "recent_ideas": recent["ideas"],
+            "recent_roadmaps": recent["roadmaps"],
+            "recent_research": recent["research"],
             "total_activity": activity["ideas"] + activity["roadmaps"] + activity["research"]
         }
     except Exception as e:
@@ -621,121 +777,114 @@ def get_connected_profiles(user_id: str) -> List[Dict]:
 # =====================
 # TEAM FINDER - SEARCH FUNCTIONS
 # =====================
-def calculate_profile_match_score(profile: Dict, requirements: Dict) -> Tuple[int, List[str], List[str]]:
-    """Calculate match score between profile and requirements"""
-    score = 0
-    total_criteria = 0
-    matched_skills = []
-    matched_interests = []
-    
-    # Skills matching (40% weight)
-    if requirements.get("required_skills"):
-        profile_skills = profile.get("skills", [])
-        req_skills = requirements["required_skills"]
-        
-        for skill in profile_skills:
-            for req_skill in req_skills:
-                if (skill.lower() in req_skill.lower() or 
-                    req_skill.lower() in skill.lower()):
-                    if skill not in matched_skills:
-                        matched_skills.append(skill)
-        
-        if req_skills:
-            skill_match_ratio = len(matched_skills) / len(req_skills)
-            score += skill_match_ratio * 40
-        total_criteria += 40
-    
-    # Interests matching (25% weight)
-    if requirements.get("interests"):
-        profile_interests = profile.get("interests", [])
-        req_interests = requirements["interests"]
-        
-        for interest in profile_interests:
-            for req_interest in req_interests:
-                if (interest.lower() in req_interest.lower() or 
-                    req_interest.lower() in interest.lower()):
-                    if interest not in matched_interests:
-                        matched_interests.append(interest)
-        
-        if req_interests:
-            interest_match_ratio = len(matched_interests) / len(req_interests)
-            score += interest_match_ratio * 25
-        total_criteria += 25
-    
-    # Experience matching (15% weight)
-    if requirements.get("experience") and profile.get("experience"):
-        if profile.get("experience") == requirements["experience"]:
-            score += 15
-    total_criteria += 15
-    
-    # Availability matching (10% weight)
-    if requirements.get("availability") and profile.get("availability"):
-        if profile.get("availability") == requirements["availability"]:
-            score += 10
-    total_criteria += 10
-    
-    # Preferred role matching (10% weight)
-    if requirements.get("preferred_role") and profile.get("preferred_role"):
-        profile_role = profile.get("preferred_role", "").lower()
-        req_role = requirements["preferred_role"].lower()
-        if req_role in profile_role:
-            score += 10
-    total_criteria += 10
-    
-    final_score = min(100, max(0, int((score / total_criteria) * 100)))
-    return final_score, matched_skills, matched_interests
+def team_search_prefilter(engine: RankingEngine) -> Dict:
+    """The engine's Mongo prefilter, once every profile carries a current match_index"""
+    if not migration_completed(PROFILE_MATCH_INDEX_MIGRATION):
+        return {}
+    return engine.prefilter() or {}
 
 def find_matching_profiles(requirements: Dict, exclude_user_id: str, limit: int = 10) -> List[Dict]:
-    """Find profiles matching the search requirements"""
+    """Find profiles matching the search requirements (ranked by matching.RankingEngine)"""
     try:
         # Get all profiles except current user
+        engine = RankingEngine(requirements)
         query = {"user_id": {"$ne": ObjectId(exclude_user_id)}}
-        profiles_cursor = profiles_collection.find(query)
-        
-        matched_profiles = []
-        
-        for profile in profiles_cursor:
-            # Calculate match score
-            match_score, matched_skills, matched_interests = calculate_profile_match_score(
-                profile, requirements
-            )
-            
-            # Only include profiles with decent match scores
-            if match_score >= 30:
-                # Get user details for this profile
-                user = get_user_by_id(str(profile["user_id"]))
-                if user:
-                    profile_id = str(profile["user_id"])
-                    connection_status = get_connection_status(exclude_user_id, profile_id)
-                    
-                    matched_profile = {
-                        "id": profile_id,
-                        "name": user.get("name", "Unknown"),
-                        "email": user.get("email", ""),
-                        "phone": profile.get("phone", ""),
-                        "role": profile.get("role", ""),
-                        "skills": profile.get("skills", []),
-                        "interests": profile.get("interests", []),
-                        "preferred_role": profile.get("preferred_role", ""),
-                        "experience": profile.get("experience", ""),
-                        "availability": profile.get("availability", ""),
-                        "location": profile.get("location", ""),
-                        "match_score": match_score,
-                        "matched_skills": matched_skills,
-                        "matched_interests": matched_interests,
-                        "connection_status": connection_status
-                    }
-                    matched_profiles.append(matched_profile)
+        query.update(team_search_prefilter(engine))
+        projection = {"user_id": 1, "match_index": 1, **{field: 1 for field in PROFILE_CARD_FIELDS}}
+        page = engine.rank(profiles_collection.find(query, projection))[:limit]
+        users, _ = hydrate_profiles([profile["user_id"] for _, profile, _, _ in page], profile_fields=())
+        
+        top_profiles = []
+        for match_score, profile, matched_skills, matched_interests in page:
+            profile_id = str(profile["user_id"])
+            user = users.get(profile_id)
+            if user:
+                matched_profile = {
+                    "id": profile_id,
+                    "name": user.get("name", "Unknown"),
+                    "email": user.get("email", ""),
+                    "phone": profile.get("phone", ""),
+                    "role": profile.get("role", ""),
+                    "skills": profile.get("skills", []),
+                    "interests": profile.get("interests", []),
+                    "preferred_role": profile.get("preferred_role", ""),
+                    "experience": profile.get("experience", ""),
+                    "availability": profile.get("availability", ""),
+                    "location": profile.get("location", ""),
+                    "match_score": match_score,
+                    "matched_skills": matched_skills,
+                    "matched_interests": matched_interests
+                }
+                top_profiles.append(matched_profile)
         
-        # Sort by match score (highest first)
-        matched_profiles.sort(key=lambda x: x["match_score"], reverse=True)
+        # Resolve connection status only for the profiles actually returned
+        statuses = get_connection_statuses_batch(exclude_user_id, [p["id"] for p in top_profiles])
+        for matched_profile in top_profiles:
+            matched_profile["connection_status"] = statuses[matched_profile["id"]]
         
-        return matched_profiles[:limit]
+        return top_profiles
         
     except Exception as e:
         logging.error(f"Error finding matching profiles: {e}")
         return []
 
+# =====================
+# TEAM SEARCH CACHE
+# =====================
+# (requester, normalized search) -> (expires_at, profile_version, ranking), the
+# ranking being the (score, user_id) list every page of the search is cut from.
+# Any profile write bumps the shared profile_version counter, read once per
+# search, so a cached ranking is only served while no profile has changed since
+# it was built. Per-process; the TTL backstops changes made outside
+# update_user_profile / delete_user_data (e.g. a user renaming themselves).
+PROFILE_VERSION_COUNTER = "profile_version"
+
+_team_search_cache: "OrderedDict[str, Tuple[float, int, List[Tuple[int, str]]]]" = OrderedDict()
+_team_search_cache_lock = threading.Lock()
+
+def bump_profile_version() -> None:
+    counters_collection.update_one({"_id": PROFILE_VERSION_COUNTER}, {"$inc": {"value": 1}}, upsert=True)
+
+def current_profile_version() -> int:
+    counter = counters_collection.find_one({"_id": PROFILE_VERSION_COUNTER}, {"value": 1})
+    return counter["value"] if counter else 0
+
+def team_search_cache_key(user_id: str, search_input: Dict) -> str:
+    """Cache key for a search; inputs that rank identically map to the same key"""
+    # Term order and repeats are kept: they decide matched_* order and the skill ratio
+    normalized = {
+        "required_skills": [normalize_text(term) for term in search_input.get("required_skills") or []],
+        "interests": [normalize_text(term) for term in search_input.get("interests") or []],
+        **{
+            field: normalize_text(search_input.get(field))
+            for field in ("current_role", "experience", "availability", "location")
+        }
+    }
+    return json.dumps([str(user_id), normalized], sort_keys=True)
+
+def get_cached_team_search(cache_key: str, profile_version: int) -> Optional[List[Tuple[int, str]]]:
+    now = time.monotonic()
+    with _team_search_cache_lock:
+        cached = _team_search_cache.get(cache_key)
+        if not cached:
+            record_cache_lookup("team_search", "miss")
+            return None
+        expires_at, cached_version, ranking = cached
+        if expires_at <= now or cached_version != profile_version:
+            del _team_search_cache[cache_key]
+            record_cache_lookup("team_search", "stale")
+            return None
+        _team_search_cache.move_to_end(cache_key)
+        record_cache_lookup("team_search", "hit")
+        return ranking
+
+def cache_team_search(cache_key: str, profile_version: int, ranking: List[Tuple[int, str]]) -> None:
+    with _team_search_cache_lock:
+        _team_search_cache[cache_key] = (time.monotonic() + TEAM_SEARCH_CACHE_TTL_SECONDS, profile_version, ranking)
+        _team_search_cache.move_to_end(cache_key)
+        while len(_team_search_cache) > TEAM_SEARCH_CACHE_SIZE:
+            _team_search_cache.popitem(last=False)
+
 # =====================
 # TEAM FINDER - CHAT FUNCTIONS
 # =====================
@@ -855,9 +1004,420 @@ def get_messages(user_id: str, conversation_id: str, skip: int = 0, limit: int =
     except Exception as e:
         logging.error(f"Error getting messages: {e}")
         return []
+# =====================
+# CROSS-COLLECTION WRITES
+# =====================
+# Flipped off the first time the server rejects a client-level bulkWrite (pre-8.0)
+_client_bulk_write_supported = True
+
+def _raise_if_duplicate_key(write_errors: List[dict], cause: Exception) -> None:
+    for write_error in write_errors:
+        if write_error.get("code") == 11000:
+            raise errors.DuplicateKeyError(write_error.get("errmsg", "duplicate key"), 11000, write_error) from cause
+
+def _write_across_collections(writes: List[Tuple[object, type, tuple, dict]]) -> None:
+    """
+    Apply ordered (collection, InsertOne|UpdateOne, args, kwargs) writes that span
+    collections. On MongoDB 8.0+ they go out as one client-level bulkWrite; older
+    servers get one write per operation. Either way the first failure stops the
+    rest, and a duplicate key surfaces as DuplicateKeyError.
+    """
+    global _client_bulk_write_supported
+    if _client_bulk_write_supported:
+        try:
+            client.bulk_write([
+                operation(*args, namespace=collection.full_name, **kwargs)
+                for collection, operation, args, kwargs in writes
+            ], ordered=True)
+            return
+        except errors.ClientBulkWriteException as e:
+            _raise_if_duplicate_key(e.write_errors or [], e)
+            raise
+        except (errors.InvalidOperation, errors.OperationFailure) as e:
+            if isinstance(e, errors.OperationFailure) and e.code not in (59, 115):
+                raise  # A real write error, not "command unsupported"
+            logging.info(f"Client bulkWrite unavailable ({e}); using per-collection writes")
+            _client_bulk_write_supported = False
+
+    for collection, operation, args, kwargs in writes:
+        try:
+            collection.bulk_write([operation(*args, **kwargs)])
+        except errors.BulkWriteError as e:
+            _raise_if_duplicate_key(e.details.get("writeErrors", []), e)
+            raise
+
 # ADD these functions to your existing database.py file
 # Keep ALL your existing functions - just ADD these new ones
 
+# =====================
+# TEAM FINDER - PAIR STATE
+# =====================
+# One pair_states document per unordered user pair is the source of truth for
+# the relationship between two users:
+#   {_id: "<lower id>:<higher id>", users: [lo, hi], status, sender_id, receiver_id,
+#    request_id, created_at, updated_at}
+# status is one of "none", "pending", "connected", "rejected". Every transition is a
+# single write guarded on the current status, and the _id is the unique index on
+# the canonical pair, so concurrent or mutual requests can't both win.
+# connections / connection_requests are kept as mirrors for listings.
+
+def pair_key(user_a, user_b) -> str:
+    """Canonical key for an unordered user pair"""
+    low, high = sorted((str(user_a), str(user_b)))
+    return f"{low}:{high}"
+
+def _pair_users(user_a, user_b) -> List[ObjectId]:
+    return [ObjectId(uid) for uid in sorted((str(user_a), str(user_b)))]
+
+def status_from_pair_state(pair_state: Optional[dict], user_oid: ObjectId) -> str:
+    """Translate a pair_states document into the status seen by one side of the pair"""
+    if not pair_state:
+        return "not_connected"
+    if pair_state.get("status") == "connected":
+        return "connected"
+    if pair_state.get("status") == "pending":
+        return "request_sent" if pair_state.get("sender_id") == user_oid else "request_received"
+    return "not_connected"
+
+def _connection_doc_upserts(user_a: ObjectId, user_b: ObjectId, now: datetime) -> List[UpdateOne]:
+    """Upserts for both directional connection mirrors of a pair"""
+    return [
+        UpdateOne(
+            {"user_id": owner, "target_user_id": target},
+            {"$set": {"status": "connected", "updated_at": now}, "$setOnInsert": {"created_at": now}},
+            upsert=True
+        )
+        for owner, target in ((user_a, user_b), (user_b, user_a))
+    ]
+
+def _ensure_connection_docs(user_a: ObjectId, user_b: ObjectId, now: datetime) -> None:
+    """Upsert both directional connection mirrors in one round trip"""
+    connections_collection.bulk_write(_connection_doc_upserts(user_a, user_b, now), ordered=False)
+
+def create_connection_request_fixed(sender_id: str, receiver_id: str, message: str = "",
+                                    idempotency_key: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Send a connection request through the pair state machine.
+    Returns (request_id, outcome) where outcome is "sent" or "accepted" (the
+    receiver had already asked, so the request completes the connection).
+    A retry carrying the same idempotency_key returns the original result.
+    Raises ValueError when the pair is in a state that forbids a new request.
+    """
+    if sender_id == receiver_id:
+        raise ValueError("Cannot send request to yourself")
+
+    sender_oid = ObjectId(sender_id)
+    receiver_oid = ObjectId(receiver_id)
+    key = pair_key(sender_id, receiver_id)
+    now = datetime.utcnow()
+    request_id = ObjectId()
+
+    def idempotency(outcome: str, outcome_request_id: ObjectId) -> dict:
+        return {"key": idempotency_key, "sender_id": sender_oid, "request_id": outcome_request_id, "outcome": outcome}
+
+    # 1. Open a request if the pair is idle (or the rejection cooldown has passed).
+    #    If the pair doc exists in any other state the upsert hits the unique _id and
+    #    the ordered write stops before the request mirror is inserted.
+    try:
+        _write_across_collections([
+            (pair_states_collection, UpdateOne, (
+                {
+                    "_id": key,
+                    "$or": [
+                        {"status": "none"},
+                        {"status": "rejected", "updated_at": {"$lte": now - timedelta(hours=REQUEST_RETRY_COOLDOWN_HOURS)}}
+                    ]
+                },
+                {
+                    "$set": {
+                        "status": "pending",
+                        "sender_id": sender_oid,
+                        "receiver_id": receiver_oid,
+                        "request_id": request_id,
+                        "idempotency": idempotency("sent", request_id),
+                        "updated_at": now
+                    },
+                    "$setOnInsert": {"users": _pair_users(sender_id, receiver_id), "created_at": now}
+                }
+            ), {"upsert": True}),
+            (connection_requests_collection, InsertOne, ({
+                "_id": request_id,
+                "sender_id": sender_oid,
+                "receiver_id": receiver_oid,
+                "message": message,
+                "status": "pending",
+                "created_at": now,
+                "updated_at": now
+            },), {})
+        ])
+        return str(request_id), "sent"
+    except errors.DuplicateKeyError:
+        pass
+
+    # 2. The receiver already asked us: accepting their request connects the pair
+    accepted = pair_states_collection.find_one_and_update(
+        {"_id": key, "status": "pending", "sender_id": receiver_oid},
+        [{"$set": {
+            "status": "connected",
+            "updated_at": now,
+            "idempotency": {
+                "key": {"$literal": idempotency_key},
+                "sender_id": sender_oid,
+                "request_id": "$request_id",
+                "outcome": "accepted"
+            }
+        }}]
+    )
+    if accepted:
+        connection_requests_collection.update_one(
+            {"_id": accepted["request_id"]},
+            {"$set": {"status": "accepted", "updated_at": now}}
+        )
+        _ensure_connection_docs(sender_oid, receiver_oid, now)
+        return str(accepted["request_id"]), "accepted"
+
+    # 3. A retry of a request that already went through returns its original result
+    pair_state = pair_states_collection.find_one({"_id": key}) or {}
+    previous = pair_state.get("idempotency") or {}
+    if idempotency_key and previous.get("key") == idempotency_key and previous.get("sender_id") == sender_oid:
+        return str(previous["request_id"]), previous["outcome"]
+
+    # 4. Otherwise explain why the pair can't take a new request
+    if pair_state.get("status") == "connected":
+        raise ValueError("Already connected with this user")
+    if pair_state.get("status") == "pending":
+        raise ValueError("Connection request already sent")
+    if pair_state.get("status") == "rejected":
+        hours_since = (now - pair_state["updated_at"]).total_seconds() / 3600
+        remaining = max(1, int(REQUEST_RETRY_COOLDOWN_HOURS - hours_since))
+        raise ValueError(f"Please wait {remaining} hours before sending another request")
+    raise ValueError("Connection state changed, please try again")
+
+# Flipped off the first time the server refuses a transaction (standalone mongod)
+_transactions_supported = True
+
+def _run_transaction(callback: Callable) -> None:
+    """Run callback(session) inside a transaction, or with session=None where unsupported"""
+    global _transactions_supported
+    if _transactions_supported:
+        try:
+            with client.start_session() as session:
+                session.with_transaction(callback)
+            return
+        except errors.OperationFailure as e:
+            if e.code != 20:  # IllegalOperation: transactions need a replica set
+                raise
+            logging.warning("Transactions unavailable on this server; writing without one")
+            _transactions_supported = False
+    callback(None)
+
+def respond_to_connection_requests(user_id: str, request_ids: List[str], action: str) -> Dict[str, str]:
+    """
+    Accept or reject pending requests addressed to user_id. Each chunk of
+    RESPOND_BATCH_SIZE requests is one transaction of bulk writes, so pair
+    states, request mirrors and connection mirrors always change together.
+    Returns {request_id: "accepted" | "rejected" | "not_found"}; requests that
+    were already handled (e.g. by a concurrent response) are "not_found".
+    """
+    accept = action == "accept"
+    outcome = "accepted" if accept else "rejected"
+    pair_status = "connected" if accept else "rejected"
+    receiver_oid = ObjectId(user_id)
+    request_oids = list(dict.fromkeys(ObjectId(request_id) for request_id in request_ids))
+    results = {str(request_oid): "not_found" for request_oid in request_oids}
+
+    for start in range(0, len(request_oids), RESPOND_BATCH_SIZE):
+        chunk = request_oids[start:start + RESPOND_BATCH_SIZE]
+        handled: List[dict] = []
+
+        def respond_chunk(session):
+            handled.clear()
+            now = datetime.utcnow()
+            pending = {
+                request["_id"]: request
+                for request in connection_requests_collection.find(
+                    {"_id": {"$in": chunk}, "receiver_id": receiver_oid, "status": "pending"},
+                    {"sender_id": 1}, session=session
+                )
+            }
+            if not pending:
+                return
+
+            # Only pairs still pending on exactly this request may transition
+            pair_states_collection.bulk_write([
+                UpdateOne(
+                    {
+                        "_id": pair_key(request["sender_id"], receiver_oid),
+                        "status": "pending",
+                        "receiver_id": receiver_oid,
+                        "request_id": request_id
+                    },
+                    {"$set": {"status": pair_status, "updated_at": now}}
+                )
+                for request_id, request in pending.items()
+            ], ordered=False, session=session)
+
+            # Read back which pairs this write moved (needed when running without a transaction)
+            moved = pair_states_collection.find(
+                {
+                    "_id": {"$in": [pair_key(request["sender_id"], receiver_oid) for request in pending.values()]},
+                    "request_id": {"$in": list(pending)},
+                    "status": pair_status,
+                    "updated_at": now
+                },
+                {"request_id": 1}, session=session
+            )
+            handled.extend(pending[state["request_id"]] for state in moved)
+            if not handled:
+                return
+
+            connection_requests_collection.update_many(
+                {"_id": {"$in": [request["_id"] for request in handled]}},
+                {"$set": {"status": outcome, "updated_at": now}},
+                session=session
+            )
+            if accept:
+                connections_collection.bulk_write([
+                    upsert
+                    for request in handled
+                    for upsert in _connection_doc_upserts(request["sender_id"], receiver_oid, now)
+                ], ordered=False, session=session)
+
+        _run_transaction(respond_chunk)
+        for request in handled:
+            results[str(request["_id"])] = outcome
+
+    return results
+
+def get_connection_statuses_batch(user_id: str, target_user_ids: List[str]) -> Dict[str, str]:
+    """Resolve the connection status towards many users with one $in read"""
+    user_oid = ObjectId(user_id)
+    statuses = {target_id: "not_connected" for target_id in target_user_ids}
+    keys = {
+        pair_key(user_id, target_id): target_id
+        for target_id in statuses
+        if ObjectId.is_valid(target_id) and target_id != user_id
+    }
+    if not keys:
+        return statuses
+
+    for pair_state in pair_states_collection.find({"_id": {"$in": list(keys)}}, {"status": 1, "sender_id": 1}):
+        statuses[keys[pair_state["_id"]]] = status_from_pair_state(pair_state, user_oid)
+    return statuses
+
+def clear_pair_state(user_id: str, target_user_id: str, status: Optional[str] = None) -> None:
+    """Return a pair to the idle state (optionally only from a given status)"""
+    query = {"_id": pair_key(user_id, target_user_id)}
+    if status:
+        query["status"] = status
+    pair_states_collection.update_one(query, {"$set": {"status": "none", "updated_at": datetime.utcnow()}})
+
+def backfill_pair_states() -> int:
+    """Materialize pair_states from the legacy connections / connection_requests collections"""
+    written = 0
+    for request in connection_requests_collection.find({"status": {"$in": ["pending", "rejected"]}}):
+        result = pair_states_collection.update_one(
+            {"_id": pair_key(request["sender_id"], request["receiver_id"])},
+            {"$setOnInsert": {
+                "users": _pair_users(request["sender_id"], request["receiver_id"]),
+                "status": request["status"],
+                "sender_id": request["sender_id"],
+                "receiver_id": request["receiver_id"],
+                "request_id": request["_id"],
+                "created_at": request.get("created_at", datetime.utcnow()),
+                "updated_at": request.get("updated_at", datetime.utcnow())
+            }},
+            upsert=True
+        )
+        written += 1 if result.upserted_id is not None else 0
+
+    # An existing connection always wins over request history
+    for connection in connections_collection.find({"status": "connected"}, {"user_id": 1, "target_user_id": 1}):
+        pair_states_collection.update_one(
+            {"_id": pair_key(connection["user_id"], connection["target_user_id"])},
+            {
+                "$set": {"status": "connected"},
+                "$setOnInsert": {
+                    "users": _pair_users(connection["user_id"], connection["target_user_id"]),
+                    "created_at": datetime.utcnow(),
+                    "updated_at": datetime.utcnow()
+                }
+            },
+            upsert=True
+        )
+        written += 1
+
+    logging.info(f"Backfilled {written} pair state(s)")
+    return written
+
+PROFILE_MATCH_INDEX_MIGRATION = f"profile_match_index_v{MATCH_INDEX_VERSION}"
+
+def backfill_profile_match_index(batch_size: int = 500) -> int:
+    """Derive match_index for profiles written before it existed or with an older version"""
+    updated = 0
+    batch = []
+    cursor = profiles_collection.find(
+        {"match_index.version": {"$ne": MATCH_INDEX_VERSION}},
+        {field: 1 for field in MATCH_SOURCE_FIELDS}
+    )
+    for profile in cursor:
+        source = {field: profile.get(field) for field in MATCH_SOURCE_FIELDS}
+        batch.append(UpdateOne({"_id": profile["_id"]}, {"$set": profile_match_fields(source)}))
+        if len(batch) >= batch_size:
+            updated += profiles_collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += profiles_collection.bulk_write(batch, ordered=False).modified_count
+    return updated
+
+def dedupe_connections() -> int:
+    """Drop duplicate directional connection docs, then build the unique pair index"""
+    removed = 0
+    duplicates = connections_collection.aggregate([
+        {"$group": {
+            "_id": {"user_id": "$user_id", "target_user_id": "$target_user_id"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    for group in duplicates:
+        removed += connections_collection.delete_many({"_id": {"$in": group["ids"][1:]}}).deleted_count
+
+    ensure_indexes(db)
+    return removed
+
+def run_migration_once(name: str, migration: Callable[[], object]) -> bool:
+    """Run a one-off data migration exactly once across all workers"""
+    try:
+        migrations_collection.insert_one({"_id": name, "status": "running", "started_at": datetime.utcnow()})
+    except errors.DuplicateKeyError:
+        return False
+
+    try:
+        result = migration()
+        migrations_collection.update_one(
+            {"_id": name},
+            {"$set": {"status": "completed", "result": result, "finished_at": datetime.utcnow()}}
+        )
+        return True
+    except Exception as e:
+        logging.error(f"Migration {name} failed: {e}")
+        # Drop the marker so the next startup retries
+        migrations_collection.delete_one({"_id": name})
+        raise
+
+_completed_migrations = set()
+
+def migration_completed(name: str) -> bool:
+    """Whether a one-off migration has finished (cached once true)"""
+    if name in _completed_migrations:
+        return True
+    if migrations_collection.find_one({"_id": name, "status": "completed"}, {"_id": 1}):
+        _completed_migrations.add(name)
+        return True
+    return False
+
 # =====================
 # TEAM FINDER - FIXED CONNECTION REQUEST FUNCTIONS
 # =====================
@@ -958,47 +1518,34 @@ def create_connection_request(sender_id: str, receiver_id: str, message: str = "
         logging.error(f"Error creating connection request: {e}")
         raise ValueError("Failed to create connection request")
 
-def get_connection_requests_fixed(user_id: str, request_type: str = "received") -> List[Dict]:
-    """Get connection requests for a user - FIXED VERSION"""
+def _pending_requests_query(user_id: str, request_type: str) -> dict:
+    side = "receiver_id" if request_type == "received" else "sender_id"
+    return {side: ObjectId(user_id), "status": "pending"}
+
+def get_connection_requests_fixed(user_id: str, request_type: str = "received",
+                                  skip: int = 0, limit: int = 50) -> List[Dict]:
+    """Get a page of pending connection requests, hydrated in two batched reads"""
     try:
-        if request_type == "received":
-            query = {"receiver_id": ObjectId(user_id), "status": "pending"}
-        else:
-            query = {"sender_id": ObjectId(user_id), "status": "pending"}
+        requests = list(
+            connection_requests_collection.find(_pending_requests_query(user_id, request_type))
+            .sort("created_at", -1).skip(skip).limit(limit)
+        )
         
-        requests = list(connection_requests_collection.find(query).sort("created_at", -1))
+        # The "other" user is the sender for received requests and the receiver for sent ones
+        other_side = "sender_id" if request_type == "received" else "receiver_id"
+        users, profiles = hydrate_profiles([request[other_side] for request in requests])
         
         for request in requests:
-            # Convert ObjectIds to strings FIRST
+            other_id = str(request[other_side])
             request["id"] = str(request["_id"])
             request["sender_id"] = str(request["sender_id"])
             request["receiver_id"] = str(request["receiver_id"])
             del request["_id"]
             
-            # Get user details
-            if request_type == "received":
-                user = get_user_by_id(request["sender_id"])
-                profile = get_user_profile(request["sender_id"])
-            else:
-                user = get_user_by_id(request["receiver_id"])
-                profile = get_user_profile(request["receiver_id"])
-            
-            # Add user details safely
+            user = users.get(other_id)
             request["sender_name"] = user.get("name", "Unknown") if user else "Unknown"
             request["sender_email"] = user.get("email", "") if user else ""
-            
-            # Convert profile ObjectIds to strings if profile exists
-            if profile:
-                # Make a copy to avoid modifying the original
-                safe_profile = {}
-                for key, value in profile.items():
-                    if isinstance(value, ObjectId):
-                        safe_profile[key] = str(value)
-                    else:
-                        safe_profile[key] = value
-                request["user_profile"] = safe_profile
-            else:
-                request["user_profile"] = {}
+            request["user_profile"] = profiles.get(other_id, {})
         
         return requests
         
@@ -1006,39 +1553,21 @@ def get_connection_requests_fixed(user_id: str, request_type: str = "received")
         logging.error(f"Error getting connection requests: {e}")
         return []
 
+def count_connection_requests(user_id: str, request_type: str = "received") -> int:
+    """Count pending connection requests (served by the request listing index)"""
+    try:
+        return connection_requests_collection.count_documents(_pending_requests_query(user_id, request_type))
+    except Exception as e:
+        logging.error(f"Error counting connection requests: {e}")
+        return 0
+
 def respond_to_connection_request_fixed(request_id: str, action: str, user_id: str) -> bool:
     """Accept or reject a connection request - FIXED VERSION"""
     try:
-        request = connection_requests_collection.find_one({
-            "_id": ObjectId(request_id),
-            "receiver_id": ObjectId(user_id),
-            "status": "pending"
-        })
+        results = respond_to_connection_requests(user_id, [request_id], action)
         
-        if not request:
-            raise ValueError("Connection request not found")
-        
-        new_status = "accepted" if action == "accept" else "rejected"
-        
-        # Update request status
-        connection_requests_collection.update_one(
-            {"_id": ObjectId(request_id)},
-            {
-                "$set": {
-                    "status": new_status,
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
-        
-        # If accepted, create mutual connections
-        if action == "accept":
-            sender_id = str(request["sender_id"])
-            receiver_id = str(request["receiver_id"])
-            
-            # Create connections in both directions
-            create_connection_fixed(sender_id, receiver_id)
-            create_connection_fixed(receiver_id, sender_id)
+        if results[str(ObjectId(request_id))] == "not_found":
+            raise ValueError("Connection request not found or already processed")
         
         return True
         
@@ -1047,36 +1576,13 @@ def respond_to_connection_request_fixed(request_id: str, action: str, user_id: s
         return False
 
 def get_connection_status_fixed(user_id: str, target_user_id: str) -> str:
-    """Get connection status between two users - FIXED VERSION"""
+    """Get connection status between two users - single read of the pair state"""
     try:
-        # Check if already connected
-        connection = connections_collection.find_one({
-            "user_id": ObjectId(user_id),
-            "target_user_id": ObjectId(target_user_id),
-            "status": "connected"
-        })
-        if connection:
-            return "connected"
-        
-        # Check for pending request from user to target
-        sent_request = connection_requests_collection.find_one({
-            "sender_id": ObjectId(user_id),
-            "receiver_id": ObjectId(target_user_id),
-            "status": "pending"
-        })
-        if sent_request:
-            return "request_sent"
-        
-        # Check for pending request from target to user
-        received_request = connection_requests_collection.find_one({
-            "sender_id": ObjectId(target_user_id),
-            "receiver_id": ObjectId(user_id),
-            "status": "pending"
-        })
-        if received_request:
-            return "request_received"
-        
-        return "not_connected"
+        pair_state = pair_states_collection.find_one(
+            {"_id": pair_key(user_id, target_user_id)},
+            {"status": 1, "sender_id": 1}
+        )
+        return status_from_pair_state(pair_state, ObjectId(user_id))
         
     except Exception as e:
         logging.error(f"Error checking connection status: {e}")
@@ -1119,28 +1625,41 @@ def create_connection_fixed(user_id: str, target_user_id: str) -> str:
         logging.error(f"Error creating connection: {e}")
         raise
 
-def get_user_connections_fixed(user_id: str) -> List[str]:
+def get_user_connections_fixed(user_id: str, skip: int = 0, limit: int = 0) -> List[str]:
     """Get list of connected user IDs for a user - FIXED VERSION"""
     try:
-        connections = connections_collection.find({
-            "user_id": ObjectId(user_id),
-            "status": "connected"
-        })
+        connections = connections_collection.find(
+            {"user_id": ObjectId(user_id), "status": "connected"},
+            {"_id": 0, "target_user_id": 1}
+        ).sort("target_user_id", 1).skip(skip).limit(limit)
         return [str(conn["target_user_id"]) for conn in connections]
     except Exception as e:
         logging.error(f"Error getting connections: {e}")
         return []
 
-def get_connected_profiles_fixed(user_id: str) -> List[Dict]:
-    """Get full profile data for connected users - FIXED VERSION"""
+def count_connections(user_id: str) -> int:
+    """Count a user's connections"""
     try:
-        connected_user_ids = get_user_connections_fixed(user_id)
+        return connections_collection.count_documents({"user_id": ObjectId(user_id), "status": "connected"})
+    except Exception as e:
+        logging.error(f"Error counting connections: {e}")
+        return 0
+
+def get_connected_profiles_fixed(user_id: str, skip: int = 0, limit: int = 50) -> Tuple[List[Dict], int]:
+    """
+    Get a page of connected users' profile cards, hydrated in two batched reads.
+    Returns (cards, connection rows read); connections to deleted users have no
+    card, so the next page starts at skip + rows read, not skip + len(cards).
+    """
+    try:
+        connected_user_ids = get_user_connections_fixed(user_id, skip, limit)
+        users, profiles = hydrate_profiles(connected_user_ids)
         connected_profiles = []
         
         for target_user_id in connected_user_ids:
-            user = get_user_by_id(target_user_id)
+            user = users.get(target_user_id)
             if user:
-                profile = get_user_profile(target_user_id) or {}
+                profile = profiles.get(target_user_id, {})
                 
                 profile_data = {
                     "id": target_user_id,
@@ -1158,11 +1677,68 @@ def get_connected_profiles_fixed(user_id: str) -> List[Dict]:
                 }
                 connected_profiles.append(profile_data)
         
-        return connected_profiles
+        return connected_profiles, len(connected_user_ids)
         
     except Exception as e:
         logging.error(f"Error getting connected profiles: {e}")
-        return []
+        return [], 0
+
+# =====================
+# CONVERSATION MEMBERSHIP CACHE
+# =====================
+# conversation_id -> (expires_at, {participant_id: participant_name}).
+# Per-process; entries expire after a TTL so other workers' changes are picked up.
+# Only membership is cached: archived_count changes whenever any process
+# archives, so readers fetch it fresh.
+_conversation_cache: "OrderedDict[str, Tuple[float, Dict[str, str]]]" = OrderedDict()
+_conversation_cache_lock = threading.Lock()
+
+def _conversation_members(conversation_id: str) -> Optional[Dict[str, str]]:
+    """Participant id -> name for a conversation, served from cache when fresh"""
+    now = time.monotonic()
+    with _conversation_cache_lock:
+        cached = _conversation_cache.get(conversation_id)
+        if cached and cached[0] > now:
+            _conversation_cache.move_to_end(conversation_id)
+            record_cache_lookup("conversation_members", "hit")
+            return cached[1]
+    record_cache_lookup("conversation_members", "miss")
+
+    conversation = conversations_collection.find_one(
+        {"_id": ObjectId(conversation_id)},
+        {"participant_ids": 1, "participant_names": 1}
+    )
+    if not conversation:
+        return None
+
+    participant_ids = [str(pid) for pid in conversation.get("participant_ids", [])]
+    participant_names = conversation.get("participant_names", [])
+    members = {
+        pid: participant_names[i] if i < len(participant_names) else "Unknown"
+        for i, pid in enumerate(participant_ids)
+    }
+
+    with _conversation_cache_lock:
+        _conversation_cache[conversation_id] = (now + CONVERSATION_CACHE_TTL_SECONDS, members)
+        _conversation_cache.move_to_end(conversation_id)
+        while len(_conversation_cache) > CONVERSATION_CACHE_SIZE:
+            _conversation_cache.popitem(last=False)
+    return members
+
+def invalidate_conversation_cache(*user_ids: str) -> None:
+    """Drop cached conversations whose participants include all of the given users"""
+    wanted = set(user_ids)
+    with _conversation_cache_lock:
+        stale = [cid for cid, (_, members) in _conversation_cache.items() if wanted.issubset(members)]
+        for conversation_id in stale:
+            del _conversation_cache[conversation_id]
+
+def _write_message(message_doc: dict, summary_update: dict) -> None:
+    """Insert a message and update its conversation summary (one round trip on MongoDB 8.0+)"""
+    _write_across_collections([
+        (messages_collection, InsertOne, (message_doc,), {}),
+        (conversations_collection, UpdateOne, ({"_id": message_doc["conversation_id"]}, summary_update), {})
+    ])
 
 def create_conversation_fixed(user_id: str, target_user_id: str) -> str:
     """Create a conversation between connected users - FIXED VERSION"""
@@ -1204,46 +1780,43 @@ def create_conversation_fixed(user_id: str, target_user_id: str) -> str:
 def send_message_fixed(user_id: str, conversation_id: str, content: str) -> Dict:
     """Send a message in a conversation - FIXED VERSION"""
     try:
-        # Verify user is part of conversation
-        conversation = conversations_collection.find_one({
-            "_id": ObjectId(conversation_id),
-            "participant_ids": ObjectId(user_id)
-        })
+        # Verify user is part of conversation (names come from the same cached lookup)
+        members = _conversation_members(conversation_id)
         
-        if not conversation:
+        if not members or user_id not in members:
             raise ValueError("Conversation not found or access denied")
         
-        user = get_user_by_id(user_id)
-        
         # Create message
         message_doc = {
+            "_id": ObjectId(),
             "conversation_id": ObjectId(conversation_id),
             "sender_id": ObjectId(user_id),
-            "sender_name": user.get("name", "Unknown") if user else "Unknown",
+            "sender_name": members[user_id],
             "content": content,
             "message_type": "text",
             "timestamp": datetime.utcnow(),
             "read": False
         }
         
-        result = messages_collection.insert_one(message_doc)
-        
-        # Update conversation last message
-        conversations_collection.update_one(
-            {"_id": ObjectId(conversation_id)},
-            {
-                "$set": {
-                    "last_message": content,
-                    "last_message_time": datetime.utcnow()
-                }
+        # Update conversation last message and bump every other participant's unread counter
+        summary_update = {
+            "$set": {
+                "last_message": content,
+                "last_message_time": message_doc["timestamp"],
+                "last_sender_id": ObjectId(user_id)
+            },
+            "$inc": {
+                f"unread.{participant_id}": 1
+                for participant_id in members
+                if participant_id != user_id
             }
-        )
+        }
+        _write_message(message_doc, summary_update)
         
         # Prepare response
-        message_doc["id"] = str(result.inserted_id)
+        message_doc["id"] = str(message_doc.pop("_id"))
         message_doc["conversation_id"] = conversation_id
         message_doc["sender_id"] = user_id
-        del message_doc["_id"]
         
         return message_doc
         
@@ -1251,29 +1824,131 @@ def send_message_fixed(user_id: str, conversation_id: str, content: str) -> Dict
         logging.error(f"Error sending message: {e}")
         raise
 
+INBOX_PAGE_MAX = 100
+
+def _encode_inbox_cursor(conversation: dict) -> str:
+    return f"{conversation['last_message_time'].isoformat()}|{conversation['_id']}"
+
+def _decode_inbox_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    timestamp, conversation_id = cursor.split("|", 1)
+    return datetime.fromisoformat(timestamp), ObjectId(conversation_id)
+
+def get_user_conversations(user_id: str, cursor: Optional[str] = None, limit: int = 20) -> Dict:
+    """
+    List a user's conversations, newest activity first, using keyset pagination
+    on (last_message_time, _id). Unread counts come from the per-participant
+    counters maintained by send_message_fixed, so no messages are counted here.
+    """
+    user_oid = ObjectId(user_id)
+    limit = max(1, min(limit, INBOX_PAGE_MAX))
+
+    query = {"participant_ids": user_oid}
+    if cursor:
+        try:
+            last_time, last_id = _decode_inbox_cursor(cursor)
+        except Exception:
+            raise ValueError("Invalid cursor")
+        query["$or"] = [
+            {"last_message_time": {"$lt": last_time}},
+            {"last_message_time": last_time, "_id": {"$lt": last_id}}
+        ]
+
+    projection = {
+        "participant_ids": 1, "participant_names": 1, "last_message": 1,
+        "last_message_time": 1, "last_sender_id": 1, "created_at": 1,
+        f"unread.{user_id}": 1
+    }
+    page = list(
+        conversations_collection.find(query, projection)
+        .sort([("last_message_time", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    conversations = []
+    for conv in page:
+        conversations.append({
+            "id": str(conv["_id"]),
+            "participant_ids": [str(pid) for pid in conv.get("participant_ids", [])],
+            "participant_names": conv.get("participant_names", []),
+            "last_message": conv.get("last_message"),
+            "last_message_time": conv.get("last_message_time"),
+            "last_sender_id": str(conv["last_sender_id"]) if conv.get("last_sender_id") else None,
+            "unread_count": conv.get("unread", {}).get(user_id, 0),
+            "created_at": conv.get("created_at")
+        })
+
+    return {
+        "conversations": conversations,
+        "next_cursor": _encode_inbox_cursor(page[-1]) if has_more else None
+    }
+
+def mark_conversations_read(user_id: str, conversation_ids: List[str]) -> int:
+    """Reset the user's unread counter on several conversations in one bulk write"""
+    user_oid = ObjectId(user_id)
+    conversation_oids = list({ObjectId(cid) for cid in conversation_ids})
+    if not conversation_oids:
+        return 0
+
+    result = conversations_collection.bulk_write([
+        UpdateOne(
+            {"_id": conversation_oid, "participant_ids": user_oid, f"unread.{user_id}": {"$gt": 0}},
+            {"$set": {f"unread.{user_id}": 0}}
+        )
+        for conversation_oid in conversation_oids
+    ], ordered=False)
+
+    # Keep per-message read flags consistent for clients that render them
+    messages_collection.update_many(
+        {
+            "conversation_id": {"$in": conversation_oids},
+            "sender_id": {"$ne": user_oid},
+            "read": False
+        },
+        {"$set": {"read": True}}
+    )
+
+    return result.modified_count
+
 def get_messages_fixed(user_id: str, conversation_id: str, skip: int = 0, limit: int = 50) -> List[Dict]:
-    """Get messages from a conversation - FIXED VERSION"""
+    """Get messages from a conversation, reading the archived prefix from buckets - FIXED VERSION"""
     try:
-        # Verify user is part of conversation
-        conversation = conversations_collection.find_one({
-            "_id": ObjectId(conversation_id),
-            "participant_ids": ObjectId(user_id)
-        })
+        conversation_oid = ObjectId(conversation_id)
+        
+        # Verify user is part of conversation; the archived prefix length is read in the same
+        # lookup, never cached, since archival in any process or instance moves it
+        conversation = conversations_collection.find_one(
+            {"_id": conversation_oid, "participant_ids": ObjectId(user_id)},
+            {"archived_count": 1}
+        )
         
         if not conversation:
             raise ValueError("Conversation not found or access denied")
+        archived_count = conversation.get("archived_count", 0)
+        
+        # Positions below archived_count live in message_archives, the rest in messages
+        messages = []
+        if skip < archived_count:
+            # Sender names for the buckets come from the cached membership
+            members = _conversation_members(conversation_id) or {}
+            messages = read_archived_messages(
+                db, conversation_oid, skip, min(skip + limit, archived_count), members
+            )
         
-        # Get messages
-        messages = list(messages_collection.find(
-            {"conversation_id": ObjectId(conversation_id)}
-        ).sort("timestamp", 1).skip(skip).limit(limit))
-        
-        # Convert ObjectIds to strings
-        for message in messages:
-            message["id"] = str(message["_id"])
-            message["conversation_id"] = str(message["conversation_id"])
-            message["sender_id"] = str(message["sender_id"])
-            del message["_id"]
+        hot_limit = limit - len(messages)
+        if hot_limit > 0:
+            hot_messages = list(messages_collection.find(
+                {"conversation_id": conversation_oid}
+            ).sort("timestamp", 1).skip(max(skip - archived_count, 0)).limit(hot_limit))
+            
+            # Convert ObjectIds to strings
+            for message in hot_messages:
+                message["id"] = str(message["_id"])
+                message["conversation_id"] = str(message["conversation_id"])
+                message["sender_id"] = str(message["sender_id"])
+                del message["_id"]
+            messages.extend(hot_messages)
         
         return messages
         
@@ -1287,6 +1962,9 @@ def disconnect_users(user_id: str, target_user_id: str) -> bool:
         user_oid = ObjectId(user_id)
         target_oid = ObjectId(target_user_id)
         
+        clear_pair_state(user_id, target_user_id)
+        invalidate_conversation_cache(user_id, target_user_id)
+        
         # Remove connection from both directions
         connections_collection.delete_one({
             "user_id": user_oid,
@@ -1317,24 +1995,142 @@ def disconnect_users(user_id: str, target_user_id: str) -> bool:
 # =====================
 # UTILITY FUNCTIONS
 # =====================
-def delete_user_data(user_id: str) -> bool:
-    """Delete all user data (GDPR compliance)"""
+def delete_in_batches(collection, query: dict, batch_size: int = DELETE_BATCH_SIZE,
+                      on_batch: Optional[Callable[[int], None]] = None) -> int:
+    """Delete matching documents in _id batches so no single delete runs unbounded"""
+    deleted = 0
+    while True:
+        ids = [doc["_id"] for doc in collection.find(query, {"_id": 1}).limit(batch_size)]
+        if not ids:
+            break
+        result = collection.delete_many({"_id": {"$in": ids}})
+        deleted += result.deleted_count
+        if on_batch:
+            on_batch(result.deleted_count)
+    return deleted
+
+def _user_data_targets(user_obj_id: ObjectId) -> List[Tuple[str, object, dict]]:
+    """Every (name, collection, query) that holds data owned by or about a user"""
+    conversation_ids = [
+        conv["_id"] for conv in conversations_collection.find({"participant_ids": user_obj_id}, {"_id": 1})
+    ]
+    return [
+        ("ideas", ideas_collection, {"user_id": user_obj_id}),
+        ("roadmaps", roadmaps_collection, {"user_id": user_obj_id}),
+        ("research", research_collection, {"user_id": user_obj_id}),
+        ("team_searches", team_searches_collection, {"user_id": user_obj_id}),
+        ("profiles", profiles_collection, {"user_id": user_obj_id}),
+        ("messages", messages_collection, {
+            "$or": [{"conversation_id": {"$in": conversation_ids}}, {"sender_id": user_obj_id}]
+        }),
+        ("message_archives", message_archives_collection, {"conversation_id": {"$in": conversation_ids}}),
+        ("conversations", conversations_collection, {"_id": {"$in": conversation_ids}}),
+        ("connections", connections_collection, {
+            "$or": [{"user_id": user_obj_id}, {"target_user_id": user_obj_id}]
+        }),
+        ("connection_requests", connection_requests_collection, {
+            "$or": [{"sender_id": user_obj_id}, {"receiver_id": user_obj_id}]
+        }),
+        ("user_stats", user_stats_collection, {"_id": user_obj_id}),
+        ("pair_states", pair_states_collection, {"users": user_obj_id}),
+    ]
+
+def delete_user_data(user_id: str, on_progress: Optional[Callable[[str, int], None]] = None) -> bool:
+    """
+    Delete all user data (GDPR compliance).
+    Collections are purged in parallel, each in batches; on_progress(name, count)
+    is called after every batch. The user document goes last so a failed run
+    can simply be retried.
+    """
     try:
         user_obj_id = ObjectId(user_id)
-        
-        # Delete from all collections
-        ideas_collection.delete_many({"user_id": user_obj_id})
-        roadmaps_collection.delete_many({"user_id": user_obj_id})
-        research_collection.delete_many({"user_id": user_obj_id})
-        profiles_collection.delete_one({"user_id": user_obj_id})
-        users_collection.delete_one({"_id": user_obj_id})
-        
-        logging.info(f"Successfully deleted all data for user {user_id}")
+        targets = _user_data_targets(user_obj_id)
+
+        def purge(name, collection, query):
+            on_batch = (lambda count: on_progress(name, count)) if on_progress else None
+            return name, delete_in_batches(collection, query, on_batch=on_batch)
+
+        with ThreadPoolExecutor(max_workers=DELETE_PARALLELISM) as pool:
+            futures = [pool.submit(purge, *target) for target in targets]
+            deleted = dict(future.result() for future in futures)
+
+        invalidate_conversation_cache(user_id)
+        embedding_index.remove(user_id)
+        bump_profile_version()
+        result = users_collection.delete_one({"_id": user_obj_id})
+        if on_progress:
+            on_progress("users", result.deleted_count)
+
+        logging.info(f"Successfully deleted all data for user {user_id}: {deleted}")
         return True
     except Exception as e:
         logging.error(f"Failed to delete user data for {user_id}: {e}")
         return False
 
+# =====================
+# DATA EXPORT (streaming NDJSON)
+# =====================
+EXPORT_BATCH_SIZE = 200
+
+def _export_default(obj):
+    """JSON fallback for BSON types that show up in exported documents"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, bytes):
+        return obj.hex()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# One shared encoder: ObjectId/datetime are handled inline by `default`,
+# so documents never need a recursive pre-pass before serialization
+_export_encoder = json.JSONEncoder(default=_export_default, ensure_ascii=False, separators=(",", ":"))
+
+def _export_line(record_type: str, data) -> bytes:
+    return (_export_encoder.encode({"type": record_type, "data": data}) + "\n").encode("utf-8")
+
+def iter_user_export(user_id: str, user: Optional[dict] = None) -> Iterator[bytes]:
+    """
+    Yield all of a user's data as NDJSON lines (one record per line).
+    Each collection is read through a batched cursor, so memory stays
+    constant regardless of how much history the user has.
+    """
+    user_obj_id = ObjectId(user_id)
+    counts = {"ideas": 0, "roadmaps": 0, "research": 0}
+
+    try:
+        if user is None:
+            user = get_user_by_id(user_id) or {}
+
+        yield _export_line("user_info", {
+            "id": user_id,
+            "name": user.get("name"),
+            "email": user.get("email"),
+            "created_at": user.get("created_at")
+        })
+        yield _export_line("profile", get_user_profile(user_id))
+
+        for count_key, record_type, collection in (
+            ("ideas", "idea", ideas_collection),
+            ("roadmaps", "roadmap", roadmaps_collection),
+            ("research", "research", research_collection),
+        ):
+            cursor = collection.find({"user_id": user_obj_id}, batch_size=EXPORT_BATCH_SIZE)
+            for doc in cursor:
+                doc["id"] = doc.pop("_id")
+                counts[count_key] += 1
+                yield _export_line(record_type, doc)
+
+        yield _export_line("activity_stats", get_user_stats(user_id))
+        yield _export_line("export_complete", {
+            "counts": counts,
+            "exported_at": datetime.utcnow()
+        })
+    except Exception as e:
+        # Headers are already sent at this point, so report the failure in-band
+        logging.error(f"Data export failed for user {user_id}: {e}")
+        yield _export_line("error", {"message": "Export interrupted", "counts": counts})
+
 def convert_objectids_to_strings(obj):
     """Recursively convert ObjectIds to strings in nested dictionaries/lists"""
     if isinstance(obj, ObjectId):
@@ -0,0 +1,109 @@
+# Background user-data deletion jobs
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+from bson.objectid import ObjectId
+
+from database import db, delete_user_data
+
+deletion_jobs_collection = db["deletion_jobs"]
+
+DELETION_JOB_WORKERS = int(os.getenv("DELETION_JOB_WORKERS", "2"))
+# A "running" job older than this is assumed to belong to a dead worker
+DELETION_JOB_STALE_MINUTES = int(os.getenv("DELETION_JOB_STALE_MINUTES", "15"))
+
+ACTIVE_STATUSES = ["queued", "running"]
+
+_executor = ThreadPoolExecutor(max_workers=DELETION_JOB_WORKERS, thread_name_prefix="deletion-job")
+
+def _job_view(job: dict) -> dict:
+    """Public representation of a job document"""
+    return {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "progress": job.get("progress", {}),
+        "deleted_total": job.get("deleted_total", 0),
+        "created_at": job.get("created_at"),
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "error": job.get("error")
+    }
+
+def enqueue_user_deletion(user_id: str) -> dict:
+    """Queue a deletion job for a user, reusing any job that is already active"""
+    user_obj_id = ObjectId(user_id)
+
+    existing = deletion_jobs_collection.find_one({"user_id": user_obj_id, "status": {"$in": ACTIVE_STATUSES}})
+    if existing:
+        return _job_view(existing)
+
+    job = {
+        "user_id": user_obj_id,
+        "status": "queued",
+        "progress": {},
+        "deleted_total": 0,
+        "created_at": datetime.utcnow()
+    }
+    job["_id"] = deletion_jobs_collection.insert_one(job).inserted_id
+    _executor.submit(_run_deletion_job, job["_id"])
+
+    logging.info(f"Queued deletion job {job['_id']} for user {user_id}")
+    return _job_view(job)
+
+def _run_deletion_job(job_id: ObjectId) -> None:
+    """Claim a queued job and purge the user's data, recording progress per collection"""
+    job = deletion_jobs_collection.find_one_and_update(
+        {"_id": job_id, "status": "queued"},
+        {"$set": {"status": "running", "started_at": datetime.utcnow()}}
+    )
+    if not job:
+        return  # Claimed by another worker
+
+    def on_progress(name: str, count: int):
+        deletion_jobs_collection.update_one(
+            {"_id": job_id},
+            {"$inc": {f"progress.{name}": count, "deleted_total": count}}
+        )
+
+    try:
+        success = delete_user_data(str(job["user_id"]), on_progress=on_progress)
+    except Exception as e:
+        logging.error(f"Deletion job {job_id} crashed: {e}")
+        success = False
+
+    deletion_jobs_collection.update_one(
+        {"_id": job_id},
+        {"$set": {
+            "status": "completed" if success else "failed",
+            "error": None if success else "Deletion did not complete, retry the request",
+            "finished_at": datetime.utcnow()
+        }}
+    )
+
+def get_deletion_job(job_id: str, user_id: str) -> Optional[dict]:
+    """Get a deletion job owned by the given user"""
+    try:
+        job = deletion_jobs_collection.find_one({"_id": ObjectId(job_id), "user_id": ObjectId(user_id)})
+        return _job_view(job) if job else None
+    except Exception as e:
+        logging.error(f"Error getting deletion job {job_id}: {e}")
+        return None
+
+def resume_pending_deletion_jobs() -> int:
+    """Re-submit queued jobs and jobs orphaned by a dead worker (deletion is idempotent)"""
+    stale_before = datetime.utcnow() - timedelta(minutes=DELETION_JOB_STALE_MINUTES)
+    deletion_jobs_collection.update_many(
+        {"status": "running", "started_at": {"$lt": stale_before}},
+        {"$set": {"status": "queued"}}
+    )
+
+    resumed = 0
+    for job in deletion_jobs_collection.find({"status": "queued"}, {"_id": 1}):
+        _executor.submit(_run_deletion_job, job["_id"])
+        resumed += 1
+
+    if resumed:
+        logging.info(f"Resumed {resumed} pending deletion job(s)")
+    return resumed
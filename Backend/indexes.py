@@ -0,0 +1,205 @@
+# Index management - declares the indexes behind every hot query shape
+#
+# Run `python indexes.py --verify` against a populated database to explain()
+# each hot query and report any that fall back to a COLLSCAN.
+import logging
+import sys
+from datetime import datetime
+from typing import Dict, List, Tuple
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, errors
+
+# collection -> list of (keys, options)
+INDEX_SPECS: Dict[str, List[Tuple[list, dict]]] = {
+    "users": [
+        ([("email", ASCENDING)], {"unique": True}),
+        ([("created_at", DESCENDING)], {}),
+    ],
+    # Team-search prefilter: an $or over these match_index fields (one IXSCAN per clause)
+    "profiles": [
+        ([("user_id", ASCENDING)], {"unique": True}),
+        ([("match_index.skill_tokens", ASCENDING)], {}),
+        ([("match_index.skill_keys", ASCENDING)], {}),
+        ([("match_index.interest_tokens", ASCENDING)], {}),
+        ([("match_index.interest_keys", ASCENDING)], {}),
+        ([("match_index.experience", ASCENDING)], {}),
+        ([("match_index.experience_level", ASCENDING)], {}),
+        ([("match_index.availability", ASCENDING)], {}),
+        ([("match_index.version", ASCENDING)], {}),
+        # Embedding index sync: profiles changed since the last build
+        ([("updated_at", ASCENDING)], {}),
+    ],
+    # History listings: find({user_id}).sort(created_at, -1); recent counts use the same prefix
+    "ideas": [
+        ([("user_id", ASCENDING), ("created_at", DESCENDING)], {}),
+        ([("created_at", DESCENDING)], {}),
+    ],
+    "roadmaps": [
+        ([("user_id", ASCENDING), ("created_at", DESCENDING)], {}),
+        ([("created_at", DESCENDING)], {}),
+    ],
+    "research": [
+        ([("user_id", ASCENDING), ("created_at", DESCENDING)], {}),
+        ([("created_at", DESCENDING)], {}),
+    ],
+    "team_searches": [
+        ([("user_id", ASCENDING)], {}),
+        ([("created_at", ASCENDING)], {}),
+    ],
+    # Chat history: find({conversation_id}).sort(timestamp, 1)
+    "messages": [
+        ([("conversation_id", ASCENDING), ("timestamp", ASCENDING)], {}),
+        ([("sender_id", ASCENDING)], {}),
+    ],
+    # Archived history: buckets overlapping a position window, in order
+    "message_archives": [
+        ([("conversation_id", ASCENDING), ("start_index", ASCENDING)], {}),
+    ],
+    # Inbox: find({participant_ids}).sort(last_message_time -1, _id -1); prefix also serves pair lookups
+    "conversations": [
+        ([("participant_ids", ASCENDING), ("last_message_time", DESCENDING), ("_id", DESCENDING)], {}),
+    ],
+    # Status checks use (sender, receiver, status); listings filter one side + status and sort by created_at
+    "connection_requests": [
+        ([("sender_id", ASCENDING), ("receiver_id", ASCENDING), ("status", ASCENDING)], {}),
+        ([("receiver_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)], {}),
+        ([("sender_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)], {}),
+    ],
+    # One directional mirror per (owner, target); also serves the per-user listing
+    "connections": [
+        ([("user_id", ASCENDING), ("target_user_id", ASCENDING)], {"unique": True, "name": "connection_pair_unique"}),
+        ([("target_user_id", ASCENDING)], {}),
+    ],
+    # _id is the canonical pair key; users serves per-user cleanup
+    "pair_states": [
+        ([("users", ASCENDING)], {}),
+    ],
+    "deletion_jobs": [
+        ([("user_id", ASCENDING), ("status", ASCENDING)], {}),
+    ],
+}
+
+# Indexes created by earlier versions that are now redundant (prefix of a compound
+# index above) or wrong. connections.ticket_id_1 was a unique index on a field
+# connections never set, so every connection after the first collided on null.
+OBSOLETE_INDEXES: Dict[str, List[str]] = {
+    "roadmaps": ["user_id_1"],
+    "research": ["user_id_1"],
+    "messages": ["conversation_id_1", "timestamp_1"],
+    "conversations": ["participant_ids_1", "last_message_time_-1"],
+    "connection_requests": ["sender_id_1_receiver_id_1", "status_1", "created_at_1"],
+    "connections": [
+        "ticket_id_1",
+        "user_id_1_target_user_id_1",
+        "user_id_1_target_user_id_1_status_1",
+        "status_1",
+        "user_id_1_created_at_-1",
+    ],
+}
+
+def ensure_indexes(db) -> None:
+    """Drop obsolete indexes and create every declared one (both are idempotent)"""
+    for collection_name, index_names in OBSOLETE_INDEXES.items():
+        for index_name in index_names:
+            try:
+                db[collection_name].drop_index(index_name)
+                logging.info(f"Dropped obsolete index {collection_name}.{index_name}")
+            except errors.OperationFailure:
+                pass  # Already gone
+            except Exception as e:
+                print(f"Index drop error on {collection_name}.{index_name}: {e}")
+
+    for collection_name, specs in INDEX_SPECS.items():
+        for keys, options in specs:
+            try:
+                db[collection_name].create_index(keys, **options)
+            except Exception as e:
+                print(f"Index creation error on {collection_name} {keys}: {e}")
+
+# =====================
+# VERIFICATION
+# =====================
+_SAMPLE_ID = ObjectId()
+_OTHER_ID = ObjectId()
+
+# (name, collection, filter, sort) for every hot query shape in database.py and main.py
+HOT_QUERIES: List[Tuple[str, str, dict, list]] = [
+    ("ideas by user", "ideas", {"user_id": _SAMPLE_ID}, [("created_at", DESCENDING)]),
+    ("roadmaps by user", "roadmaps", {"user_id": _SAMPLE_ID}, [("created_at", DESCENDING)]),
+    ("research by user", "research", {"user_id": _SAMPLE_ID}, [("created_at", DESCENDING)]),
+    ("recent ideas", "ideas", {"user_id": _SAMPLE_ID, "created_at": {"$gte": datetime(2020, 1, 1)}}, []),
+    ("profile by user", "profiles", {"user_id": _SAMPLE_ID}, []),
+    ("team search prefilter", "profiles", {
+        "user_id": {"$ne": _SAMPLE_ID},
+        "$or": [
+            {"match_index.skill_tokens": {"$in": ["python", "react"]}},
+            {"match_index.skill_keys": {"$in": ["python", "react"]}},
+            {"match_index.experience": "mid"},
+            {"match_index.experience_level": {"$in": [0, 2]}},
+            {"match_index.availability": "part-time"},
+        ]
+    }, []),
+    ("profiles changed since", "profiles", {"updated_at": {"$gte": datetime(2020, 1, 1)}}, []),
+    ("user by email", "users", {"email": "someone@example.com"}, []),
+    ("messages in conversation", "messages", {"conversation_id": _SAMPLE_ID}, [("timestamp", ASCENDING)]),
+    ("conversation membership", "conversations", {"_id": _SAMPLE_ID, "participant_ids": _OTHER_ID}, []),
+    ("archived message window", "message_archives",
+     {"conversation_id": _SAMPLE_ID, "start_index": {"$lt": 100}, "end_index": {"$gt": 50}},
+     [("start_index", ASCENDING)]),
+    ("conversation inbox", "conversations", {"participant_ids": _SAMPLE_ID},
+     [("last_message_time", DESCENDING), ("_id", DESCENDING)]),
+    ("conversation by pair", "conversations", {"participant_ids": {"$all": [_SAMPLE_ID, _OTHER_ID]}}, []),
+    ("pending request by pair", "connection_requests",
+     {"sender_id": _SAMPLE_ID, "receiver_id": _OTHER_ID, "status": "pending"}, []),
+    ("received requests", "connection_requests",
+     {"receiver_id": _SAMPLE_ID, "status": "pending"}, [("created_at", DESCENDING)]),
+    ("sent requests", "connection_requests",
+     {"sender_id": _SAMPLE_ID, "status": "pending"}, [("created_at", DESCENDING)]),
+    ("connection by pair", "connections",
+     {"user_id": _SAMPLE_ID, "target_user_id": _OTHER_ID, "status": "connected"}, []),
+    ("connections of user", "connections", {"user_id": _SAMPLE_ID, "status": "connected"}, []),
+    ("pair state", "pair_states", {"_id": f"{_SAMPLE_ID}:{_OTHER_ID}"}, []),
+]
+
+def _plan_stages(plan: dict) -> List[str]:
+    """Flatten the stage names of an explain() plan tree"""
+    stages = [plan.get("stage", "")]
+    for key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(key), dict):
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+def explain_hot_queries(db) -> List[Dict]:
+    """explain() every hot query shape and report the winning plan's stages"""
+    report = []
+    for name, collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = _plan_stages(winning_plan)
+        report.append({
+            "name": name,
+            "collection": collection_name,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            "blocking_sort": "SORT" in stages
+        })
+    return report
+
+if __name__ == "__main__":
+    from database import db
+
+    if "--verify" not in sys.argv:
+        ensure_indexes(db)
+        print("Indexes ensured")
+        sys.exit(0)
+
+    failures = 0
+    for entry in explain_hot_queries(db):
+        ok = not entry["collscan"] and not entry["blocking_sort"]
+        failures += 0 if ok else 1
+        print(f"{'OK  ' if ok else 'FAIL'} {entry['name']:<28} {' <- '.join(entry['stages'])}")
+    sys.exit(1 if failures else 0)
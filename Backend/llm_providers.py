@@ -0,0 +1,341 @@
+# LLM providers - ordered OpenAI-compatible chat endpoints with failover and hedging
+#
+# Every chat completion goes through chat_completion(), which tries the
+# configured providers in priority order under one overall deadline:
+#
+#   * a provider whose circuit breaker is open is skipped; the breaker opens
+#     after LLM_BREAKER_FAILURES consecutive failures (timeouts, connection
+#     errors, 429 - honouring Retry-After - 5xx, 401/403) and lets a single
+#     trial request through once LLM_BREAKER_RESET_SECONDS have passed
+#   * when a provider fails, the next one is tried straight away
+#   * with LLM_HEDGE_AFTER_SECONDS set, if the first provider has not answered
+#     by then the request is also sent to the next provider and the first
+#     answer wins (the slower call is left to finish in the background)
+#   * nothing waits past the caller's deadline (LLM_DEADLINE_SECONDS by
+#     default); LLMUnavailableError is raised instead
+#   * each provider runs at most max_concurrency calls at once (default
+#     LLM_MAX_CONCURRENCY) on threads of its own; a provider with none free is
+#     skipped for the next one instead of queueing the attempt, so a slow
+#     provider can't hold up the others or the deadline. Being busy is load,
+#     not ill health: it leaves the breaker alone and is counted in
+#     llm_provider_saturated_total
+#
+# Providers come from LLM_PROVIDERS, a JSON list of {"name", "base_url",
+# "model", "api_key_env"?, "timeout"?, "context_tokens"?, "max_concurrency"?},
+# or by default from the environment: Groq (GROQ_BASE_URL, GROQ_API_KEY,
+# GROQ_MODEL), an optional second Groq model (GROQ_FALLBACK_MODEL) and an
+# optional local OpenAI-compatible server such as llama.cpp's llama-server
+# (LOCAL_LLM_BASE_URL, LOCAL_LLM_MODEL, LOCAL_LLM_API_KEY,
+# LOCAL_LLM_CONTEXT_TOKENS). With context_tokens set, max_tokens is capped so
+# the prompt and the completion fit the provider's context window. Token usage
+# of every response is passed to token_budget.record_usage under the caller's
+# task name, and a completion cut off by a max_tokens below
+# LLM_MAX_OUTPUT_TOKENS is requested once more with the full limit.
+#
+# Calls are blocking (requests); call chat_completion from a worker thread
+# (asyncio.to_thread) in async code.
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import (
+    CIRCUIT_BREAKER_OPEN, LLM_HEDGED_REQUESTS, LLM_PROVIDER_SATURATED, observe_upstream, record_upstream_response
+)
+from token_budget import count_message_tokens, record_usage, LLM_MAX_OUTPUT_TOKENS, LLM_MIN_OUTPUT_TOKENS
+from tracing import set_span_attribute
+
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "45"))
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "0"))  # 0 disables hedging
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+
+logger = logging.getLogger(__name__)
+
+class LLMUnavailableError(Exception):
+    """No provider produced a completion before the deadline"""
+
+class ProviderError(Exception):
+    def __init__(self, message: str, counts_as_failure: bool = True, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.counts_as_failure = counts_as_failure
+        self.retry_after = retry_after
+
+# =====================
+# CIRCUIT BREAKER
+# =====================
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_after: float = LLM_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._open_for = reset_after
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """True if a request may be sent; once the open period is over, admits one trial at a time"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self._open_for or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def release_trial(self):
+        """Give back a trial admitted by allow() that was never sent"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            was_open = self._opened_at is not None
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+        if was_open:
+            CIRCUIT_BREAKER_OPEN.set(0, provider=self.name)
+            logger.info("LLM provider %s recovered; circuit closed", self.name)
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        with self._lock:
+            self._failures += 1
+            trial_failed = self._trial_in_flight
+            self._trial_in_flight = False
+            if not trial_failed and self._failures < self.failure_threshold and retry_after is None:
+                return
+            self._opened_at = time.monotonic()
+            self._open_for = max(self.reset_after, retry_after or 0)
+        CIRCUIT_BREAKER_OPEN.set(1, provider=self.name)
+        logger.warning("LLM provider %s circuit open for %.0fs", self.name, self._open_for)
+
+# =====================
+# PROVIDERS
+# =====================
+class Provider:
+    """One OpenAI-compatible chat completions endpoint serving one model"""
+
+    def __init__(self, name: str, base_url: str, model: str, api_key: Optional[str] = None,
+                 timeout: float = 60.0, context_tokens: Optional[int] = None,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.name = name
+        self.url = f"{base_url.rstrip('/')}/chat/completions"
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+        self.context_tokens = context_tokens
+        self.breaker = CircuitBreaker(name)
+        self._session = requests.Session()
+        self._session.mount("http://", HTTPAdapter(pool_maxsize=max_concurrency))
+        self._session.mount("https://", HTTPAdapter(pool_maxsize=max_concurrency))
+        self._post = observe_upstream(name)(self._post)
+        # One slot per worker thread, so a submitted call never waits in the executor's queue
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"llm-{name}")
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def submit(self, fn, *args) -> Optional[Future]:
+        """Run fn on this provider's threads, or return None if they are all busy"""
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _post(self, payload: Dict, timeout: float) -> requests.Response:
+        set_span_attribute("llm.model", self.model)
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        response = self._session.post(self.url, headers=headers, json=payload, timeout=timeout)
+        record_upstream_response(self.name, response.status_code)
+        return response
+
+    def complete(self, messages: List[Dict], temperature: float, max_tokens: int, timeout: float,
+                 task: Optional[str] = None) -> Tuple[str, bool]:
+        """(content, whether it was cut off at max_tokens)"""
+        if self.context_tokens:
+            # Small margin: the local count is an estimate of the server's tokenizer
+            room = int((self.context_tokens - count_message_tokens(messages)) * 0.95)
+            max_tokens = max(LLM_MIN_OUTPUT_TOKENS, min(max_tokens, room))
+        payload = {"model": self.model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        settled = False
+        try:
+            completion = self._request(payload, timeout, task)
+            self.breaker.record_success()
+            settled = True
+            return completion
+        except ProviderError as e:
+            if e.counts_as_failure:
+                self.breaker.record_failure(e.retry_after)
+            else:
+                self.breaker.record_success()
+            settled = True
+            raise
+        except Exception as e:
+            raise ProviderError(f"{type(e).__name__}: {e}")
+        finally:
+            # Any other exit still counts against the provider, so a breaker trial is never left in flight
+            if not settled:
+                self.breaker.record_failure()
+
+    def _request(self, payload: Dict, timeout: float, task: Optional[str]) -> Tuple[str, bool]:
+        response = self._post(payload, timeout)
+        status = response.status_code
+        if status == 200:
+            try:
+                data = response.json()
+                choice = data["choices"][0]
+                content = choice["message"]["content"].strip()
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                raise ProviderError("malformed completion response")
+            record_usage(task, self.name, data.get("usage"), choice.get("finish_reason"), payload["max_tokens"])
+            return content, choice.get("finish_reason") == "length"
+
+        if status == 429 or status >= 500 or status in (401, 403):
+            retry_after = _retry_after(response) if status == 429 else None
+            raise ProviderError(f"HTTP {status}: {response.text[:200]}", retry_after=retry_after)
+
+        # Any other 4xx rejects this request, not the provider (e.g. prompt too long for the model)
+        raise ProviderError(f"HTTP {status}: {response.text[:200]}", counts_as_failure=False)
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+def load_providers() -> List[Provider]:
+    spec = os.getenv("LLM_PROVIDERS")
+    if spec:
+        return [
+            Provider(entry["name"], entry["base_url"], entry["model"],
+                     os.getenv(entry["api_key_env"]) if entry.get("api_key_env") else None,
+                     float(entry.get("timeout", 60)), entry.get("context_tokens"),
+                     int(entry.get("max_concurrency", LLM_MAX_CONCURRENCY)))
+            for entry in json.loads(spec)
+        ]
+
+    providers = []
+    groq_key = os.getenv("GROQ_API_KEY")
+    groq_url = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+    if groq_key:
+        providers.append(Provider("groq", groq_url, os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile"), groq_key))
+        if os.getenv("GROQ_FALLBACK_MODEL"):
+            providers.append(Provider("groq-fallback", groq_url, os.getenv("GROQ_FALLBACK_MODEL"), groq_key))
+    if os.getenv("LOCAL_LLM_BASE_URL"):
+        providers.append(Provider(
+            "local", os.getenv("LOCAL_LLM_BASE_URL"), os.getenv("LOCAL_LLM_MODEL", "local"),
+            os.getenv("LOCAL_LLM_API_KEY"), float(os.getenv("LOCAL_LLM_TIMEOUT_SECONDS", "120")),
+            int(os.getenv("LOCAL_LLM_CONTEXT_TOKENS", "4096"))
+        ))
+    return providers
+
+PROVIDERS: List[Provider] = load_providers()
+
+def llm_configured() -> bool:
+    return bool(PROVIDERS)
+
+def provider_status() -> List[Dict]:
+    return [{"name": p.name, "model": p.model, "circuit": "open" if p.breaker.is_open else "closed"} for p in PROVIDERS]
+
+# =====================
+# COMPLETIONS
+# =====================
+def chat_completion(messages: List[Dict], temperature: float = 0.3, max_tokens: int = 1000,
+                    deadline: float = LLM_DEADLINE_SECONDS,
+                    hedge_after: Optional[float] = LLM_HEDGE_AFTER_SECONDS, task: Optional[str] = None) -> str:
+    """
+    Text of the first successful completion across the providers, within
+    `deadline` seconds. `task` names the call for token usage tracking. A
+    completion truncated at a budgeted max_tokens (see token_budget) is asked
+    for again with LLM_MAX_OUTPUT_TOKENS in the time that is left.
+    """
+    deadline_at = time.monotonic() + deadline
+    candidates = iter(PROVIDERS)
+    pending = {}
+    errors: List[str] = []
+
+    def launch() -> Optional[Provider]:
+        for provider in candidates:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                return None
+            if not provider.breaker.allow():
+                errors.append(f"{provider.name}: circuit open")
+                continue
+            # Each attempt runs in its own copy of the context so it is traced under this request
+            future = provider.submit(
+                contextvars.copy_context().run,
+                provider.complete, messages, temperature, max_tokens, min(provider.timeout, remaining), task
+            )
+            if future is None:
+                provider.breaker.release_trial()
+                LLM_PROVIDER_SATURATED.inc(provider=provider.name)
+                errors.append(f"{provider.name}: at max concurrency")
+                continue
+            pending[future] = provider
+            return provider
+        return None
+
+    if launch() is None:
+        raise LLMUnavailableError(f"No LLM provider available ({'; '.join(errors) or 'none configured'})")
+    hedge_at = time.monotonic() + hedge_after if hedge_after else None
+
+    while pending:
+        now = time.monotonic()
+        if now >= deadline_at:
+            break
+        wake_at = deadline_at if hedge_at is None else min(deadline_at, hedge_at)
+        done, _ = wait(list(pending), timeout=wake_at - now, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            provider = pending.pop(future)
+            try:
+                content, truncated = future.result()
+            except ProviderError as e:
+                errors.append(f"{provider.name}: {e}")
+                continue
+            set_span_attribute("llm.provider", provider.name)
+            if truncated and max_tokens < LLM_MAX_OUTPUT_TOKENS:
+                logger.info("LLM %s completion hit max_tokens=%d; retrying with %d",
+                            task or "other", max_tokens, LLM_MAX_OUTPUT_TOKENS)
+                try:
+                    return chat_completion(messages, temperature, LLM_MAX_OUTPUT_TOKENS,
+                                           deadline_at - time.monotonic(), hedge_after, task)
+                except LLMUnavailableError as e:
+                    logger.warning("LLM %s retry with the full limit failed, using the truncated completion: %s",
+                                   task or "other", e)
+            return content
+
+        if hedge_at is not None and time.monotonic() >= hedge_at:
+            hedge_at = None
+            hedge = launch()
+            if hedge is not None:
+                LLM_HEDGED_REQUESTS.inc(provider=hedge.name)
+                logger.debug("Hedging LLM request to %s after %.1fs", hedge.name, hedge_after)
+        elif not pending:
+            launch()
+
+    if pending:
+        errors.append(f"deadline of {deadline:.0f}s exceeded waiting on {', '.join(p.name for p in pending.values())}")
+    raise LLMUnavailableError(f"LLM request failed ({'; '.join(errors)})")
@@ -1,10 +1,10 @@
-from fastapi import FastAPI, HTTPException, status, Depends
+from fastapi import FastAPI, HTTPException, status, Depends, Header, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr, Field
 import os
 import jwt
-import requests
 import asyncio
 import json
 import re
@@ -13,15 +13,15 @@ import uuid
 import httpx
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any, Set
+from typing import List, Optional, Dict, Any, Set, Tuple
 from pymongo import errors
 from bson import ObjectId
 from dotenv import load_dotenv
 from datetime import datetime
 import uuid
-import requests
 from collections import defaultdict
 import time
+import zlib
 
 # CORRECT IMPORTS FOR main.py (line ~25)
 # Replace your existing database import with this:
@@ -38,6 +38,7 @@ from database import (
     conversations_collection,
     messages_collection,
     db,
+    client,
     
     # Auth functions
     hash_password, 
@@ -51,6 +52,7 @@ from database import (
     get_user_activity, 
     get_user_stats, 
     delete_user_data,
+    iter_user_export,
     
     # Idea functions
     save_idea_validation, 
@@ -64,6 +66,17 @@ from database import (
     save_research, 
     get_user_research_history,
     
+    # Team Finder - Search
+    hydrate_profiles,
+    PROFILE_CARD_FIELDS,
+    team_search_prefilter,
+    team_search_cache_key,
+    current_profile_version,
+    get_cached_team_search,
+    cache_team_search,
+    backfill_profile_match_index,
+    PROFILE_MATCH_INDEX_MIGRATION,
+    
     # Team Finder - Connection Request Functions (use _fixed versions)
     get_connection_requests_fixed as get_connection_requests, 
     respond_to_connection_request_fixed as respond_to_connection_request,
@@ -71,8 +84,21 @@ from database import (
     
     # Team Finder - Connection Management (use _fixed versions)
     get_connected_profiles_fixed as get_connected_profiles,
+    count_connection_requests,
+    count_connections,
+    get_user_conversations,
+    mark_conversations_read,
     disconnect_users,
     
+    # Team Finder - Pair state (canonical relationship document)
+    create_connection_request_fixed,
+    respond_to_connection_requests,
+    get_connection_statuses_batch,
+    clear_pair_state,
+    backfill_pair_states,
+    dedupe_connections,
+    run_migration_once,
+    
     # Team Finder - Chat Functions (use _fixed versions)
     create_conversation_fixed as create_conversation, 
     send_message_fixed as send_message, 
@@ -82,6 +108,36 @@ from database import (
     ObjectId
 )
 
+from deletion_jobs import (
+    enqueue_user_deletion,
+    get_deletion_job,
+    resume_pending_deletion_jobs
+)
+from message_archive import archive_old_messages, MESSAGE_ARCHIVE_INTERVAL_HOURS
+from matching import RankingEngine, page_after
+from tracing import (
+    span,
+    start_request_span,
+    finish_request_span,
+    traceparent_for,
+)
+from structured_logging import configure_logging, start_request_log_sampling
+from llm_providers import chat_completion, llm_configured, provider_status, LLMUnavailableError
+from token_budget import compact_prompt, output_budget, roadmap_guidance, roadmap_task
+from metrics import (
+    observe_upstream,
+    record_upstream_response,
+    render_metrics,
+    start_request_db_count,
+    monitor_event_loop_lag,
+    HTTP_REQUEST_DURATION,
+    DB_OPERATIONS_PER_REQUEST,
+    RATE_LIMIT_WAIT,
+)
+from profile_embeddings import (
+    embedding_index, build_index, embed, EMBEDDING_REBUILD_INTERVAL_HOURS, EMBEDDING_SYNC_SECONDS
+)
+
 # NOTE: create_connection_request is NOT imported because we define 
 # create_connection_request_api inline in main.py with better error handling
 from typing import List, Optional, Dict, Any
@@ -105,9 +161,12 @@ JWT_SECRET = os.environ.get("JWT_SECRET", "fallback_secret")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 SEMANTIC_SCHOLAR_API_KEY = os.getenv("SEMANTIC_SCHOLAR_API_KEY")
-SEMANTIC_SCHOLAR_API = "https://api.semanticscholar.org/graph/v1/paper/search"
-ARXIV_API = "https://export.arxiv.org/api/query"
-CROSSREF_API = "https://api.crossref.org/works"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Overridable so benchmarks/mock_academic.py can stand in for the real services
+SEMANTIC_SCHOLAR_API = os.getenv("SEMANTIC_SCHOLAR_API", "https://api.semanticscholar.org/graph/v1/paper/search")
+ARXIV_API = os.getenv("ARXIV_API", "https://export.arxiv.org/api/query")
+CROSSREF_API = os.getenv("CROSSREF_API", "https://api.crossref.org/works")
+SEMANTIC_SCHOLAR_MIN_INTERVAL_SECONDS = float(os.getenv("SEMANTIC_SCHOLAR_MIN_INTERVAL_SECONDS", "1.0"))
 
 # Collections
 team_searches_collection = db["team_searches"]
@@ -152,11 +211,46 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"],
 )
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """
+    Root tracing span, latency and MongoDB operation count per route (the route
+    template, not the raw path), plus the request's log sampling decision. The
+    trace id is returned as X-Request-ID.
+    """
+    db_ops = start_request_db_count()
+    root = start_request_span(
+        f"{request.method} {request.url.path}", request.headers.get("traceparent"),
+        **{"http.method": request.method, "http.target": request.url.path}
+    )
+    status_code = 500
+    start_request_log_sampling(request.url.path, root.trace.trace_id)
+    try:
+        with root:
+            response = await call_next(request)
+            status_code = response.status_code
+        response.headers["X-Request-ID"] = root.trace.trace_id
+        response.headers["traceparent"] = traceparent_for(root)
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        root.name = f"{request.method} {route_path}"
+        root.set_attribute("http.route", route_path)
+        root.set_attribute("http.status_code", status_code)
+        root.set_attribute("db.operations", db_ops[0])
+        HTTP_REQUEST_DURATION.observe(
+            root.duration_ms / 1000, method=request.method, route=route_path, status=status_code
+        )
+        DB_OPERATIONS_PER_REQUEST.observe(db_ops[0], route=route_path)
+        finish_request_span(root)
+
 # Security - auto_error=False allows optional authentication
 security = HTTPBearer(auto_error=False)
 
 # Setup logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # ==========================================
@@ -292,6 +386,12 @@ class TeamSearchInput(BaseModel):
     location: Optional[str] = None
     interests: List[str] = []
 
+class TeamRecommendationInput(BaseModel):
+    required_skills: List[str] = []
+    interests: List[str] = []
+    current_role: Optional[str] = None
+    limit: int = Field(20, ge=1, le=100)
+
 class ConnectionRequestInput(BaseModel):
     receiver_id: str
     message: str = ""
@@ -299,10 +399,20 @@ class ConnectionRequestInput(BaseModel):
 class ConnectionResponseInput(BaseModel):
     action: str  # "accept" or "reject"
 
+class ConnectionBatchResponseInput(BaseModel):
+    request_ids: List[str] = Field(..., min_length=1, max_length=500)
+    action: str  # "accept" or "reject"
+
+class ConnectionStatusBatchInput(BaseModel):
+    target_user_ids: List[str] = Field(..., max_length=200)
+
 class MessageInput(BaseModel):
     conversation_id: str
     content: str
 
+class MarkReadInput(BaseModel):
+    conversation_ids: List[str] = Field(..., max_length=200)
+
 
 
 
@@ -330,6 +440,23 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    """Get the authenticated user id from the token alone (no user lookup)"""
+    if not credentials or not credentials.credentials:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    try:
+        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    user_id = payload.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user_id
+
 def get_optional_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Get current user if authenticated, otherwise return None"""
     if not credentials or not credentials.credentials:
@@ -436,6 +563,7 @@ def is_harmful_content(text: str) -> bool:
     return False
 # Add this function after the is_harmful_content function (around line 370)
 
+@observe_upstream("llm")
 def call_groq_roadmap_enhanced(prompt: str, timeframe: str) -> dict:
     """Enhanced roadmap generation with content filtering"""
     
@@ -453,18 +581,12 @@ def call_groq_roadmap_enhanced(prompt: str, timeframe: str) -> dict:
             detail="Please provide a more detailed description (at least 30 characters) for accurate roadmap generation."
         )
     
-    if not GROQ_API_KEY:
+    if not llm_configured():
         raise HTTPException(
             status_code=500, 
-            detail="GROQ_API_KEY environment variable is not set."
+            detail="No LLM provider configured (set GROQ_API_KEY or LOCAL_LLM_BASE_URL)."
         )
 
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
     system_prompt = """You are an AI Startup Roadmap Generator for "Startup GPS". 
 Your role is to create detailed, actionable roadmaps for startup ideas based on the user's input and timeframe.
 
@@ -489,12 +611,7 @@ Your role is to create detailed, actionable roadmaps for startup ideas based on
    - Technically sound
    - Business-focused
    - Adaptable to the specific industry/domain
-
-5. Timeframe guidance:
-   - 3 months: 3 phases, focus on MVP and validation
-   - 6 months: 4 phases, include scaling preparation
-   - 1 year: 5 phases, comprehensive growth strategy
-   - 2 years: 6 phases, long-term vision and expansion
+   - Split into the number of phases given with the timeframe
 
 ### Response Format (JSON):
 {
@@ -515,29 +632,19 @@ Your role is to create detailed, actionable roadmaps for startup ideas based on
 
 Provide ONLY the JSON response with no additional text."""
 
-    user_prompt = f"Create a detailed roadmap for this startup idea: {prompt}\nTimeframe: {timeframe}"
+    user_prompt = (
+        f"Create a detailed roadmap for this startup idea: {prompt}\n"
+        f"Timeframe: {timeframe} ({roadmap_guidance(timeframe)})"
+    )
 
-    payload = {
-        "model": "llama-3.3-70b-versatile",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        "temperature": 0.4,
-        "max_tokens": 4000
-    }
+    messages = [
+        {"role": "system", "content": compact_prompt(system_prompt)},
+        {"role": "user", "content": user_prompt}
+    ]
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=60)
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code, 
-                detail=f"GROQ API error: {response.text}"
-            )
-
-        data = response.json()
-        ai_text = data["choices"][0]["message"]["content"].strip()
+        task = roadmap_task(timeframe)
+        ai_text = chat_completion(messages, temperature=0.4, max_tokens=output_budget(task), task=task)
         
         # Clean JSON response
         if ai_text.startswith("```json"):
@@ -553,6 +660,9 @@ Provide ONLY the JSON response with no additional text."""
         except json.JSONDecodeError:
             return parse_roadmap_fallback(ai_text, timeframe)
             
+    except LLMUnavailableError as e:
+        logger.error("Roadmap generation failed: %s", e)
+        raise HTTPException(status_code=503, detail="Roadmap service is temporarily unavailable, please try again.")
     except Exception as e:
         raise HTTPException(
             status_code=500, 
@@ -664,6 +774,7 @@ def is_valid_startup_idea(text: str) -> tuple[bool, str]:
     return True, "Valid startup idea"
 
 
+@observe_upstream("llm")
 def call_groq_validation_enhanced(prompt: str) -> dict:
     """Enhanced validation with STRICT pre-filtering"""
     
@@ -691,14 +802,8 @@ def call_groq_validation_enhanced(prompt: str) -> dict:
         )
     
     # ===== STEP 4: Proceed with AI validation =====
-    if not GROQ_API_KEY:
-        raise HTTPException(status_code=500, detail="GROQ_API_KEY not configured")
-
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    if not llm_configured():
+        raise HTTPException(status_code=500, detail="No LLM provider configured")
 
     system_prompt = """You are an expert startup validator with 15+ years of experience.
 
@@ -712,25 +817,7 @@ If the input is:
 - Anything illegal or harmful
 
 Return this JSON with score 15:
-{
-  "overall_score": 15,
-  "scores": {"feasibility": 15, "market_demand": 15, "uniqueness": 15, "strength": 15, "risk_factors": 95},
-  "analysis": {
-    "verdict": "This does not appear to be a business idea. Please describe a product or service you want to create for customers.",
-    "feasibility": "Cannot assess - not a business concept",
-    "market_demand": "Cannot assess - not a business concept",
-    "uniqueness": "Cannot assess - not a business concept",
-    "strength": "Cannot assess - not a business concept",
-    "risk_factors": "Invalid input - not a business idea",
-    "risk_mitigation": "Please provide a legitimate business concept",
-    "existing_competitors": "Not applicable"
-  },
-  "suggestions": {
-    "critical": ["Describe what product/service you want to create", "Identify your target customers", "Explain what problem you're solving"],
-    "recommended": ["Research similar businesses in your target market", "Define your unique value proposition"],
-    "optional": ["Consider creating a business plan", "Validate your idea with potential customers"]
-  }
-}
+{"overall_score":15,"scores":{"feasibility":15,"market_demand":15,"uniqueness":15,"strength":15,"risk_factors":95},"analysis":{"verdict":"This does not appear to be a business idea. Please describe a product or service you want to create for customers.","feasibility":"Cannot assess - not a business concept","market_demand":"Cannot assess - not a business concept","uniqueness":"Cannot assess - not a business concept","strength":"Cannot assess - not a business concept","risk_factors":"Invalid input - not a business idea","risk_mitigation":"Please provide a legitimate business concept","existing_competitors":"Not applicable"},"suggestions":{"critical":["Describe what product/service you want to create","Identify your target customers","Explain what problem you're solving"],"recommended":["Research similar businesses in your target market","Define your unique value proposition"],"optional":["Consider creating a business plan","Validate your idea with potential customers"]}}
 
 ### FOR REAL STARTUP IDEAS:
 
@@ -778,24 +865,13 @@ First: Is this actually a BUSINESS IDEA (product/service for customers)?
 If NO → return score 15 with explanation
 If YES → analyze thoroughly with realistic scoring"""
 
-    payload = {
-        "model": "llama-3.3-70b-versatile",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        "temperature": 0.3,
-        "max_tokens": 4000
-    }
+    messages = [
+        {"role": "system", "content": compact_prompt(system_prompt)},
+        {"role": "user", "content": user_prompt}
+    ]
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=60)
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Validation service error")
-
-        data = response.json()
-        ai_text = data["choices"][0]["message"]["content"].strip()
+        ai_text = chat_completion(messages, temperature=0.3, max_tokens=output_budget("validation"), task="validation")
         
         # Clean and parse
         if ai_text.startswith("```json"):
@@ -823,6 +899,9 @@ If YES → analyze thoroughly with realistic scoring"""
         logger.info(f"✅ Validation complete - Score: {overall_score}")
         return result
         
+    except LLMUnavailableError as e:
+        logger.error("Validation failed: %s", e)
+        raise HTTPException(status_code=503, detail="Validation service is temporarily unavailable, please try again.")
     except Exception as e:
         logger.error(f"Validation error: {e}")
         raise HTTPException(status_code=500, detail=f"Validation failed: {str(e)}")
@@ -920,21 +999,16 @@ def calculate_realistic_overall_score(scores: Dict[str, int], prompt: str) -> in
     
     # Final bounds
     return max(15, min(100, overall_score))
+@observe_upstream("llm")
 def call_groq_chat_with_idea(message: str, idea_context: str, session_id: str) -> str:
     """Enhanced chat function for idea-specific conversations"""
     
-    if not GROQ_API_KEY:
+    if not llm_configured():
         raise HTTPException(
             status_code=500,
-            detail="GROQ API not configured"
+            detail="Chat service not configured"
         )
     
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
     system_prompt = f"""You are an expert AI startup advisor specifically helping with this startup idea:
 
 STARTUP IDEA: {idea_context}
@@ -957,28 +1031,20 @@ Guidelines:
 Keep responses conversational but informative, around 2-4 paragraphs maximum.
 """
 
-    payload = {
-        "model": "llama-3.3-70b-versatile",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": message}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 1000
-    }
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": message}
+    ]
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Chat service temporarily unavailable"
-            )
-        
-        data = response.json()
-        return data["choices"][0]["message"]["content"].strip()
+        return chat_completion(messages, temperature=0.7, max_tokens=output_budget("chat"), deadline=30, task="chat")
         
+    except LLMUnavailableError as e:
+        logger.error("Chat error: %s", e)
+        raise HTTPException(
+            status_code=503,
+            detail="Chat service temporarily unavailable"
+        )
     except Exception as e:
         logger.error(f"Chat error: {e}")
         raise HTTPException(
@@ -1271,7 +1337,7 @@ async def validate_idea_enhanced(idea: IdeaInput, current_user=Depends(get_optio
     
     try:
         # Get AI validation with enhanced features
-        ai_result = call_groq_validation_enhanced(idea.prompt)
+        ai_result = await asyncio.to_thread(call_groq_validation_enhanced, idea.prompt)
         logger.info(f"✅ AI validation complete - Score: {ai_result['overall_score']}")
         
         # Structure the response
@@ -1380,7 +1446,7 @@ async def chat_with_idea(
             raise HTTPException(status_code=400, detail="Message too long (max 1000 characters)")
         
         # Get AI response
-        ai_response = call_groq_chat_with_idea(message, idea_context, session_id)
+        ai_response = await asyncio.to_thread(call_groq_chat_with_idea, message, idea_context, session_id)
         
         return {
             "response": ai_response,
@@ -1523,20 +1589,15 @@ def parse_roadmap_fallback(text: str, timeframe: str) -> dict:
         "phases": phases
     }
 
+@observe_upstream("llm")
 def call_groq_roadmap(prompt: str, timeframe: str) -> dict:
     """Generate a detailed roadmap using GROQ API"""
-    if not GROQ_API_KEY:
+    if not llm_configured():
         raise HTTPException(
             status_code=500, 
-            detail="GROQ_API_KEY environment variable is not set."
+            detail="No LLM provider configured (set GROQ_API_KEY or LOCAL_LLM_BASE_URL)."
         )
 
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
     system_prompt = """You are an AI Startup Roadmap Generator for "Startup GPS". 
 Your role is to create detailed, actionable roadmaps for startup ideas based on the user's input and timeframe.
 
@@ -1561,12 +1622,7 @@ Your role is to create detailed, actionable roadmaps for startup ideas based on
    - Technically sound
    - Business-focused
    - Adaptable to the specific industry/domain
-
-5. Timeframe guidance:
-   - 3 months: 3 phases, focus on MVP and validation
-   - 6 months: 4 phases, include scaling preparation
-   - 1 year: 5 phases, comprehensive growth strategy
-   - 2 years: 6 phases, long-term vision and expansion
+   - Split into the number of phases given with the timeframe
 
 ### Response Format (JSON):
 {
@@ -1587,29 +1643,19 @@ Your role is to create detailed, actionable roadmaps for startup ideas based on
 
 Provide ONLY the JSON response with no additional text."""
 
-    user_prompt = f"Create a detailed roadmap for this startup idea: {prompt}\nTimeframe: {timeframe}"
+    user_prompt = (
+        f"Create a detailed roadmap for this startup idea: {prompt}\n"
+        f"Timeframe: {timeframe} ({roadmap_guidance(timeframe)})"
+    )
 
-    payload = {
-        "model": "llama-3.3-70b-versatile",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        "temperature": 0.4,
-        "max_tokens": 4000
-    }
+    messages = [
+        {"role": "system", "content": compact_prompt(system_prompt)},
+        {"role": "user", "content": user_prompt}
+    ]
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=60)
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code, 
-                detail=f"GROQ API error: {response.text}"
-            )
-
-        data = response.json()
-        ai_text = data["choices"][0]["message"]["content"].strip()
+        task = roadmap_task(timeframe)
+        ai_text = chat_completion(messages, temperature=0.4, max_tokens=output_budget(task), task=task)
         
         # Clean JSON response
         if ai_text.startswith("```json"):
@@ -1625,6 +1671,9 @@ Provide ONLY the JSON response with no additional text."""
         except json.JSONDecodeError:
             return parse_roadmap_fallback(ai_text, timeframe)
             
+    except LLMUnavailableError as e:
+        logger.error("Roadmap generation failed: %s", e)
+        raise HTTPException(status_code=503, detail="Roadmap service is temporarily unavailable, please try again.")
     except Exception as e:
         raise HTTPException(
             status_code=500, 
@@ -1635,45 +1684,36 @@ Provide ONLY the JSON response with no additional text."""
 # RESEARCH PAPER FUNCTIONALITY  
 # ==========================================
 
+@observe_upstream("llm")
 def generate_search_terms(idea: str) -> List[str]:
     """Generate search terms from the startup idea"""
-    if not GROQ_API_KEY:
+    if not llm_configured():
         words = re.findall(r'\b\w{3,}\b', idea.lower())
         stop_words = {'the', 'and', 'for', 'with', 'that', 'this', 'your', 'have', 'from'}
         filtered_words = [word for word in words if word not in stop_words]
         return filtered_words[:5] if filtered_words else ["startup", "technology", "innovation"]
     
-    # Use Groq API for better term extraction
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    # Use the LLM for better term extraction
     
     prompt = f"""Extract 3-5 precise technical and academic search terms from this startup idea: {idea}
     Focus on terms that would be effective for searching academic databases.
     Return ONLY the terms separated by commas, no explanations."""
     
-    payload = {
-        "model": "llama-3.3-70b-versatile",
-        "messages": [
-            {"role": "system", "content": "You are an expert research assistant. Extract precise academic search terms."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.1,
-        "max_tokens": 50
-    }
+    messages = [
+        {"role": "system", "content": "You are an expert research assistant. Extract precise academic search terms."},
+        {"role": "user", "content": prompt}
+    ]
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=15)
-        if response.status_code == 200:
-            content = response.json()["choices"][0]["message"]["content"].strip()
-            terms = [term.strip().strip('"').strip("'") for term in content.split(",")]
-            clean_terms = [term for term in terms if term and len(term) > 2 and not term.isdigit()]
-            if clean_terms:
-                return clean_terms[:5]
+        content = chat_completion(
+            messages, temperature=0.1, max_tokens=output_budget("search_terms"), deadline=15, task="search_terms"
+        )
+        terms = [term.strip().strip('"').strip("'") for term in content.split(",")]
+        clean_terms = [term for term in terms if term and len(term) > 2 and not term.isdigit()]
+        if clean_terms:
+            return clean_terms[:5]
     except Exception as e:
-        logger.warning(f"Error generating search terms with Groq: {e}")
+        logger.warning("Error generating search terms: %s", e)
     
     # Fallback
     words = re.findall(r'\b\w{3,}\b', idea.lower())
@@ -1682,7 +1722,56 @@ def generate_search_terms(idea: str) -> List[str]:
     return filtered_words[:5] if filtered_words else ["startup", "technology", "innovation"]
 
 # Replace fetch_semantic_scholar function
-async def fetch_semantic_scholar(search_terms: List[str], max_results: int) -> List[ResearchPaper]:
+def parse_semantic_scholar_response(data: dict) -> List[ResearchPaper]:
+    """Helper to parse a Semantic Scholar search response into ResearchPaper objects"""
+    papers = []
+    for item in data.get("data", []):
+        try:
+            title = item.get("title", "").strip()
+            if not title or len(title) < 10:
+                continue
+            
+            authors = [author.get("name", "") for author in item.get("authors", [])]
+            if not authors:
+                authors = ["Unknown"]
+            
+            abstract = item.get("abstract", "")
+            if not abstract or abstract == "null":
+                abstract = "No abstract available"
+            elif len(abstract) > 500:
+                abstract = abstract[:497] + "..."
+            
+            pub_year = item.get("year")
+            if not pub_year and item.get("publicationDate"):
+                try:
+                    pub_year = item["publicationDate"][:4]
+                except:
+                    pub_year = ""
+            pub_year = str(pub_year) if pub_year else ""
+            
+            url = item.get("url", "")
+            if not url and item.get("externalIds", {}).get("DOI"):
+                url = f"https://doi.org/{item['externalIds']['DOI']}"
+            
+            papers.append(ResearchPaper(
+                title=title,
+                authors=authors,
+                abstract=abstract,
+                published_date=pub_year,
+                source="Semantic Scholar",
+                url=url,
+                doi=item.get("externalIds", {}).get("DOI")
+            ))
+            
+        except Exception as e:
+            logger.warning(f"Error processing Semantic Scholar paper: {e}")
+            continue
+    
+    return papers
+
+@observe_upstream("semantic_scholar")
+async def fetch_semantic_scholar(search_terms: List[str], max_results: int,
+                                 timings: Optional[Dict[str, float]] = None) -> List[ResearchPaper]:
     """
     Fetch papers from Semantic Scholar with rate limit protection
     Rate limit: 1 request per second
@@ -1691,7 +1780,6 @@ async def fetch_semantic_scholar(search_terms: List[str], max_results: int) -> L
     
     try:
         query = " ".join(search_terms[:3])
-        papers = []
         
         params = {
             "query": query,
@@ -1704,71 +1792,31 @@ async def fetch_semantic_scholar(search_terms: List[str], max_results: int) -> L
         headers = {"User-Agent": "Research-Advisor-API/1.0"}
         if SEMANTIC_SCHOLAR_API_KEY:
             headers["x-api-key"] = SEMANTIC_SCHOLAR_API_KEY
-            logger.info("✅ Using Semantic Scholar API key")
-        else:
-            logger.warning("⚠️ No Semantic Scholar API key - using unauthenticated access")
 
         # Rate limiting: Ensure at least 1 second between requests
         async with _ss_request_lock:
             current_time = time.time()
             time_since_last_request = current_time - _ss_last_request_time
             
-            if time_since_last_request < 1.0:
-                wait_time = 1.0 - time_since_last_request
-                logger.info(f"⏱️ Rate limiting: waiting {wait_time:.2f}s before Semantic Scholar request")
+            wait_time = max(0.0, SEMANTIC_SCHOLAR_MIN_INTERVAL_SECONDS - time_since_last_request)
+            RATE_LIMIT_WAIT.observe(wait_time, limiter="semantic_scholar")
+            if wait_time > 0:
+                logger.debug("Rate limiting: waiting %.2fs before Semantic Scholar request", wait_time)
                 await asyncio.sleep(wait_time)
             
             # Make the request
             async with httpx.AsyncClient(timeout=30.0) as client:
                 response = await client.get(SEMANTIC_SCHOLAR_API, params=params, headers=headers)
+                record_upstream_response("semantic_scholar", response.status_code)
                 _ss_last_request_time = time.time()
             
             if response.status_code == 200:
-                data = response.json()
-                
-                for item in data.get("data", []):
-                    try:
-                        title = item.get("title", "").strip()
-                        if not title or len(title) < 10:
-                            continue
-                        
-                        authors = [author.get("name", "") for author in item.get("authors", [])]
-                        if not authors:
-                            authors = ["Unknown"]
-                        
-                        abstract = item.get("abstract", "")
-                        if not abstract or abstract == "null":
-                            abstract = "No abstract available"
-                        elif len(abstract) > 500:
-                            abstract = abstract[:497] + "..."
-                        
-                        pub_year = item.get("year")
-                        if not pub_year and item.get("publicationDate"):
-                            try:
-                                pub_year = item["publicationDate"][:4]
-                            except:
-                                pub_year = ""
-                        pub_year = str(pub_year) if pub_year else ""
-                        
-                        url = item.get("url", "")
-                        if not url and item.get("externalIds", {}).get("DOI"):
-                            url = f"https://doi.org/{item['externalIds']['DOI']}"
-                        
-                        papers.append(ResearchPaper(
-                            title=title,
-                            authors=authors,
-                            abstract=abstract,
-                            published_date=pub_year,
-                            source="Semantic Scholar",
-                            url=url,
-                            doi=item.get("externalIds", {}).get("DOI")
-                        ))
-                        
-                    except Exception as e:
-                        logger.warning(f"Error processing Semantic Scholar paper: {e}")
-                        continue
+                with span("research.parse", **{"research.source": "semantic_scholar"}) as parse_span:
+                    papers = parse_semantic_scholar_response(response.json())
+                if timings is not None:
+                    timings["parse_semantic_scholar"] = parse_span.duration_ms
                 
-                logger.info(f"Semantic Scholar: {len(papers)} papers fetched")
+                logger.debug("Semantic Scholar: %d papers fetched", len(papers))
                 return papers
             
             elif response.status_code == 429:
@@ -1776,7 +1824,7 @@ async def fetch_semantic_scholar(search_terms: List[str], max_results: int) -> L
                 return []
             
             else:
-                logger.warning(f"Semantic Scholar error {response.status_code}: {response.text[:200]}")
+                logger.warning("Semantic Scholar error %d: %.200s", response.status_code, response.text)
                 return []
             
     except Exception as e:
@@ -1784,7 +1832,9 @@ async def fetch_semantic_scholar(search_terms: List[str], max_results: int) -> L
         return []
 
 
-async def fetch_arxiv(search_terms: List[str], max_results: int) -> List[ResearchPaper]:
+@observe_upstream("arxiv")
+async def fetch_arxiv(search_terms: List[str], max_results: int,
+                      timings: Optional[Dict[str, float]] = None) -> List[ResearchPaper]:
     """Fetch papers from arXiv - improved query"""
     try:
         if not search_terms:
@@ -1811,13 +1861,17 @@ async def fetch_arxiv(search_terms: List[str], max_results: int) -> List[Researc
 
         async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
             response = await client.get(ARXIV_API, params=params, headers=headers)
+            record_upstream_response("arxiv", response.status_code)
 
             if response.status_code != 200:
-                logger.warning(f"arXiv error {response.status_code}")
+                logger.warning("arXiv error %d", response.status_code)
                 return []
 
-            papers = parse_arxiv_response(response.text, max_results * 2)
-            logger.info(f"arXiv: {len(papers)} papers fetched")
+            with span("research.parse", **{"research.source": "arxiv"}) as parse_span:
+                papers = parse_arxiv_response(response.text, max_results * 2)
+            if timings is not None:
+                timings["parse_arxiv"] = parse_span.duration_ms
+            logger.debug("arXiv: %d papers fetched", len(papers))
             return papers
 
     except Exception as e:
@@ -1884,7 +1938,62 @@ def parse_arxiv_response(xml_text: str, max_results: int) -> List[ResearchPaper]
     except Exception as e:
         logger.error(f"Error parsing arXiv response: {e}")
         return []
-async def fetch_crossref(search_terms: List[str], max_results: int) -> List[ResearchPaper]:
+def parse_crossref_response(data: dict) -> List[ResearchPaper]:
+    """Helper to parse a CrossRef works response into ResearchPaper objects"""
+    papers = []
+    for item in data.get("message", {}).get("items", []):
+        try:
+            title_list = item.get("title", [])
+            title = " ".join(title_list) if isinstance(title_list, list) else str(title_list)
+            title = title.strip()
+            if not title or len(title) < 10:
+                continue
+            
+            abstract = item.get("abstract", "No abstract available")
+            if abstract and abstract != "No abstract available":
+                if len(abstract) > 500:
+                    abstract = abstract[:497] + "..."
+            
+            authors = []
+            for author in item.get("author", [])[:5]:
+                given = author.get("given", "")
+                family = author.get("family", "")
+                author_name = f"{given} {family}".strip()
+                if author_name:
+                    authors.append(author_name)
+            
+            if not authors:
+                authors = ["Unknown"]
+            
+            # Get publication date
+            pub_date = ""
+            date_fields = ["published-print", "published-online", "created"]
+            for field in date_fields:
+                if field in item and "date-parts" in item[field]:
+                    date_parts = item[field]["date-parts"][0]
+                    if date_parts and len(date_parts) > 0:
+                        pub_date = str(date_parts[0])
+                        break
+            
+            papers.append(ResearchPaper(
+                title=title,
+                authors=authors,
+                abstract=abstract,
+                published_date=pub_date,
+                source="CrossRef",
+                url=item.get("URL", ""),
+                doi=item.get("DOI")
+            ))
+            
+        except Exception as e:
+            logger.warning(f"Error processing CrossRef item: {e}")
+            continue
+    
+    return papers
+
+@observe_upstream("crossref")
+async def fetch_crossref(search_terms: List[str], max_results: int,
+                         timings: Optional[Dict[str, float]] = None) -> List[ResearchPaper]:
     """Fetch papers from CrossRef - improved query"""
     try:
         # Build better query
@@ -1901,63 +2010,18 @@ async def fetch_crossref(search_terms: List[str], max_results: int) -> List[Rese
         
         async with httpx.AsyncClient(timeout=45.0) as client:
             response = await client.get(CROSSREF_API, params=params, headers=headers)
+            record_upstream_response("crossref", response.status_code)
             
             if response.status_code != 200:
-                logger.warning(f"CrossRef error {response.status_code}")
+                logger.warning("CrossRef error %d", response.status_code)
                 return []
                 
-            data = response.json()
-            papers = []
+            with span("research.parse", **{"research.source": "crossref"}) as parse_span:
+                papers = parse_crossref_response(response.json())
+            if timings is not None:
+                timings["parse_crossref"] = parse_span.duration_ms
             
-            for item in data.get("message", {}).get("items", []):
-                try:
-                    title_list = item.get("title", [])
-                    title = " ".join(title_list) if isinstance(title_list, list) else str(title_list)
-                    title = title.strip()
-                    if not title or len(title) < 10:
-                        continue
-                    
-                    abstract = item.get("abstract", "No abstract available")
-                    if abstract and abstract != "No abstract available":
-                        if len(abstract) > 500:
-                            abstract = abstract[:497] + "..."
-                    
-                    authors = []
-                    for author in item.get("author", [])[:5]:
-                        given = author.get("given", "")
-                        family = author.get("family", "")
-                        author_name = f"{given} {family}".strip()
-                        if author_name:
-                            authors.append(author_name)
-                    
-                    if not authors:
-                        authors = ["Unknown"]
-                    
-                    # Get publication date
-                    pub_date = ""
-                    date_fields = ["published-print", "published-online", "created"]
-                    for field in date_fields:
-                        if field in item and "date-parts" in item[field]:
-                            date_parts = item[field]["date-parts"][0]
-                            if date_parts and len(date_parts) > 0:
-                                pub_date = str(date_parts[0])
-                                break
-                    
-                    papers.append(ResearchPaper(
-                        title=title,
-                        authors=authors,
-                        abstract=abstract,
-                        published_date=pub_date,
-                        source="CrossRef",
-                        url=item.get("URL", ""),
-                        doi=item.get("DOI")
-                    ))
-                    
-                except Exception as e:
-                    logger.warning(f"Error processing CrossRef item: {e}")
-                    continue
-            
-            logger.info(f"CrossRef: {len(papers)} papers fetched")
+            logger.debug("CrossRef: %d papers fetched", len(papers))
             return papers
             
     except Exception as e:
@@ -1991,14 +2055,15 @@ def deduplicate_and_rank_papers(papers: List[ResearchPaper], target_count: int =
             seen_titles.add(normalized_title)
             unique_papers.append(paper)
     
-    logger.info(f"After deduplication: {len(unique_papers)} unique papers")
+    logger.debug("After deduplication: %d unique papers", len(unique_papers))
     
     # Step 2: Group papers by source
     papers_by_source = defaultdict(list)
     for paper in unique_papers:
         papers_by_source[paper.source].append(paper)
     
-    logger.info(f"Source distribution before ranking: {dict((k, len(v)) for k, v in papers_by_source.items())}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Source distribution before ranking: %s", {k: len(v) for k, v in papers_by_source.items()})
     
     # Step 3: Score papers within each source
     for source, source_papers in papers_by_source.items():
@@ -2064,7 +2129,7 @@ def deduplicate_and_rank_papers(papers: List[ResearchPaper], target_count: int =
         target = max(min_allocation, int(target_count * proportion))
         target_per_source[source] = min(target, available)
     
-    logger.info(f"Target distribution per source: {target_per_source}")
+    logger.debug("Target distribution per source: %s", target_per_source)
     
     # Round-robin selection with quality priority
     # First pass: Get top papers from each source up to their target
@@ -2120,13 +2185,11 @@ def deduplicate_and_rank_papers(papers: List[ResearchPaper], target_count: int =
     # Final result limited to target_count
     result = result[:target_count]
     
-    # Log final distribution
-    final_distribution = defaultdict(int)
-    for paper in result:
-        final_distribution[paper.source] += 1
-    
-    logger.info(f"Final distribution achieved: {dict(final_distribution)}")
-    logger.info(f"Returning top {len(result)} papers")
+    if logger.isEnabledFor(logging.DEBUG):
+        final_distribution = defaultdict(int)
+        for paper in result:
+            final_distribution[paper.source] += 1
+        logger.debug("Final distribution achieved: %s, returning top %d papers", dict(final_distribution), len(result))
     
     return result
 def check_profile_completion_helper(profile: dict) -> tuple[bool, List[str]]:
@@ -2165,276 +2228,27 @@ def check_profile_completion_helper(profile: dict) -> tuple[bool, List[str]]:
     
     is_complete = len(missing_fields) == 0
     return is_complete, missing_fields
-def calculate_match_score_and_details(profile: dict, requirements: dict) -> tuple:
-    """Calculate match score and matched items with updated field names"""
-    score = 0
-    matched_skills = []
-    matched_interests = []
-    
-    def normalize_text(text: str) -> str:
-        return text.lower().strip()
-    
-    def is_skill_match(profile_skill: str, req_skill: str) -> bool:
-        """Check if skills match"""
-        p_skill = normalize_text(profile_skill)
-        r_skill = normalize_text(req_skill)
-        
-        if p_skill == r_skill:
-            return True
-        
-        if len(r_skill) >= 3:
-            if r_skill in p_skill or p_skill in r_skill:
-                overlap = min(len(r_skill), len(p_skill))
-                if overlap / max(len(r_skill), len(p_skill)) >= 0.7:
-                    return True
-        
-        return False
-    
-    # 1. REQUIRED SKILLS MATCHING (60% weight)
-    req_skills = requirements.get("required_skills", [])
-    if req_skills:
-        profile_skills = profile.get("skills", [])
-        
-        for req_skill in req_skills:
-            for profile_skill in profile_skills:
-                if is_skill_match(profile_skill, req_skill):
-                    if profile_skill not in matched_skills:
-                        matched_skills.append(profile_skill)
-                    break
-        
-        skill_match_ratio = len(matched_skills) / len(req_skills) if req_skills else 0
-        score += skill_match_ratio * 60
-    else:
-        score += 30
-    
-    # 2. CURRENT ROLE MATCHING (15% weight) - UPDATED
-    req_role = requirements.get("current_role", "").strip()
-    profile_role = profile.get("role", "").strip()  # Using 'role' field
-    
-    if req_role and profile_role:
-        req_role_norm = normalize_text(req_role)
-        profile_role_norm = normalize_text(profile_role)
-        
-        if req_role_norm == profile_role_norm or \
-           req_role_norm in profile_role_norm or \
-           profile_role_norm in req_role_norm:
-            score += 15
-        else:
-            role_words = set(req_role_norm.split())
-            profile_words = set(profile_role_norm.split())
-            common_words = role_words.intersection(profile_words)
-            if common_words:
-                score += 7.5
-    
-    # 3. EXPERIENCE LEVEL MATCHING (10% weight)
-    req_experience = requirements.get("experience", "").strip()
-    profile_experience = profile.get("experience", "").strip()
-    
-    if req_experience and profile_experience:
-        if normalize_text(req_experience) == normalize_text(profile_experience):
-            score += 10
-        else:
-            exp_levels = ["junior", "mid", "senior"]
-            try:
-                req_idx = exp_levels.index(normalize_text(req_experience))
-                prof_idx = exp_levels.index(normalize_text(profile_experience))
-                if abs(req_idx - prof_idx) == 1:
-                    score += 5
-            except ValueError:
-                pass
-    elif not req_experience:
-        score += 5
-    
-    # 4. AVAILABILITY MATCHING (5% weight)
-    req_availability = requirements.get("availability", "").strip()
-    profile_availability = profile.get("availability", "").strip()
-    
-    if req_availability and profile_availability:
-        if normalize_text(req_availability) == normalize_text(profile_availability):
-            score += 5
-    elif not req_availability:
-        score += 2.5
-    
-    # 5. LOCATION MATCHING (5% weight)
-    req_location = requirements.get("location", "").strip()
-    profile_location = profile.get("location", "").strip()
-    
-    if req_location and profile_location:
-        req_loc_norm = normalize_text(req_location)
-        prof_loc_norm = normalize_text(profile_location)
-        
-        if "remote" in req_loc_norm and "remote" in prof_loc_norm:
-            score += 5
-        elif req_loc_norm in prof_loc_norm or prof_loc_norm in req_loc_norm:
-            score += 5
-        else:
-            req_loc_parts = set(req_loc_norm.split())
-            prof_loc_parts = set(prof_loc_norm.split())
-            if req_loc_parts.intersection(prof_loc_parts):
-                score += 2.5
-    elif not req_location:
-        score += 2.5
-    
-    # 6. INTERESTS MATCHING (5% weight)
-    req_interests = requirements.get("interests", [])
-    if req_interests:
-        profile_interests = profile.get("interests", [])
-        
-        for req_interest in req_interests:
-            for profile_interest in profile_interests:
-                if is_skill_match(profile_interest, req_interest):
-                    if profile_interest not in matched_interests:
-                        matched_interests.append(profile_interest)
-                    break
-        
-        if req_interests:
-            interest_match_ratio = len(matched_interests) / len(req_interests)
-            score += interest_match_ratio * 5
-    
-    final_score = min(100, max(0, int(score)))
-    return final_score, matched_skills, matched_interests
 # ==========================================
 # CONNECTION REQUEST HELPER (Override database.py version)
 # ==========================================
-def create_connection_request_api(sender_id: str, receiver_id: str, message: str = "") -> str:
+def create_connection_request_api(sender_id: str, receiver_id: str, message: str = "",
+                                  idempotency_key: Optional[str] = None) -> Tuple[str, str]:
     """
-    API-specific connection request handler with detailed logging and error handling
+    API-specific connection request handler with detailed logging and error handling.
+    State checks and the write happen atomically on the pair state document.
+    Returns (request_id, outcome) with outcome "sent" or "accepted".
     """
     try:
-        logger.info(f"🔍 Connection request: {sender_id} -> {receiver_id}")
-        
-        sender_oid = ObjectId(sender_id)
-        receiver_oid = ObjectId(receiver_id)
-        
-        # 1. Prevent self-connection
-        if sender_id == receiver_id:
-            logger.warning(f"❌ Self-connection attempt: {sender_id}")
-            raise ValueError("Cannot send request to yourself")
-        
-        # 2. Check if already connected
-        existing_connection = connections_collection.find_one({
-            "$or": [
-                {"user_id": sender_oid, "target_user_id": receiver_oid, "status": "connected"},
-                {"user_id": receiver_oid, "target_user_id": sender_oid, "status": "connected"}
-            ]
-        })
-        
-        if existing_connection:
-            logger.warning(f"❌ Already connected: {sender_id} <-> {receiver_id}")
-            raise ValueError("Already connected with this user")
+        request_id, outcome = create_connection_request_fixed(sender_id, receiver_id, message, idempotency_key)
         
-        # 3. Check for pending requests (both directions)
-        existing_request = connection_requests_collection.find_one({
-            "$or": [
-                {"sender_id": sender_oid, "receiver_id": receiver_oid, "status": "pending"},
-                {"sender_id": receiver_oid, "receiver_id": sender_oid, "status": "pending"}
-            ]
-        })
-        
-        if existing_request:
-            # If receiver already sent a request to sender, auto-accept
-            if str(existing_request["sender_id"]) == receiver_id:
-                logger.info(f"✅ Auto-accepting mutual request: {receiver_id} -> {sender_id}")
-                
-                connection_requests_collection.update_one(
-                    {"_id": existing_request["_id"]},
-                    {"$set": {"status": "accepted", "updated_at": datetime.utcnow()}}
-                )
-                
-                # Create bidirectional connections
-                connections_collection.insert_one({
-                    "user_id": sender_oid,
-                    "target_user_id": receiver_oid,
-                    "status": "connected",
-                    "created_at": datetime.utcnow(),
-                    "updated_at": datetime.utcnow()
-                })
-                
-                connections_collection.insert_one({
-                    "user_id": receiver_oid,
-                    "target_user_id": sender_oid,
-                    "status": "connected",
-                    "created_at": datetime.utcnow(),
-                    "updated_at": datetime.utcnow()
-                })
-                
-                return str(existing_request["_id"])
-            else:
-                logger.warning(f"❌ Request already sent: {sender_id} -> {receiver_id}")
-                logger.info(f"📋 Existing request ID: {existing_request['_id']}, Status: {existing_request['status']}")
-                raise ValueError("Connection request already sent")
-        
-        # 4. Check for ANY existing request (including rejected/accepted)
-        any_existing = connection_requests_collection.find_one({
-            "$or": [
-                {"sender_id": sender_oid, "receiver_id": receiver_oid},
-                {"sender_id": receiver_oid, "receiver_id": sender_oid}  # Check both directions
-            ]
-        })
-        
-        if any_existing:
-            logger.info(f"📋 Found existing request with status: {any_existing['status']}")
-            
-            if any_existing["status"] == "rejected":
-                # Check if 24 hours have passed
-                rejection_time = any_existing.get("updated_at", any_existing.get("created_at"))
-                if rejection_time:
-                    hours_since = (datetime.utcnow() - rejection_time).total_seconds() / 3600
-                    if hours_since < 24:
-                        logger.warning(f"❌ Too soon after rejection: {int(24 - hours_since)} hours remaining")
-                        raise ValueError(f"Please wait {int(24 - hours_since)} hours before sending another request")
-                
-                # Delete old rejected request
-                logger.info(f"🗑️ Deleting old rejected request: {any_existing['_id']}")
-                connection_requests_collection.delete_one({"_id": any_existing["_id"]})
-            
-            elif any_existing["status"] == "accepted":
-                # ✅ CRITICAL FIX: If request is accepted but no connection exists, 
-                # it means they disconnected - delete the old request
-                logger.warning(f"⚠️ Found accepted request but no connection - cleaning up orphaned request")
-                logger.info(f"🗑️ Deleting orphaned accepted request: {any_existing['_id']}")
-                connection_requests_collection.delete_one({"_id": any_existing["_id"]})
-                # Now continue to create a new request below
-            
-            elif any_existing["status"] == "pending":
-                logger.warning(f"❌ Request already pending: {any_existing['_id']}")
-                raise ValueError("Connection request already sent")
-        
-        # 5. Create new request
-        request_doc = {
-            "sender_id": sender_oid,
-            "receiver_id": receiver_oid,
-            "message": message,
-            "status": "pending",
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
+        logger.info(
+            "Connection request %s: %s -> %s", outcome, sender_id, receiver_id,
+            extra={"request": request_id, "outcome": outcome}
+        )
+        return request_id, outcome
         
-        try:
-            result = connection_requests_collection.insert_one(request_doc)
-            logger.info(f"✅ Connection request created: {result.inserted_id}")
-            return str(result.inserted_id)
-        except errors.DuplicateKeyError as e:
-            logger.error(f"❌ Duplicate key error: {e}")
-            # The request exists but we didn't catch it above - find and return it
-            existing = connection_requests_collection.find_one({
-                "$or": [
-                    {"sender_id": sender_oid, "receiver_id": receiver_oid},
-                    {"sender_id": receiver_oid, "receiver_id": sender_oid}
-                ]
-            })
-            if existing:
-                logger.info(f"📋 Found existing request after duplicate error: {existing['_id']}")
-                # Delete it and retry
-                connection_requests_collection.delete_one({"_id": existing["_id"]})
-                logger.info(f"🗑️ Deleted duplicate request, retrying...")
-                # Retry insertion
-                result = connection_requests_collection.insert_one(request_doc)
-                logger.info(f"✅ Connection request created on retry: {result.inserted_id}")
-                return str(result.inserted_id)
-            raise ValueError("Failed to create connection request due to duplicate")
-        
-    except ValueError:
+    except ValueError as e:
+        logger.warning("Connection request rejected: %s", e)
         raise  # Re-raise ValueError for API handling
     except Exception as e:
         logger.error(f"❌ Connection request failed: {e}")
@@ -2525,7 +2339,7 @@ async def validate_idea_enhanced(idea: IdeaInput, current_user=Depends(get_optio
     
     try:
         # Get AI validation with enhanced features
-        ai_result = call_groq_validation_enhanced(idea.prompt)
+        ai_result = await asyncio.to_thread(call_groq_validation_enhanced, idea.prompt)
         logger.info("Enhanced AI validation completed")
         
         # Structure the response
@@ -2605,7 +2419,7 @@ async def chat_with_idea(
             raise HTTPException(status_code=400, detail="Message too long (max 1000 characters)")
         
         # Get AI response
-        ai_response = call_groq_chat_with_idea(message, idea_context, session_id)
+        ai_response = await asyncio.to_thread(call_groq_chat_with_idea, message, idea_context, session_id)
         
         # Optional: Save chat history if user is authenticated
         if current_user:
@@ -2639,7 +2453,7 @@ async def generate_roadmap(roadmap_input: RoadmapInput, current_user=Depends(get
     
     try:
         # Get AI roadmap generation with enhanced filtering
-        ai_result = call_groq_roadmap_enhanced(roadmap_input.prompt, roadmap_input.timeframe)
+        ai_result = await asyncio.to_thread(call_groq_roadmap_enhanced, roadmap_input.prompt, roadmap_input.timeframe)
         logger.info("AI roadmap generation completed")
         
         # Default values for anonymous users
@@ -2710,16 +2524,31 @@ async def generate_roadmap(roadmap_input: RoadmapInput, current_user=Depends(get
 
 # Replace your /research-papers endpoint in main.py
 
+async def _timed_fetch(name: str, fetch, search_terms: List[str], max_results: int,
+                       timings: Dict[str, float]) -> List[ResearchPaper]:
+    """Run one source's fetch, recording its wall time (parse time is recorded by the fetch)"""
+    start = time.perf_counter()
+    try:
+        return await fetch(search_terms, max_results, timings)
+    finally:
+        timings[f"fetch_{name}"] = (time.perf_counter() - start) * 1000
+
+def format_server_timing(timings: Dict[str, float]) -> str:
+    """Stage durations (ms) as a Server-Timing header value"""
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+
 @app.post("/research-papers", response_model=ResearchResponse)
 async def get_research_papers(
     request: ResearchRequest, 
+    response: Response,
     current_user=Depends(get_optional_current_user)
 ) -> ResearchResponse:
     """
     Fetch exactly 40 high-quality research papers from 3 sources in parallel,
-    properly deduplicated and ranked by quality
+    properly deduplicated and ranked by quality.
+    Per-stage durations are reported in the Server-Timing header.
     """
-    logger.info(f"Research request: {request.idea[:50]}...")
+    logger.debug("Research request: %.50s...", request.idea)
     
     # Content validation
     if is_harmful_content(request.idea):
@@ -2734,31 +2563,31 @@ async def get_research_papers(
             detail="Please provide more detail (at least 10 characters)"
         )
     
+    timings: Dict[str, float] = {}
     try:
         # Generate search terms
-        search_terms = generate_search_terms(request.idea)
-        if not search_terms:
-            search_terms = [request.idea]
+        with span("research.terms") as stage:
+            search_terms = await asyncio.to_thread(generate_search_terms, request.idea)
+            if not search_terms:
+                search_terms = [request.idea]
+            stage.set_attribute("research.term_count", len(search_terms))
+        timings["terms"] = stage.duration_ms
         
-        logger.info(f"Search terms: {search_terms}")
+        logger.debug("Search terms: %s", search_terms)
         
         # ⚡ PARALLEL FETCH - All 3 APIs called simultaneously
-        logger.info("🚀 Fetching papers from all 3 sources IN PARALLEL...")
-        start_time = datetime.utcnow()
-        
-        # Create tasks for parallel execution
-        tasks = [
-            fetch_semantic_scholar(search_terms, 50),
-            fetch_arxiv(search_terms, 50),
-            fetch_crossref(search_terms, 50)
-        ]
-        
-        # Execute all tasks simultaneously
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        with span("research.fetch") as stage:
+            # Create tasks for parallel execution
+            tasks = [
+                _timed_fetch("semantic_scholar", fetch_semantic_scholar, search_terms, 50, timings),
+                _timed_fetch("arxiv", fetch_arxiv, search_terms, 50, timings),
+                _timed_fetch("crossref", fetch_crossref, search_terms, 50, timings)
+            ]
+            
+            # Execute all tasks simultaneously
+            results = await asyncio.gather(*tasks, return_exceptions=True)
         
-        end_time = datetime.utcnow()
-        fetch_duration = (end_time - start_time).total_seconds()
-        logger.info(f"⏱️ All 3 APIs completed in {fetch_duration:.2f} seconds")
+        timings["fetch"] = stage.duration_ms
         
         # Process results
         all_papers: List[ResearchPaper] = []
@@ -2768,31 +2597,24 @@ async def get_research_papers(
         for i, result in enumerate(results):
             source = source_names[i]
             if isinstance(result, Exception):
-                logger.warning(f"❌ {source} failed: {result}")
+                logger.warning("%s failed: %s", source, result)
                 source_counts[source] = 0
             elif isinstance(result, list):
                 paper_count = len(result)
                 all_papers.extend(result)
                 source_counts[source] = paper_count
-                logger.info(f"✅ {source}: {paper_count} papers")
-        
-        # Log combined results
-        logger.info(f"📊 Combined totals: SS={source_counts.get('Semantic Scholar', 0)}, "
-                   f"arXiv={source_counts.get('arXiv', 0)}, "
-                   f"CrossRef={source_counts.get('CrossRef', 0)}")
-        logger.info(f"📚 Total papers before deduplication: {len(all_papers)}")
         
         # Deduplicate and rank to get best 40 papers
-        final_papers = deduplicate_and_rank_papers(all_papers, target_count=40)
-        
-        logger.info(f"🎯 Final paper count after ranking: {len(final_papers)}")
-        
-        # Log source distribution in final 40
-        final_source_dist = {}
-        for paper in final_papers:
-            final_source_dist[paper.source] = final_source_dist.get(paper.source, 0) + 1
-        
-        logger.info(f"📈 Final 40 paper distribution: {final_source_dist}")
+        with span("research.dedup_rank", **{"research.papers_in": len(all_papers)}) as stage:
+            final_papers = deduplicate_and_rank_papers(all_papers, target_count=40)
+            stage.set_attribute("research.papers_out", len(final_papers))
+        timings["dedup_rank"] = stage.duration_ms
+        
+        logger.info(
+            "Research: %d papers fetched in %.0fms, %d after ranking",
+            len(all_papers), timings["fetch"], len(final_papers),
+            extra={"source_counts": source_counts}
+        )
         
         if not final_papers:
             raise HTTPException(
@@ -2804,6 +2626,7 @@ async def get_research_papers(
         research_id = "anonymous"
         
         if current_user and final_papers:
+            save_start = time.perf_counter()
             try:
                 user_id = str(current_user["_id"])
                 paper_data_list = [p.dict() for p in final_papers]
@@ -2813,10 +2636,12 @@ async def get_research_papers(
                     "papers": paper_data_list,
                 }
                 research_id = save_research(user_id, research_doc)
-                logger.info(f"💾 Research saved: {research_id}")
+                logger.debug("Research saved: %s", research_id)
             except Exception as e:
                 logger.error(f"❌ Save error: {e}")
+            timings["save"] = (time.perf_counter() - save_start) * 1000
         
+        response.headers["Server-Timing"] = format_server_timing(timings)
         return ResearchResponse(
             papers=final_papers,
             search_terms=search_terms,
@@ -2873,57 +2698,61 @@ async def get_user_activity_summary(current_user=Depends(get_current_user)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch activity: {str(e)}")
 
+def gzip_stream(chunks):
+    """Gzip-compress an iterator of byte chunks incrementally"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
 @app.get("/user/export")
-async def export_my_data(current_user=Depends(get_current_user)):
-    """Export all user data (GDPR compliance)"""
-    try:
-        user_id = str(current_user["_id"])
-        
-        export_data = {
-            "user_info": {
-                "id": user_id,
-                "name": current_user.get("name"),
-                "email": current_user.get("email"),
-                "created_at": current_user.get("created_at")
-            },
-            "profile": get_user_profile(user_id),
-            "ideas": get_user_ideas(user_id, limit=100),
-            "roadmaps": get_user_roadmaps(user_id),
-            "research": get_user_research_history(user_id, limit=100),
-            "activity_stats": get_user_stats(user_id),
-            "exported_at": datetime.utcnow().isoformat()
-        }
-        
-        # Convert ObjectIds to strings for JSON serialization
-        def convert_objectid(obj):
-            if isinstance(obj, ObjectId):
-                return str(obj)
-            elif isinstance(obj, dict):
-                return {k: convert_objectid(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [convert_objectid(item) for item in obj]
-            else:
-                return obj
-        
-        export_data = convert_objectid(export_data)
-        
-        return {"data": export_data}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Data export failed: {str(e)}")
+async def export_my_data(format: str = "ndjson", current_user=Depends(get_current_user)):
+    """Stream all user data as NDJSON, optionally gzipped (GDPR compliance)"""
+    if format not in ("ndjson", "gzip"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'gzip'")
+
+    user_id = str(current_user["_id"])
+    filename = f"startup-gps-export-{user_id}.ndjson"
+    lines = iter_user_export(user_id, current_user)
+
+    # Sync generators are iterated in the threadpool, so cursor reads never block the event loop
+    if format == "gzip":
+        return StreamingResponse(
+            gzip_stream(lines),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.gz"'}
+        )
 
-@app.delete("/user/data")
+    return StreamingResponse(
+        lines,
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.delete("/user/data", status_code=status.HTTP_202_ACCEPTED)
 async def delete_my_data(current_user=Depends(get_current_user)):
-    """Delete all user data (GDPR compliance)"""
+    """Queue deletion of all user data (GDPR compliance)"""
     try:
         user_id = str(current_user["_id"])
-        success = delete_user_data(user_id)
-        if success:
-            return {"message": "All user data deleted successfully"}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to delete user data")
+        job = enqueue_user_deletion(user_id)
+        return {
+            "message": "Data deletion queued",
+            "job_id": job["job_id"],
+            "status": job["status"]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Data deletion failed: {str(e)}")
 
+@app.get("/user/data/deletion/{job_id}")
+async def get_deletion_status(job_id: str, user_id: str = Depends(get_current_user_id)):
+    """Get progress of a data deletion job (works after the account itself is gone)"""
+    job = get_deletion_job(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    return job
+
 # Dashboard endpoint for developers
 @app.get("/dashboard-data")
 def get_dashboard_data(current_user=Depends(get_current_user)):
@@ -3043,6 +2872,13 @@ def root():
         ]
     }
 
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint(authorization: Optional[str] = Header(None)):
+    """Prometheus text-format metrics for this process (bearer METRICS_TOKEN required when set)"""
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 def health_check():
     return {
@@ -3052,10 +2888,80 @@ def health_check():
         "services": {
             "database": "connected" if db is not None else "error",
             "groq_api": "configured" if GROQ_API_KEY else "not_configured",
+            "llm_providers": provider_status(),
             "semantic_scholar": "configured" if SEMANTIC_SCHOLAR_API_KEY else "not_configured"
         }
     }
 
+@app.on_event("startup")
+async def run_startup_tasks():
+    """Run one-off migrations and pick up jobs interrupted before a restart"""
+    if not SEMANTIC_SCHOLAR_API_KEY:
+        logger.warning("No Semantic Scholar API key - research uses unauthenticated access")
+
+    try:
+        await asyncio.to_thread(run_migration_once, "pair_states_v1", backfill_pair_states)
+    except Exception as e:
+        logger.error(f"Pair state backfill failed: {e}")
+
+    try:
+        await asyncio.to_thread(run_migration_once, "connections_unique_pair_v1", dedupe_connections)
+    except Exception as e:
+        logger.error(f"Connection dedupe failed: {e}")
+
+    try:
+        await asyncio.to_thread(run_migration_once, PROFILE_MATCH_INDEX_MIGRATION, backfill_profile_match_index)
+    except Exception as e:
+        logger.error(f"Profile match index backfill failed: {e}")
+
+    try:
+        resume_pending_deletion_jobs()
+    except Exception as e:
+        logger.error(f"Failed to resume deletion jobs: {e}")
+
+    if MESSAGE_ARCHIVE_INTERVAL_HOURS > 0:
+        asyncio.create_task(run_message_archival())
+    
+    asyncio.create_task(monitor_event_loop_lag())
+
+    asyncio.create_task(run_embedding_index())
+
+async def run_message_archival():
+    """Periodically roll old chat messages into archive buckets"""
+    while True:
+        try:
+            await asyncio.to_thread(archive_old_messages, db, client)
+        except Exception as e:
+            logger.error(f"Message archival failed: {e}")
+        await asyncio.sleep(MESSAGE_ARCHIVE_INTERVAL_HOURS * 3600)
+
+async def run_embedding_index():
+    """
+    Load the teammate embedding index (building it first if none exists), pull
+    changed profiles into it every EMBEDDING_SYNC_SECONDS and rebuild it every
+    EMBEDDING_REBUILD_INTERVAL_HOURS
+    """
+    rebuild_every = EMBEDDING_REBUILD_INTERVAL_HOURS * 3600
+    try:
+        if not await asyncio.to_thread(embedding_index.load):
+            # Another worker may have built it while this one waited for the build lock
+            await asyncio.to_thread(build_index, profiles_collection, max_age_seconds=float("inf"))
+            await asyncio.to_thread(embedding_index.load)
+    except Exception as e:
+        logger.error(f"Embedding index load failed: {e}")
+
+    while True:
+        try:
+            # A no-op unless the current build (whichever worker made it) is older than the interval
+            if rebuild_every > 0:
+                await asyncio.to_thread(build_index, profiles_collection, max_age_seconds=rebuild_every)
+            # Picks up a build made by any worker; cheap when CURRENT has not changed
+            await asyncio.to_thread(embedding_index.load)
+            await asyncio.to_thread(embedding_index.sync, profiles_collection)
+        except Exception as e:
+            logger.error(f"Embedding index refresh failed: {e}")
+        await asyncio.sleep(EMBEDDING_SYNC_SECONDS)
+
 # Debug endpoints for testing
 @app.post("/test-validation-save")
 async def test_validation_save(current_user=Depends(get_current_user)):
@@ -3114,114 +3020,221 @@ async def test_validation_save(current_user=Depends(get_current_user)):
 
 
 
+def _decode_search_cursor(cursor: str) -> Tuple[int, str]:
+    score, profile_id = cursor.split("|", 1)
+    if not ObjectId.is_valid(profile_id):
+        raise ValueError("Invalid cursor")
+    return int(score), profile_id
+
+def _rank_team_search(user_id: str, search_input: TeamSearchInput) -> List[Tuple[int, str]]:
+    """Run a team search: (score, profile id) of every match, in page order"""
+    # Check if current user's profile is complete
+    user_profile = get_user_profile(user_id)
+    if not user_profile:
+        raise HTTPException(
+            status_code=400,
+            detail="Please create your profile before searching for team members"
+        )
+    
+    is_complete, missing_fields = check_profile_completion_helper(user_profile)
+    if not is_complete:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Please complete your profile. Missing fields: {', '.join(missing_fields)}"
+        )
+    
+    # Validate required skills
+    if not search_input.required_skills or len(search_input.required_skills) == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="At least one required skill must be specified"
+        )
+    
+    # Get all profiles except current user
+    # Requirements are normalized and indexed once; the whole candidate set is ranked in one pass
+    engine = RankingEngine(search_input.dict())
+    
+    # Skip profiles that provably can't reach the threshold on the server side
+    query = {"user_id": {"$ne": ObjectId(user_id)}}
+    query.update(team_search_prefilter(engine))
+    projection = {"user_id": 1, "match_index": 1, **{field: 1 for field in PROFILE_CARD_FIELDS}}
+    return engine.ranking(profiles_collection.find(query, projection))
+
+def _team_search_page(search_input: TeamSearchInput, ranking: List[Tuple[int, str]], explain: bool,
+                      after: Optional[Tuple[int, str]] = None, limit: int = 20) -> Dict:
+    """One page of match cards (without connection status) cut from a ranking, with the match count and next cursor"""
+    window, has_more = page_after(ranking, after, limit)
+    engine = RankingEngine(search_input.dict())
+    
+    # Load and hydrate the returned page only; matched terms are recomputed for its profiles
+    users, profiles = hydrate_profiles(
+        [profile_id for _, profile_id in window], profile_fields=("match_index", *PROFILE_CARD_FIELDS)
+    )
+    
+    top_profiles = []
+    for match_score, profile_id in window:
+        profile = profiles.get(profile_id)
+        user = users.get(profile_id)
+        if not profile or not user:
+            continue
+        _, matched_skills, matched_interests = engine.score(profile)
+        
+        matched_profile = {
+            "id": profile_id,
+            "name": user.get("name", "Unknown"),
+            "email": user.get("email", ""),
+            "phone": profile.get("phone", ""),
+            "role": profile.get("role", ""),
+            "skills": profile.get("skills", []),
+            "interests": profile.get("interests", []),
+            "current_role": profile.get("role", ""),  # Using role field
+            "experience": profile.get("experience", ""),
+            "availability": profile.get("availability", ""),
+            "location": profile.get("location", ""),
+            "match_score": match_score,
+            "matched_skills": matched_skills,
+            "matched_interests": matched_interests
+        }
+        if explain:
+            matched_profile["explanation"] = engine.explain(profile)
+        top_profiles.append(matched_profile)
+    
+    next_cursor = None
+    if has_more:
+        last_score, last_profile_id = window[-1]
+        next_cursor = f"{last_score}|{last_profile_id}"
+    return {"profiles": top_profiles, "total": len(ranking), "next_cursor": next_cursor}
+
 @app.post("/api/team-search")
-async def search_team_members(search_input: TeamSearchInput, current_user=Depends(get_current_user)):
-    """Search for team members with profile completion check"""
+async def search_team_members(
+    search_input: TeamSearchInput,
+    current_user=Depends(get_current_user),
+    explain: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = 20
+):
+    """
+    Search for team members with profile completion check (explain=true adds per-component scoring).
+    Results are ranked by score, then profile id; pass next_cursor back to fetch the following page.
+    """
     try:
         user_id = str(current_user["_id"])
+        limit = max(1, min(limit, 100))
+        try:
+            after = _decode_search_cursor(cursor) if cursor else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        
+        # The ranking is cached until any profile changes; every page (and explain) is cut from it
+        cache_key = team_search_cache_key(user_id, search_input.dict())
+        profile_version = current_profile_version()
+        ranking = get_cached_team_search(cache_key, profile_version)
+        if ranking is None:
+            ranking = _rank_team_search(user_id, search_input)
+            cache_team_search(cache_key, profile_version, ranking)
+        result = _team_search_page(search_input, ranking, explain, after, limit)
+        
+        # Connection status is always resolved fresh, in one batched lookup for the page
+        statuses = get_connection_statuses_batch(user_id, [p["id"] for p in result["profiles"]])
+        top_profiles = [
+            {**matched_profile, "connection_status": statuses[matched_profile["id"]]}
+            for matched_profile in result["profiles"]
+        ]
         
-        # Check if current user's profile is complete
-        user_profile = get_user_profile(user_id)
-        if not user_profile:
-            raise HTTPException(
-                status_code=400,
-                detail="Please create your profile before searching for team members"
-            )
+        return {
+            "profiles": top_profiles,
+            "total": result["total"],
+            "next_cursor": result["next_cursor"],
+            "search_criteria": search_input.dict()
+        }
         
-        is_complete, missing_fields = check_profile_completion_helper(user_profile)
-        if not is_complete:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Please complete your profile. Missing fields: {', '.join(missing_fields)}"
-            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Team search failed: {e}")
+        raise HTTPException(status_code=500, detail="Search failed")
+
+@app.post("/api/team-recommendations")
+async def recommend_team_members(
+    recommendation_input: TeamRecommendationInput,
+    current_user=Depends(get_current_user)
+):
+    """Nearest profiles to the requirements in the skill embedding index"""
+    try:
+        user_id = str(current_user["_id"])
         
-        # Validate required skills
-        if not search_input.required_skills or len(search_input.required_skills) == 0:
+        if not (recommendation_input.required_skills or recommendation_input.interests or recommendation_input.current_role):
             raise HTTPException(
                 status_code=400,
-                detail="At least one required skill must be specified"
+                detail="Specify at least one skill, interest or role"
             )
+        if not embedding_index.available:
+            raise HTTPException(status_code=503, detail="Recommendations are not available yet")
         
-        # Get all profiles except current user
-        query = {"user_id": {"$ne": ObjectId(user_id)}}
-        profiles_cursor = profiles_collection.find(query)
-        
-        matched_profiles = []
+        query_vector = embed(
+            recommendation_input.required_skills,
+            recommendation_input.interests,
+            recommendation_input.current_role
+        )
+        nearest = embedding_index.search(query_vector, recommendation_input.limit, exclude=(user_id,))
         
-        for profile in profiles_cursor:
-            # Calculate match score
-            match_score, matched_skills, matched_interests = calculate_match_score_and_details(
-                profile,
-                search_input.dict()
-            )
-            
-            # Only include profiles with >= 30% match
-            if match_score >= 30:
-                user = users_collection.find_one({"_id": profile["user_id"]})
-                if user:
-                    profile_id = str(profile["user_id"])
-                    connection_status = get_connection_status(user_id, profile_id)
-                    
-                    matched_profile = {
-                        "id": profile_id,
-                        "name": user.get("name", "Unknown"),
-                        "email": user.get("email", ""),
-                        "phone": profile.get("phone", ""),
-                        "role": profile.get("role", ""),
-                        "skills": profile.get("skills", []),
-                        "interests": profile.get("interests", []),
-                        "current_role": profile.get("role", ""),  # Using role field
-                        "experience": profile.get("experience", ""),
-                        "availability": profile.get("availability", ""),
-                        "location": profile.get("location", ""),
-                        "match_score": match_score,
-                        "matched_skills": matched_skills,
-                        "matched_interests": matched_interests,
-                        "connection_status": connection_status
-                    }
-                    matched_profiles.append(matched_profile)
+        users, profiles = hydrate_profiles([candidate_id for candidate_id, _ in nearest])
+        statuses = get_connection_statuses_batch(user_id, [candidate_id for candidate_id, _ in nearest])
         
-        # Sort by match score
-        matched_profiles.sort(key=lambda x: x["match_score"], reverse=True)
+        recommendations = []
+        for candidate_id, similarity in nearest:
+            user = users.get(candidate_id)
+            profile = profiles.get(candidate_id)
+            if not user or not profile:
+                continue
+            recommendations.append({
+                "id": candidate_id,
+                "name": user.get("name", "Unknown"),
+                "email": user.get("email", ""),
+                "role": profile.get("role", ""),
+                "skills": profile.get("skills", []),
+                "interests": profile.get("interests", []),
+                "experience": profile.get("experience", ""),
+                "availability": profile.get("availability", ""),
+                "location": profile.get("location", ""),
+                "similarity": round(similarity, 4),
+                "connection_status": statuses[candidate_id]
+            })
         
-        return {
-            "profiles": matched_profiles[:20],
-            "total": len(matched_profiles),
-            "search_criteria": search_input.dict()
-        }
+        return {"profiles": recommendations, "index_size": len(embedding_index)}
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Team search failed: {e}")
-        raise HTTPException(status_code=500, detail="Search failed")
+        logger.error(f"Team recommendations failed: {e}")
+        raise HTTPException(status_code=500, detail="Recommendations failed")
 
 # ADD THIS ENDPOINT TO YOUR main.py file (around line 1650, after the team search endpoint)
 
 @app.post("/api/connection-requests")
 async def send_connection_request_api(
     request_data: ConnectionRequestInput, 
-    current_user=Depends(get_current_user)
+    current_user=Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=128)
 ):
-    """Send connection request to another user"""
+    """Send connection request to another user (retries with the same Idempotency-Key are safe)"""
     try:
         user_id = str(current_user["_id"])
         receiver_id = request_data.receiver_id
         message = request_data.message or ""
         
-        logger.info(f"📤 Sending connection request: {user_id} -> {receiver_id}")
-        
         # Use the inline helper with better error handling
-        request_id = create_connection_request_api(user_id, receiver_id, message)
+        request_id, outcome = create_connection_request_api(user_id, receiver_id, message, idempotency_key)
         
         return {
             "request_id": request_id,
-            "status": "sent",
-            "message": "Connection request sent successfully"
+            "status": outcome,
+            "message": "Connection request sent successfully" if outcome == "sent"
+                       else "Connection request accepted, you are now connected"
         }
         
     except ValueError as e:
-        logger.warning(f"⚠️ Validation error: {e}")
+        logger.warning("Validation error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"❌ Failed to send request: {e}", exc_info=True)
@@ -3240,73 +3253,22 @@ async def respond_to_request_api(
         user_id = str(current_user["_id"])
         action = response_data.action
         
-        logger.info(f"📨 User {user_id} responding to request {request_id} with action: {action}")
+        if action not in ("accept", "reject"):
+            raise HTTPException(status_code=400, detail="Action must be 'accept' or 'reject'")
         
-        # Validate request exists and belongs to current user
-        try:
-            request_obj_id = ObjectId(request_id)
-        except Exception:
-            logger.error(f"❌ Invalid request ID format: {request_id}")
+        if not ObjectId.is_valid(request_id):
+            logger.warning("Invalid request ID format: %s", request_id)
             raise HTTPException(status_code=400, detail="Invalid request ID format")
         
-        # Get the request from database
-        request_doc = connection_requests_collection.find_one({
-            "_id": request_obj_id,
-            "receiver_id": ObjectId(user_id),
-            "status": "pending"
-        })
+        # Pair state, request and connection mirrors change in one transaction
+        results = await asyncio.to_thread(respond_to_connection_requests, user_id, [request_id], action)
         
-        if not request_doc:
-            logger.warning(f"⚠️ Request {request_id} not found or not pending")
+        if results[str(ObjectId(request_id))] == "not_found":
+            logger.warning("Request %s not found or not pending", request_id)
             raise HTTPException(status_code=404, detail="Connection request not found or already processed")
         
-        logger.info(f"✅ Found request: {request_doc}")
-        
-        # Process the response
-        new_status = "accepted" if action == "accept" else "rejected"
-        
-        # Update request status
-        update_result = connection_requests_collection.update_one(
-            {"_id": request_obj_id},
-            {
-                "$set": {
-                    "status": new_status,
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
-        
-        logger.info(f"📝 Updated request status to: {new_status}, matched: {update_result.matched_count}")
-        
-        # If accepted, create bidirectional connections
-        if action == "accept":
-            sender_id = str(request_doc["sender_id"])
-            receiver_id = str(request_doc["receiver_id"])
-            
-            logger.info(f"🤝 Creating connections: {sender_id} <-> {receiver_id}")
-            
-            # Create connection from sender to receiver
-            connections_collection.insert_one({
-                "user_id": ObjectId(sender_id),
-                "target_user_id": ObjectId(receiver_id),
-                "status": "connected",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            })
-            
-            # Create connection from receiver to sender
-            connections_collection.insert_one({
-                "user_id": ObjectId(receiver_id),
-                "target_user_id": ObjectId(sender_id),
-                "status": "connected",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            })
-            
-            logger.info(f"✅ Connections created successfully")
-        
         action_text = "accepted" if action == "accept" else "rejected"
-        logger.info(f"✅ Request {request_id} {action_text} successfully")
+        logger.info("Request %s %s by %s", request_id, action_text, user_id)
         
         return {
             "message": f"Connection request {action_text} successfully",
@@ -3323,18 +3285,66 @@ async def respond_to_request_api(
         )
 
 
+@app.post("/api/connection-requests/respond-batch")
+async def respond_to_requests_batch_api(
+    response_data: ConnectionBatchResponseInput,
+    current_user=Depends(get_current_user)
+):
+    """Accept or reject many pending connection requests at once"""
+    try:
+        user_id = str(current_user["_id"])
+        action = response_data.action
+        
+        if action not in ("accept", "reject"):
+            raise HTTPException(status_code=400, detail="Action must be 'accept' or 'reject'")
+        
+        invalid_ids = [rid for rid in response_data.request_ids if not ObjectId.is_valid(rid)]
+        if invalid_ids:
+            raise HTTPException(status_code=400, detail=f"Invalid request ID format: {invalid_ids[0]}")
+        
+        results = await asyncio.to_thread(
+            respond_to_connection_requests, user_id, response_data.request_ids, action
+        )
+        
+        counts = {"accepted": 0, "rejected": 0, "not_found": 0}
+        for outcome in results.values():
+            counts[outcome] += 1
+        logger.info("Batch %s by %s: %s", action, user_id, counts)
+        
+        return {"results": results, **counts}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error processing batch response: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to process connection requests: {str(e)}")
+
+
 # 3. ADD/VERIFY THIS ENDPOINT EXISTS - around line 1720
 @app.get("/api/connection-requests/received")
-async def get_received_requests(current_user=Depends(get_current_user)):
-    """Get received connection requests"""
+async def get_received_requests(
+    current_user=Depends(get_current_user),
+    skip: int = 0,
+    limit: int = 50
+):
+    """Get received connection requests (paginated)"""
     try:
         user_id = str(current_user["_id"])
-        logger.info(f"📥 Getting received requests for user: {user_id}")
+        limit = max(1, min(limit, 200))
         
-        requests = get_connection_requests(user_id, "received")
-        logger.info(f"✅ Found {len(requests)} received requests")
+        skip = max(skip, 0)
+        requests = get_connection_requests(user_id, "received", skip, limit)
+        total = count_connection_requests(user_id, "received")
+        logger.debug("Found %d of %d received requests for %s", len(requests), total, user_id)
         
-        return {"requests": requests, "total": len(requests)}
+        return {
+            "requests": requests,
+            "total": total,
+            "skip": skip,
+            "limit": limit,
+            "next_skip": skip + len(requests),
+            "has_more": skip + len(requests) < total
+        }
     except Exception as e:
         logger.error(f"❌ Error getting received requests: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to get requests: {str(e)}")
@@ -3349,21 +3359,25 @@ async def respond_to_request_api(
     """Respond to connection request - PUT endpoint"""
     try:
         user_id = str(current_user["_id"])
-        logger.info(f"📨 Responding to request {request_id}: {response_data.action} by user {user_id}")
         
-        success = respond_to_connection_request(request_id, response_data.action, user_id)
+        if response_data.action not in ("accept", "reject"):
+            raise HTTPException(status_code=400, detail="Action must be 'accept' or 'reject'")
+        
+        success = await asyncio.to_thread(respond_to_connection_request, request_id, response_data.action, user_id)
         
         if not success:
             raise HTTPException(status_code=400, detail="Failed to process connection request")
         
         action_text = "accepted" if response_data.action == "accept" else "rejected"
-        logger.info(f"✅ Request {request_id} {action_text} successfully")
+        logger.info("Request %s %s by %s", request_id, action_text, user_id)
         
         return {
             "message": f"Connection request {action_text} successfully",
             "status": action_text
         }
         
+    except HTTPException:
+        raise
     except ValueError as e:
         logger.error(f"❌ Validation error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -3371,6 +3385,20 @@ async def respond_to_request_api(
         logger.error(f"❌ Error responding to request: {e}")
         raise HTTPException(status_code=500, detail="Failed to process connection request")
 
+@app.post("/api/connection-status/batch")
+async def check_connection_status_batch_api(
+    status_input: ConnectionStatusBatchInput,
+    current_user=Depends(get_current_user)
+):
+    """Check connection status towards many users at once"""
+    try:
+        user_id = str(current_user["_id"])
+        statuses = get_connection_statuses_batch(user_id, status_input.target_user_ids)
+        return {"statuses": statuses}
+    except Exception as e:
+        logger.error(f"Batch status check failed: {e}")
+        raise HTTPException(status_code=500, detail="Failed to check status")
+
 @app.get("/api/connection-status/{target_user_id}")
 async def check_connection_status_api(target_user_id: str, current_user=Depends(get_current_user)):
     """Check connection status"""
@@ -3389,6 +3417,8 @@ async def delete_duplicate_request(sender_id: str, receiver_id: str, current_use
             "sender_id": ObjectId(sender_id),
             "receiver_id": ObjectId(receiver_id)
         })
+        if result.deleted_count:
+            clear_pair_state(sender_id, receiver_id, status="pending")
         
         return {
             "deleted": result.deleted_count > 0,
@@ -3397,12 +3427,27 @@ async def delete_duplicate_request(sender_id: str, receiver_id: str, current_use
     except Exception as e:
         return {"error": str(e)}
 @app.get("/api/connections")
-async def get_connections_api(current_user=Depends(get_current_user)):
-    """Get connected users"""
+async def get_connections_api(
+    current_user=Depends(get_current_user),
+    skip: int = 0,
+    limit: int = 50
+):
+    """Get connected users (paginated)"""
     try:
         user_id = str(current_user["_id"])
-        connected_profiles = get_connected_profiles(user_id)
-        return {"connections": connected_profiles}
+        limit = max(1, min(limit, 200))
+        skip = max(skip, 0)
+        connected_profiles, rows_read = get_connected_profiles(user_id, skip, limit)
+        total = count_connections(user_id)
+        # Paging follows connection rows: those pointing at deleted users are read but have no card
+        return {
+            "connections": connected_profiles,
+            "total": total,
+            "skip": skip,
+            "limit": limit,
+            "next_skip": skip + rows_read,
+            "has_more": rows_read == limit and skip + rows_read < total
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to get connections")
 
@@ -3433,6 +3478,38 @@ async def create_conversation_api(request_data: dict, current_user=Depends(get_c
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to create conversation")
 
+@app.get("/api/conversations")
+async def get_conversations_api(
+    current_user=Depends(get_current_user),
+    cursor: Optional[str] = None,
+    limit: int = 20
+):
+    """Conversation inbox, newest activity first (pass next_cursor to page)"""
+    try:
+        user_id = str(current_user["_id"])
+        return get_user_conversations(user_id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ Error getting conversations: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to get conversations")
+
+@app.post("/api/conversations/read")
+async def mark_conversations_read_api(data: MarkReadInput, current_user=Depends(get_current_user)):
+    """Reset unread counters for the given conversations"""
+    try:
+        for conversation_id in data.conversation_ids:
+            if not ObjectId.is_valid(conversation_id):
+                raise HTTPException(status_code=400, detail=f"Invalid conversation id: {conversation_id}")
+        
+        updated = mark_conversations_read(str(current_user["_id"]), data.conversation_ids)
+        return {"updated": updated}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error marking conversations read: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to mark conversations read")
+
 @app.post("/api/messages")
 async def send_message_api(message_data: MessageInput, current_user=Depends(get_current_user)):
     """Send message"""
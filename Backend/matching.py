@@ -0,0 +1,446 @@
+# Team matching - the ranking engine behind team search
+#
+# Skill and interest terms match when they are equal, or when one contains the
+# other and the shorter covers at least 70% of the longer (terms under 3
+# characters only match exactly). Instead of comparing every required term with
+# every profile term, the requirements are compiled once per search into a
+# table keyed by every substring that can satisfy the rule:
+#
+#   * "required term contains profile term": the profile term itself is looked
+#     up among the indexed substrings of the required terms.
+#   * "profile term contains required term": the substrings of the profile term
+#     long enough to pass the rule are looked up among the required terms.
+#
+# Profiles carry their terms pre-normalized (match_index.*_tokens, written by
+# update_user_profile) and the outcome per distinct token is memoized for the
+# search as a bit mask of required positions, so a candidate costs a few dict
+# lookups and integer ORs.
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Batch ranking falls back to pure Python
+    np = None
+
+EXPERIENCE_LEVELS = ["junior", "mid", "senior"]
+
+# Shortest term that can match by containment (shorter terms match exactly only)
+MIN_CONTAINMENT_LENGTH = 3
+
+# Bump when profile_match_fields changes shape so the backfill recomputes profiles
+MATCH_INDEX_VERSION = 2
+
+# Profile fields match_index is derived from
+MATCH_SOURCE_FIELDS = ("skills", "interests", "role", "experience", "availability", "location")
+
+def normalize_text(text) -> str:
+    return str(text or "").lower().strip()
+
+def _min_overlap(length: int) -> int:
+    """Shortest substring that still covers 70% of a term of this length"""
+    return (7 * length + 9) // 10
+
+def overlap_keys(term: str) -> Set[str]:
+    """Substrings of a normalized term long enough to satisfy the 70% overlap rule"""
+    length = len(term)
+    shortest = max(_min_overlap(length), MIN_CONTAINMENT_LENGTH)
+    return {
+        term[start:start + size]
+        for size in range(shortest, length + 1)
+        for start in range(length - size + 1)
+    }
+
+def normalized_terms(terms: Iterable) -> List[str]:
+    return [normalize_text(term) for term in terms or []]
+
+def profile_match_fields(profile_data: dict) -> Dict[str, object]:
+    """
+    Derived match_index.* fields for whichever match inputs profile_data carries.
+    update_user_profile writes these alongside the profile so searches never
+    re-normalize candidates; *_keys and the scalar fields also back the Mongo
+    prefilter (RankingEngine.prefilter).
+    """
+    fields: Dict[str, object] = {}
+    for source, prefix in (("skills", "skill"), ("interests", "interest")):
+        if source in profile_data:
+            tokens = normalized_terms(profile_data.get(source))
+            keys: Set[str] = set()
+            for token in tokens:
+                keys |= overlap_keys(token)
+            fields[f"match_index.{prefix}_tokens"] = tokens
+            fields[f"match_index.{prefix}_keys"] = sorted(keys)
+    if "role" in profile_data:
+        role = normalize_text(profile_data.get("role"))
+        fields["match_index.role"] = role
+        fields["match_index.role_words"] = sorted(set(role.split()))
+    if "experience" in profile_data:
+        experience = normalize_text(profile_data.get("experience"))
+        fields["match_index.experience"] = experience
+        fields["match_index.experience_level"] = _experience_ordinal(experience)
+    if "availability" in profile_data:
+        fields["match_index.availability"] = normalize_text(profile_data.get("availability"))
+    if "location" in profile_data:
+        location = normalize_text(profile_data.get("location"))
+        fields["match_index.location"] = location
+        fields["match_index.location_words"] = sorted(set(location.split()))
+    # Only a full derivation is stamped, so partially derived profiles stay visible to the backfill
+    if all(field in profile_data for field in MATCH_SOURCE_FIELDS):
+        fields["match_index.version"] = MATCH_INDEX_VERSION
+    return fields
+
+class _TermMatcher:
+    """Required terms compiled into lookup tables for one search (positions as bit masks)"""
+
+    def __init__(self, required_terms: List):
+        self.required = normalized_terms(required_terms)
+        self.count = len(self.required)
+        # substring of a required term (or the whole term) -> mask of required positions
+        self.contains_profile_term: Dict[str, int] = {}
+        # required term long enough for containment -> mask of its positions
+        self.containable: Dict[str, int] = {}
+        # profile token -> mask of required positions it matches, filled lazily per search
+        self.token_masks: Dict[str, int] = {}
+
+        for position, term in enumerate(self.required):
+            bit = 1 << position
+            self.contains_profile_term[term] = self.contains_profile_term.get(term, 0) | bit
+            if len(term) >= MIN_CONTAINMENT_LENGTH:
+                self.containable[term] = self.containable.get(term, 0) | bit
+                for key in overlap_keys(term):
+                    self.contains_profile_term[key] = self.contains_profile_term.get(key, 0) | bit
+
+    def _token_mask(self, token: str) -> int:
+        mask = self.contains_profile_term.get(token, 0)
+        if self.containable:
+            for key in overlap_keys(token):
+                mask |= self.containable.get(key, 0)
+        self.token_masks[token] = mask
+        return mask
+
+    def match(self, names: List, tokens: List[str]) -> Tuple[List, int]:
+        """
+        Profile terms matched by the requirements (first match per requirement,
+        deduplicated) and the mask of required positions that were hit.
+        """
+        token_masks = self.token_masks
+        masks = [token_masks[token] if token in token_masks else self._token_mask(token) for token in tokens]
+        hit_mask = 0
+        for mask in masks:
+            hit_mask |= mask
+        if not hit_mask:
+            return [], 0
+
+        matched: List = []
+        seen = set()
+        remaining = hit_mask
+        # Walk required positions in order; each takes the first profile term that hits it
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            for index, mask in enumerate(masks):
+                if mask & bit:
+                    name = names[index]
+                    if name not in seen:
+                        seen.add(name)
+                        matched.append(name)
+                    break
+        return matched, hit_mask
+
+# Declarative scoring: every component produces a fraction in [0, 1] that is
+# multiplied by its weight. UNSPECIFIED_CREDIT is the fraction credited when the
+# search leaves that requirement empty; PARTIAL_CREDIT is used for near matches
+# (role or location word overlap, adjacent experience level).
+COMPONENTS = ("skills", "role", "experience", "availability", "location", "interests")
+
+DEFAULT_WEIGHTS: Dict[str, float] = {
+    "skills": 60,
+    "role": 15,
+    "experience": 10,
+    "availability": 5,
+    "location": 5,
+    "interests": 5,
+}
+
+UNSPECIFIED_CREDIT: Dict[str, float] = {
+    "skills": 0.5,
+    "role": 0,
+    "experience": 0.5,
+    "availability": 0.5,
+    "location": 0.5,
+    "interests": 0,
+}
+
+PARTIAL_CREDIT = 0.5
+
+# Profiles scoring below this are not returned by team search
+MIN_MATCH_SCORE = 30
+
+class RankingEngine:
+    """
+    The single scorer behind team search, compiled once per request.
+
+    score(profile) returns (score, matched_skills, matched_interests).
+    explain(profile) breaks the score down per component.
+    rank(profiles) scores a whole candidate set: per-profile work is reduced to
+    table lookups that fill a component matrix, and weighting, thresholding and
+    ordering run vectorized over that matrix (NumPy when installed).
+
+    Points for role, experience, availability and location depend only on the
+    profile's normalized value (stored in match_index), so they are computed
+    once per distinct value and looked up.
+    """
+
+    def __init__(self, requirements: dict, weights: Optional[Dict[str, float]] = None):
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.weight_vector = [self.weights[component] for component in COMPONENTS]
+        self.required_skill_names = list(requirements.get("required_skills") or [])
+        self.skills = _TermMatcher(self.required_skill_names)
+        self.interests = _TermMatcher(requirements.get("interests") or [])
+
+        self.role = normalize_text(requirements.get("current_role"))
+        self.role_words = set(self.role.split())
+        self.experience = normalize_text(requirements.get("experience"))
+        self.experience_level = _experience_ordinal(self.experience)
+        self.availability = normalize_text(requirements.get("availability"))
+        self.location = normalize_text(requirements.get("location"))
+        self.location_words = set(self.location.split())
+
+        # (field, stored word-set field, fraction function, normalized value -> fraction) in component order
+        self._field_tables = [
+            ("role", "role_words", self._role_fraction, {}),
+            ("experience", None, self._experience_fraction, {}),
+            ("availability", None, self._availability_fraction, {}),
+            ("location", "location_words", self._location_fraction, {}),
+        ]
+
+    # ---- per-field fractions (on normalized values) ----
+    def _role_fraction(self, profile_role: str, words=None) -> float:
+        if self.role and profile_role:
+            if self.role in profile_role or profile_role in self.role:
+                return 1
+            if not self.role_words.isdisjoint(words if words is not None else profile_role.split()):
+                return PARTIAL_CREDIT
+            return 0
+        return UNSPECIFIED_CREDIT["role"] if not self.role else 0
+
+    def _experience_fraction(self, profile_experience: str, words=None) -> float:
+        if self.experience and profile_experience:
+            if self.experience == profile_experience:
+                return 1
+            profile_level = _experience_ordinal(profile_experience)
+            if self.experience_level is not None and profile_level is not None \
+                    and abs(self.experience_level - profile_level) == 1:
+                return PARTIAL_CREDIT
+            return 0
+        return UNSPECIFIED_CREDIT["experience"] if not self.experience else 0
+
+    def _availability_fraction(self, profile_availability: str, words=None) -> float:
+        if self.availability and profile_availability:
+            return 1 if self.availability == profile_availability else 0
+        return UNSPECIFIED_CREDIT["availability"] if not self.availability else 0
+
+    def _location_fraction(self, profile_location: str, words=None) -> float:
+        if self.location and profile_location:
+            if "remote" in self.location and "remote" in profile_location:
+                return 1
+            if self.location in profile_location or profile_location in self.location:
+                return 1
+            if not self.location_words.isdisjoint(words if words is not None else profile_location.split()):
+                return PARTIAL_CREDIT
+            return 0
+        return UNSPECIFIED_CREDIT["location"] if not self.location else 0
+
+    def _terms(self, profile: dict, source: str, prefix: str) -> Tuple[List, List[str]]:
+        names = profile.get(source) or []
+        tokens = (profile.get("match_index") or {}).get(f"{prefix}_tokens")
+        if tokens is None or len(tokens) != len(names):
+            tokens = normalized_terms(names)
+        return names, tokens
+
+    # ---- scoring ----
+    def components(self, profile: dict) -> Tuple[List[float], List, List, int]:
+        """Component fractions (in COMPONENTS order), matched skills, matched interests, skill hit mask"""
+        matched_skills: List = []
+        matched_interests: List = []
+        skill_mask = 0
+
+        if self.skills.count:
+            matched_skills, skill_mask = self.skills.match(*self._terms(profile, "skills", "skill"))
+            fractions = [len(matched_skills) / self.skills.count]
+        else:
+            fractions = [UNSPECIFIED_CREDIT["skills"]]
+
+        index = profile.get("match_index") or {}
+        for field, words_field, fraction_for, table in self._field_tables:
+            stored = field in index
+            value = index[field] if stored else normalize_text(profile.get(field))
+            fraction = table.get(value)
+            if fraction is None:
+                words = index.get(words_field) if stored and words_field else None
+                fraction = table[value] = fraction_for(value, words)
+            fractions.append(fraction)
+
+        if self.interests.count:
+            matched_interests, _ = self.interests.match(*self._terms(profile, "interests", "interest"))
+            fractions.append(len(matched_interests) / self.interests.count)
+        else:
+            fractions.append(UNSPECIFIED_CREDIT["interests"])
+
+        return fractions, matched_skills, matched_interests, skill_mask
+
+    def _total(self, fractions: List[float]) -> int:
+        # Summed in component order so the batch path produces bit-identical totals
+        score = 0
+        for fraction, weight in zip(fractions, self.weight_vector):
+            score += fraction * weight
+        return min(100, max(0, int(score)))
+
+    def score(self, profile: dict) -> Tuple[int, List, List]:
+        fractions, matched_skills, matched_interests, _ = self.components(profile)
+        return self._total(fractions), matched_skills, matched_interests
+
+    def explain(self, profile: dict) -> Dict:
+        """Score plus the points each component contributed and which required skills hit"""
+        fractions, matched_skills, matched_interests, skill_mask = self.components(profile)
+        return {
+            "score": self._total(fractions),
+            "components": {
+                component: {
+                    "weight": weight,
+                    "fraction": round(fraction, 4),
+                    "points": round(fraction * weight, 2)
+                }
+                for component, fraction, weight in zip(COMPONENTS, fractions, self.weight_vector)
+            },
+            "matched_skills": matched_skills,
+            "matched_interests": matched_interests,
+            "required_skills_met": [
+                name for position, name in enumerate(self.required_skill_names) if skill_mask >> position & 1
+            ],
+            "required_skills_missing": [
+                name for position, name in enumerate(self.required_skill_names) if not skill_mask >> position & 1
+            ]
+        }
+
+    def prefilter(self, min_score: int = MIN_MATCH_SCORE) -> Optional[dict]:
+        """
+        A Mongo $or over match_index fields that every profile able to reach
+        min_score satisfies, or None when no such filter is provably safe.
+        Components are either expressible as an indexed clause (skills,
+        interests, experience, availability) or not (role and location use
+        substring containment). A profile matching none of the clauses can
+        score at most the unspecified credits plus the weight of every
+        component without a clause; the filter is only returned when that
+        bound is below min_score.
+        """
+        clauses: List[dict] = []
+        bound = 0.0
+        for component, weight in zip(COMPONENTS, self.weight_vector):
+            specified, component_clauses = self._component_clauses(component)
+            if not specified:
+                bound += UNSPECIFIED_CREDIT[component] * weight
+            elif component_clauses is None:
+                bound += weight
+            else:
+                clauses.extend(component_clauses)
+
+        if not clauses or bound >= min_score:
+            return None
+        return {"$or": clauses}
+
+    def _component_clauses(self, component: str) -> Tuple[bool, Optional[List[dict]]]:
+        """(requirement specified?, clauses that every profile scoring > 0 on it matches)"""
+        if component in ("skills", "interests"):
+            matcher, prefix = (self.skills, "skill") if component == "skills" else (self.interests, "interest")
+            if not matcher.count:
+                return False, None
+            clauses = [{f"match_index.{prefix}_tokens": {"$in": sorted(matcher.contains_profile_term)}}]
+            if matcher.containable:
+                clauses.append({f"match_index.{prefix}_keys": {"$in": sorted(matcher.containable)}})
+            return True, clauses
+        if component == "experience":
+            if not self.experience:
+                return False, None
+            clauses = [{"match_index.experience": self.experience}]
+            if self.experience_level is not None:
+                adjacent = [self.experience_level - 1, self.experience_level + 1]
+                clauses.append({"match_index.experience_level": {"$in": adjacent}})
+            return True, clauses
+        if component == "availability":
+            if not self.availability:
+                return False, None
+            return True, [{"match_index.availability": self.availability}]
+        if component == "role":
+            return bool(self.role), None
+        return bool(self.location), None
+
+    def rank(self, profiles: Iterable[dict], min_score: int = MIN_MATCH_SCORE) -> List[Tuple[int, dict, List, List]]:
+        """
+        Score every profile and return (score, profile, matched_skills, matched_interests)
+        for those at or above min_score, best first (ties keep input order).
+        """
+        candidates: List[dict] = []
+        matches: List[Tuple[List, List]] = []
+        rows: List[List[float]] = []
+        for profile in profiles:
+            fractions, matched_skills, matched_interests, _ = self.components(profile)
+            candidates.append(profile)
+            matches.append((matched_skills, matched_interests))
+            rows.append(fractions)
+
+        if not rows:
+            return []
+
+        if np is not None:
+            matrix = np.asarray(rows, dtype=np.float64)
+            totals = np.zeros(len(rows), dtype=np.float64)
+            for column, weight in enumerate(self.weight_vector):
+                totals += matrix[:, column] * weight
+            scores = np.clip(np.floor(totals), 0, 100).astype(np.int64)
+            eligible = np.flatnonzero(scores >= min_score)
+            order = eligible[np.argsort(-scores[eligible], kind="stable")]
+            ranked = [(int(scores[i]), i) for i in order]
+        else:
+            scores = [self._total(row) for row in rows]
+            ranked = sorted(
+                ((score, i) for i, score in enumerate(scores) if score >= min_score),
+                key=lambda item: -item[0]
+            )
+
+        return [(score, candidates[i], *matches[i]) for score, i in ranked]
+
+    def ranking(self, profiles: Iterable[dict], min_score: int = MIN_MATCH_SCORE) -> List[Tuple[int, str]]:
+        """
+        (score, user_id) of every match from rank(), score descending then
+        user_id ascending, so the order is stable across requests and pages can
+        be cut from it with page_after()
+        """
+        ranked = [(score, str(profile["user_id"])) for score, profile, _, _ in self.rank(profiles, min_score)]
+        ranked.sort(key=lambda entry: (-entry[0], _ranking_key(entry[1])))
+        return ranked
+
+def page_after(ranking: List[Tuple[int, str]], after: Optional[Tuple[int, str]] = None,
+               limit: int = 20) -> Tuple[List[Tuple[int, str]], bool]:
+    """The `limit` entries of a ranking() that follow the (score, user_id) position `after`, and whether more follow"""
+    start = 0
+    if after:
+        after_score, after_key = after[0], _ranking_key(after[1])
+        end = len(ranking)
+        while start < end:
+            middle = (start + end) // 2
+            score, user_id = ranking[middle]
+            if score > after_score or (score == after_score and _ranking_key(user_id) <= after_key):
+                start = middle + 1
+            else:
+                end = middle
+    return ranking[start:start + limit], start + limit < len(ranking)
+
+def _ranking_key(user_id) -> int:
+    """Tie-break between equal scores: ObjectId hex as an integer (ascending = creation order)"""
+    return int(str(user_id), 16)
+
+def _experience_ordinal(experience: str) -> Optional[int]:
+    try:
+        return EXPERIENCE_LEVELS.index(experience)
+    except ValueError:
+        return None
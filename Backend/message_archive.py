@@ -0,0 +1,237 @@
+# Message archival - rolls old chat messages into compact bucket documents
+#
+# Hot messages live one-per-document in `messages`. Messages older than
+# MESSAGE_ARCHIVE_AFTER_DAYS are moved into `message_archives`, one bucket per
+# conversation per day (capped at MESSAGE_ARCHIVE_BUCKET_SIZE messages):
+#
+#   {_id: "<conversation_id>:<start_index>", conversation_id, start_index, end_index,
+#    day, base_time, count, senders: [ObjectId, ...], compressed: bool,
+#    data: {ids, t, s, c, unread, types} | zlib(json(...))}
+#
+# t holds millisecond offsets from base_time and s indexes into senders;
+# sender_name is not stored (it is resolved from the conversation's participants).
+# Archived messages are always a strict prefix of a conversation's history and
+# conversations.archived_count records its length, so the read path can split
+# a skip/limit window between the two tiers without merging by timestamp.
+# Messages are marked read as they are archived: mark-as-read only updates the
+# hot tier, so an archived message never changes after it is written.
+#
+# Run `python message_archive.py` to archive once from the command line.
+import os
+import json
+import zlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from bson.objectid import ObjectId
+
+MESSAGE_ARCHIVE_AFTER_DAYS = int(os.getenv("MESSAGE_ARCHIVE_AFTER_DAYS", "30"))
+MESSAGE_ARCHIVE_BUCKET_SIZE = int(os.getenv("MESSAGE_ARCHIVE_BUCKET_SIZE", "500"))
+MESSAGE_ARCHIVE_COMPRESS = os.getenv("MESSAGE_ARCHIVE_COMPRESS", "false").lower() == "true"
+# Buckets written per transaction; keeps each transaction well under the 16MB limit
+MESSAGE_ARCHIVE_BUCKETS_PER_TXN = int(os.getenv("MESSAGE_ARCHIVE_BUCKETS_PER_TXN", "10"))
+# How often the API process runs archival in the background (0 disables it)
+MESSAGE_ARCHIVE_INTERVAL_HOURS = float(os.getenv("MESSAGE_ARCHIVE_INTERVAL_HOURS", "0"))
+
+ARCHIVE_COLLECTION = "message_archives"
+
+# =====================
+# BUCKET CODEC
+# =====================
+def encode_bucket(conversation_id: ObjectId, start_index: int, messages: List[dict],
+                  compress: bool = MESSAGE_ARCHIVE_COMPRESS) -> dict:
+    """Pack consecutive messages (sorted by timestamp) into one bucket document"""
+    base_time = messages[0]["timestamp"]
+    senders: List[ObjectId] = []
+    sender_slots: Dict[ObjectId, int] = {}
+    columns = {"ids": [], "t": [], "s": [], "c": [], "unread": [], "types": []}
+
+    for position, message in enumerate(messages):
+        sender_id = message["sender_id"]
+        if sender_id not in sender_slots:
+            sender_slots[sender_id] = len(senders)
+            senders.append(sender_id)
+
+        columns["ids"].append(str(message["_id"]))
+        columns["t"].append(int((message["timestamp"] - base_time).total_seconds() * 1000))
+        columns["s"].append(sender_slots[sender_id])
+        columns["c"].append(message.get("content", ""))
+        if not message.get("read", False):
+            columns["unread"].append(position)
+        if message.get("message_type", "text") != "text":
+            columns["types"].append([position, message["message_type"]])
+
+    if compress:
+        data = zlib.compress(json.dumps(columns, separators=(",", ":")).encode("utf-8"))
+    else:
+        data = columns
+
+    return {
+        "_id": f"{conversation_id}:{start_index}",
+        "conversation_id": conversation_id,
+        "start_index": start_index,
+        "end_index": start_index + len(messages),
+        "day": base_time.strftime("%Y-%m-%d"),
+        "base_time": base_time,
+        "count": len(messages),
+        "senders": senders,
+        "compressed": compress,
+        "data": data
+    }
+
+def decode_bucket(bucket: dict, sender_names: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """Unpack a bucket into the message dicts returned by get_messages_fixed"""
+    data = bucket["data"]
+    columns = json.loads(zlib.decompress(data)) if bucket.get("compressed") else data
+
+    sender_names = sender_names or {}
+    senders = [str(sender_id) for sender_id in bucket["senders"]]
+    unread = set(columns.get("unread", []))
+    types = dict((position, message_type) for position, message_type in columns.get("types", []))
+    conversation_id = str(bucket["conversation_id"])
+    base_time = bucket["base_time"]
+
+    messages = []
+    for position, message_id in enumerate(columns["ids"]):
+        sender_id = senders[columns["s"][position]]
+        messages.append({
+            "id": message_id,
+            "conversation_id": conversation_id,
+            "sender_id": sender_id,
+            "sender_name": sender_names.get(sender_id, "Unknown"),
+            "content": columns["c"][position],
+            "message_type": types.get(position, "text"),
+            "timestamp": base_time + timedelta(milliseconds=columns["t"][position]),
+            "read": position not in unread
+        })
+    return messages
+
+# =====================
+# READ PATH
+# =====================
+def read_archived_messages(db, conversation_id: ObjectId, start: int, stop: int,
+                           sender_names: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """Messages with archive positions in [start, stop), oldest first"""
+    if stop <= start:
+        return []
+
+    buckets = db[ARCHIVE_COLLECTION].find({
+        "conversation_id": conversation_id,
+        "start_index": {"$lt": stop},
+        "end_index": {"$gt": start}
+    }).sort("start_index", 1)
+
+    messages = []
+    for bucket in buckets:
+        decoded = decode_bucket(bucket, sender_names)
+        lo = max(start - bucket["start_index"], 0)
+        hi = min(stop - bucket["start_index"], len(decoded))
+        messages.extend(decoded[lo:hi])
+    return messages
+
+# =====================
+# ARCHIVAL
+# =====================
+def _chunk_into_buckets(messages: List[dict], bucket_size: int) -> List[List[dict]]:
+    """Split timestamp-ordered messages at day boundaries and every bucket_size messages"""
+    buckets: List[List[dict]] = []
+    current: List[dict] = []
+    current_day = None
+    for message in messages:
+        day = message["timestamp"].date()
+        if current and (day != current_day or len(current) >= bucket_size):
+            buckets.append(current)
+            current = []
+        current_day = day
+        current.append(message)
+    if current:
+        buckets.append(current)
+    return buckets
+
+def archive_conversation(db, client, conversation_id: ObjectId, cutoff: datetime,
+                         bucket_size: int = MESSAGE_ARCHIVE_BUCKET_SIZE) -> int:
+    """
+    Move a conversation's messages older than cutoff into archive buckets.
+    Each batch of buckets is written, removed from the hot tier and counted in
+    conversations.archived_count inside one transaction, so readers never see
+    a message in both tiers or in neither.
+    """
+    messages_collection = db["messages"]
+    conversations_collection = db["conversations"]
+    archives_collection = db[ARCHIVE_COLLECTION]
+    batch_limit = bucket_size * MESSAGE_ARCHIVE_BUCKETS_PER_TXN
+    archived = 0
+
+    while True:
+        moved = 0
+
+        def archive_batch(session):
+            nonlocal moved
+            conversation = conversations_collection.find_one(
+                {"_id": conversation_id}, {"archived_count": 1}, session=session
+            )
+            if not conversation:
+                return
+            start_index = conversation.get("archived_count", 0)
+
+            batch = list(
+                messages_collection.find(
+                    {"conversation_id": conversation_id, "timestamp": {"$lt": cutoff}},
+                    session=session
+                ).sort("timestamp", 1).limit(batch_limit)
+            )
+            if not batch:
+                return
+
+            for message in batch:
+                message["read"] = True
+
+            buckets = []
+            for chunk in _chunk_into_buckets(batch, bucket_size):
+                buckets.append(encode_bucket(conversation_id, start_index, chunk))
+                start_index += len(chunk)
+
+            archives_collection.insert_many(buckets, ordered=True, session=session)
+            messages_collection.delete_many(
+                {"_id": {"$in": [message["_id"] for message in batch]}}, session=session
+            )
+            conversations_collection.update_one(
+                {"_id": conversation_id},
+                {"$inc": {"archived_count": len(batch)}},
+                session=session
+            )
+            moved = len(batch)
+
+        with client.start_session() as session:
+            session.with_transaction(archive_batch)
+
+        archived += moved
+        if moved < batch_limit:
+            return archived
+
+def archive_old_messages(db, client, older_than_days: int = MESSAGE_ARCHIVE_AFTER_DAYS) -> Dict[str, int]:
+    """Archive every conversation's messages from before midnight older_than_days ago"""
+    # Cut at midnight so a day's messages are never split across two runs
+    cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+    summary = {"conversations": 0, "messages": 0}
+    for conversation in db["conversations"].find({"created_at": {"$lt": cutoff}}, {"_id": 1}):
+        try:
+            moved = archive_conversation(db, client, conversation["_id"], cutoff)
+        except Exception as e:
+            logging.error(f"Failed to archive conversation {conversation['_id']}: {e}")
+            continue
+        if moved:
+            summary["conversations"] += 1
+            summary["messages"] += moved
+
+    logging.info(f"Archived {summary['messages']} message(s) from {summary['conversations']} conversation(s)")
+    return summary
+
+if __name__ == "__main__":
+    from database import db, client
+
+    logging.basicConfig(level=logging.INFO)
+    print(archive_old_messages(db, client))
@@ -0,0 +1,279 @@
+# Metrics - counters and histograms rendered in the Prometheus text format
+#
+# A dependency-free subset of prometheus_client: labelled Counter / Gauge /
+# Histogram, a registry rendered by GET /metrics, and the hooks the API wires
+# in - the `observe_upstream` decorator for outbound calls (which also opens a
+# tracing span), a pymongo command
+# listener counting database operations (per request, via a context variable
+# set by the HTTP middleware), and an event-loop lag sampler. Values are per
+# process; scrape every worker, or run one.
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from tracing import span, set_span_attribute
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192)
+
+_REGISTRY: List["_Metric"] = []
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+_INF_BUCKET = 'le="+Inf"'
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, _INF_BUCKET)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in _REGISTRY for line in metric.render()) + "\n"
+
+# =====================
+# METRICS
+# =====================
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "API request latency by route", ("method", "route", "status")
+)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to external services", ("upstream",)
+)
+UPSTREAM_RESPONSES = Counter(
+    "upstream_responses_total", "Responses from external services by status class", ("upstream", "status")
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total", "Failed calls to external services: non-2xx responses (kind=status) "
+    "and calls that raised (kind=exception)", ("upstream", "kind")
+)
+UPSTREAM_THROTTLED = Counter(
+    "upstream_throttled_total", "429 responses from external services", ("upstream",)
+)
+RATE_LIMIT_WAIT = Histogram(
+    "rate_limiter_wait_seconds", "Time spent waiting on client-side rate limiters", ("limiter",)
+)
+LLM_HEDGED_REQUESTS = Counter(
+    "llm_hedged_requests_total", "LLM requests also sent to a backup provider after the hedge delay", ("provider",)
+)
+LLM_PROVIDER_SATURATED = Counter(
+    "llm_provider_saturated_total", "LLM attempts that skipped a provider running at max_concurrency", ("provider",)
+)
+LLM_TOKENS = Histogram(
+    "llm_tokens", "Tokens per LLM request as reported by the provider", ("provider", "task", "kind"),
+    buckets=TOKEN_BUCKETS
+)
+LLM_TRUNCATED_COMPLETIONS = Counter(
+    "llm_truncated_completions_total", "Completions cut off by max_tokens", ("provider", "task")
+)
+CIRCUIT_BREAKER_OPEN = Gauge(
+    "circuit_breaker_open", "1 while a provider's circuit breaker is open", ("provider",)
+)
+DB_OPERATIONS = Counter(
+    "db_operations_total", "MongoDB commands by command name and outcome", ("command", "outcome")
+)
+DB_COMMAND_DURATION = Histogram(
+    "db_command_duration_seconds", "MongoDB command latency", ("command",)
+)
+DB_OPERATIONS_PER_REQUEST = Histogram(
+    "db_operations_per_request", "MongoDB commands issued while serving one request", ("route",),
+    buckets=COUNT_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "In-process cache lookups by cache and result", ("cache", "result")
+)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total", "Log records not written: sampled out or the log queue was full", ("reason",)
+)
+TRACE_SPANS_DROPPED = Counter("trace_spans_dropped_total", "Spans not exported because the trace queue was full")
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a scheduled wake-up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+# =====================
+# UPSTREAM CALLS
+# =====================
+def record_upstream_response(upstream: str, status_code: int):
+    """Count one HTTP response from an external service (and tag the current span with it)"""
+    set_span_attribute("http.status_code", status_code)
+    UPSTREAM_RESPONSES.inc(upstream=upstream, status=f"{status_code // 100}xx")
+    if status_code == 429:
+        UPSTREAM_THROTTLED.inc(upstream=upstream)
+    if status_code >= 400:
+        UPSTREAM_ERRORS.inc(upstream=upstream, kind="status")
+
+def _observe_failure(upstream: str, start: float, error: Exception):
+    # Input rejected before (or instead of) calling out (HTTPException 4xx) - not an upstream failure
+    if getattr(error, "status_code", 500) < 500:
+        return
+    UPSTREAM_ERRORS.inc(upstream=upstream, kind="exception")
+    UPSTREAM_DURATION.observe(time.perf_counter() - start, upstream=upstream)
+
+def observe_upstream(upstream: str):
+    """Decorator timing (and tracing) a sync or async function that calls an external service"""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    with span(f"upstream.{upstream}", "CLIENT", upstream=upstream):
+                        result = await fn(*args, **kwargs)
+                except Exception as e:
+                    _observe_failure(upstream, start, e)
+                    raise
+                UPSTREAM_DURATION.observe(time.perf_counter() - start, upstream=upstream)
+                return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                with span(f"upstream.{upstream}", "CLIENT", upstream=upstream):
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                _observe_failure(upstream, start, e)
+                raise
+            UPSTREAM_DURATION.observe(time.perf_counter() - start, upstream=upstream)
+            return result
+        return wrapper
+    return decorator
+
+def record_cache_lookup(cache: str, result: str):
+    """Count a cache lookup ("hit", "miss", ...) and tag the current span with it"""
+    CACHE_REQUESTS.inc(cache=cache, result=result)
+    set_span_attribute(f"cache.{cache}", result)
+
+# =====================
+# DATABASE
+# =====================
+# Mutable per-request counter; threads started with asyncio.to_thread and
+# Starlette's threadpool inherit the request's context, so they share it
+_request_db_ops: ContextVar[Optional[List[int]]] = ContextVar("request_db_ops", default=None)
+
+def start_request_db_count() -> List[int]:
+    holder = [0]
+    _request_db_ops.set(holder)
+    return holder
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding the db_* metrics"""
+
+    def started(self, event):
+        holder = _request_db_ops.get()
+        if holder is not None:
+            holder[0] += 1
+
+    def succeeded(self, event):
+        DB_OPERATIONS.inc(command=event.command_name, outcome="ok")
+        DB_COMMAND_DURATION.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        DB_OPERATIONS.inc(command=event.command_name, outcome="error")
+        DB_COMMAND_DURATION.observe(event.duration_micros / 1e6, command=event.command_name)
+
+# =====================
+# EVENT LOOP
+# =====================
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Sample how late asyncio wakes a sleeping task; sustained lag means something blocks the loop"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - start - interval))
@@ -0,0 +1,295 @@
+# Teammate recommendations - hashed n-gram profile embeddings with top-k search
+#
+# A profile is embedded from its skills, interests and role: every normalized
+# term contributes its words and its space-padded character trigrams, hashed
+# (crc32, so stable across processes) into EMBEDDING_DIM signed buckets and
+# weighted per field, and the vector is L2-normalized. Related spellings
+# ("react" / "react native", "data science" / "data scientist") share trigrams,
+# so they land close together without any model to download.
+#
+# The index is built offline into EMBEDDING_INDEX_DIR, one directory per build
+# (vectors.npy, float32, opened memory-mapped, plus user_ids.json), with the
+# CURRENT file naming the live build so readers never see half of one. Builds
+# take an exclusive lock on the directory, so workers sharing it never build
+# (or clean up) concurrently, and a worker that finds a fresh enough build
+# skips its own. The API loads the current build at startup and keeps a delta
+# for profiles changed since it was built: its own updates immediately, and
+# every EMBEDDING_SYNC_SECONDS the profiles whose updated_at is newer (so other
+# workers' updates, and updates made before a restart, are picked up). A search
+# is one matrix-vector product over the mapped matrix with superseded rows
+# masked, merged with the delta's scores; the next build folds the delta in.
+#
+# Run `python profile_embeddings.py` to build the index from the command line.
+import os
+import json
+import time
+import zlib
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from matching import normalize_text
+
+try:
+    import numpy as np
+except ImportError:  # Recommendations are disabled without numpy
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # No cross-process build lock on Windows; run one worker there
+    fcntl = None
+
+EMBEDDING_INDEX_DIR = os.getenv(
+    "EMBEDDING_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_index")
+)
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "256"))
+# How often the index is rebuilt in the background (0 disables it); workers
+# sharing EMBEDDING_INDEX_DIR skip the rebuild if another one just did it
+EMBEDDING_REBUILD_INTERVAL_HOURS = float(os.getenv("EMBEDDING_REBUILD_INTERVAL_HOURS", "24"))
+# How often profiles changed since the build are pulled into the delta
+EMBEDDING_SYNC_SECONDS = float(os.getenv("EMBEDDING_SYNC_SECONDS", "60"))
+# Overlap between syncs, for clock skew between API hosts and the writes' updated_at
+EMBEDDING_SYNC_OVERLAP_SECONDS = 30
+
+FIELD_WEIGHTS = {"skills": 1.0, "interests": 0.5, "role": 0.5}
+EMBEDDING_SOURCE_FIELDS = tuple(FIELD_WEIGHTS)
+
+# =====================
+# EMBEDDING
+# =====================
+def _features(term: str) -> List[str]:
+    padded = f" {term} "
+    features = ["w:" + word for word in term.split()]
+    features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+@lru_cache(maxsize=65536)
+def _term_vector(term: str):
+    """Unweighted hashed features of one normalized term (terms repeat across profiles)"""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for feature in _features(term):
+        bucket = zlib.crc32(feature.encode("utf-8"))
+        vector[bucket % EMBEDDING_DIM] += 1.0 if bucket & 0x80000000 else -1.0
+    return vector
+
+def embed(skills: Iterable = (), interests: Iterable = (), role: Optional[str] = None):
+    """Unit-length float32 vector for a profile, or for search requirements"""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    fields = (("skills", skills), ("interests", interests), ("role", [role] if role else []))
+    for field, terms in fields:
+        weight = FIELD_WEIGHTS[field]
+        for term in terms or []:
+            term = normalize_text(term)
+            if term:
+                vector += weight * _term_vector(term)
+
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+def embed_profile(profile: dict):
+    return embed(profile.get("skills"), profile.get("interests"), profile.get("role"))
+
+# =====================
+# OFFLINE BUILD
+# =====================
+@contextmanager
+def _build_lock(directory: str):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".build.lock"), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def current_build_started_at(directory: str = EMBEDDING_INDEX_DIR) -> Optional[float]:
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            build_name = f.read().strip()
+        with open(os.path.join(directory, build_name, "user_ids.json")) as f:
+            return json.load(f)["started_at"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def build_index(profiles_collection, directory: str = EMBEDDING_INDEX_DIR,
+                max_age_seconds: Optional[float] = None) -> Optional[int]:
+    """
+    Embed every profile into a new build directory and make it the current
+    one. With max_age_seconds, returns None without building if the current
+    build is younger than that (e.g. another worker just built it).
+    """
+    if np is None:
+        raise RuntimeError("numpy is required to build the embedding index")
+    with _build_lock(directory):
+        if max_age_seconds is not None:
+            current_started_at = current_build_started_at(directory)
+            if current_started_at is not None and time.time() - current_started_at < max_age_seconds:
+                return None
+        return _build(profiles_collection, directory)
+
+def _build(profiles_collection, directory: str) -> int:
+    started_at = time.time()
+    user_ids: List[str] = []
+    vectors = []
+    projection = {"_id": 0, "user_id": 1, **{field: 1 for field in EMBEDDING_SOURCE_FIELDS}}
+    for profile in profiles_collection.find({}, projection):
+        user_ids.append(str(profile["user_id"]))
+        vectors.append(embed_profile(profile))
+
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    build_name = f"build-{int(started_at * 1000)}-{os.getpid()}"
+    build_dir = os.path.join(directory, build_name)
+    os.makedirs(build_dir, exist_ok=True)
+    np.save(os.path.join(build_dir, "vectors.npy"), matrix)
+    with open(os.path.join(build_dir, "user_ids.json"), "w") as f:
+        json.dump({"user_ids": user_ids, "started_at": started_at, "dim": EMBEDDING_DIM}, f)
+
+    # Switch readers over atomically, then drop older builds (open maps stay valid)
+    pointer_tmp = os.path.join(directory, f"CURRENT.{os.getpid()}.tmp")
+    with open(pointer_tmp, "w") as f:
+        f.write(build_name)
+    os.replace(pointer_tmp, os.path.join(directory, "CURRENT"))
+    for entry in os.listdir(directory):
+        if entry.startswith("build-") and entry != build_name:
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+    logging.info(f"Built embedding index {build_name} with {len(user_ids)} profile(s)")
+    return len(user_ids)
+
+# =====================
+# SEARCH
+# =====================
+class EmbeddingIndex:
+    """The current build, memory-mapped, plus vectors for profiles changed since"""
+
+    def __init__(self, directory: str = EMBEDDING_INDEX_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._build = None
+        self._matrix = None
+        self._user_ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        # user_id -> (vector or None when removed, time of the change)
+        self._delta: Dict[str, Tuple[object, float]] = {}
+        self._build_started_at = 0.0
+        self._synced_until: Optional[float] = None
+
+    @property
+    def available(self) -> bool:
+        return np is not None and self._matrix is not None
+
+    def __len__(self) -> int:
+        return len(self._rows) + sum(1 for user_id in self._delta if user_id not in self._rows)
+
+    def load(self) -> bool:
+        """Open the current build if it is newer than the loaded one"""
+        if np is None:
+            return False
+        try:
+            with open(os.path.join(self.directory, "CURRENT")) as f:
+                build_name = f.read().strip()
+        except FileNotFoundError:
+            return False
+        if build_name == self._build:
+            return True
+
+        build_dir = os.path.join(self.directory, build_name)
+        with open(os.path.join(build_dir, "user_ids.json")) as f:
+            meta = json.load(f)
+        if meta.get("dim") != EMBEDDING_DIM:
+            logging.warning(f"Embedding index {build_name} has dim {meta.get('dim')}, expected {EMBEDDING_DIM}")
+            return False
+        matrix = np.load(os.path.join(build_dir, "vectors.npy"), mmap_mode="r")
+
+        with self._lock:
+            self._build = build_name
+            self._matrix = matrix
+            self._user_ids = meta["user_ids"]
+            self._rows = {user_id: row for row, user_id in enumerate(self._user_ids)}
+            # Changes made after the build started are not in it yet
+            self._delta = {
+                user_id: change for user_id, change in self._delta.items()
+                if change[1] >= meta["started_at"]
+            }
+            self._build_started_at = meta["started_at"]
+        logging.info(f"Loaded embedding index {build_name} ({len(self._user_ids)} profile(s))")
+        return True
+
+    def upsert(self, user_id: str, profile: dict, changed_at: Optional[float] = None):
+        if np is None:
+            return
+        vector = embed_profile(profile)
+        changed_at = changed_at if changed_at is not None else time.time()
+        with self._lock:
+            current = self._delta.get(str(user_id))
+            if current is None or current[1] <= changed_at:
+                self._delta[str(user_id)] = (vector, changed_at)
+
+    def sync(self, profiles_collection) -> int:
+        """Pull profiles updated since the build (or the last sync) into the delta"""
+        if not self.available:
+            return 0
+        with self._lock:
+            since = max(self._build_started_at, self._synced_until or 0) - EMBEDDING_SYNC_OVERLAP_SECONDS
+        started = time.time()
+        projection = {"_id": 0, "user_id": 1, "updated_at": 1, **{field: 1 for field in EMBEDDING_SOURCE_FIELDS}}
+        changed = 0
+        cursor = profiles_collection.find(
+            {"updated_at": {"$gte": datetime.fromtimestamp(since, timezone.utc).replace(tzinfo=None)}}, projection
+        )
+        for profile in cursor:
+            # updated_at is stored as naive UTC
+            changed_at = profile["updated_at"].replace(tzinfo=timezone.utc).timestamp()
+            self.upsert(str(profile["user_id"]), profile, changed_at)
+            changed += 1
+        with self._lock:
+            self._synced_until = started
+        return changed
+
+    def remove(self, user_id: str):
+        with self._lock:
+            self._delta[str(user_id)] = (None, time.time())
+
+    def search(self, query_vector, k: int = 20, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        """Top-k (user_id, cosine similarity) with positive similarity, best first"""
+        with self._lock:
+            matrix, user_ids, rows = self._matrix, self._user_ids, self._rows
+            delta = dict(self._delta)
+        if matrix is None or k <= 0:
+            return []
+
+        excluded = set(exclude)
+        hidden = {rows[user_id] for user_id in excluded if user_id in rows}
+        hidden.update(rows[user_id] for user_id in delta if user_id in rows)
+
+        candidates: List[Tuple[float, str]] = []
+        if len(matrix):
+            scores = matrix @ query_vector
+            if hidden:
+                scores[list(hidden)] = -np.inf
+            top = min(k, len(scores))
+            best = np.argpartition(-scores, top - 1)[:top]
+            candidates.extend((float(scores[row]), user_ids[row]) for row in best)
+
+        for user_id, (vector, _) in delta.items():
+            if vector is not None and user_id not in excluded:
+                candidates.append((float(vector @ query_vector), user_id))
+
+        candidates.sort(key=lambda candidate: -candidate[0])
+        return [(user_id, score) for score, user_id in candidates[:k] if score > 0]
+
+embedding_index = EmbeddingIndex()
+
+if __name__ == "__main__":
+    from database import profiles_collection
+
+    logging.basicConfig(level=logging.INFO)
+    print(build_index(profiles_collection))
@@ -0,0 +1,156 @@
+# Structured logging - JSON lines, written off the request path, sampled per route
+#
+# configure_logging() replaces logging.basicConfig. Records are created on the
+# caller's thread (cheap: the message is not formatted yet) and handed to a
+# bounded in-memory queue; a background listener thread formats them as JSON
+# and does the I/O. If the queue is full the record is dropped and counted
+# (log_records_dropped_total) rather than blocking the event loop.
+#
+# Per-route sampling: LOG_SAMPLE_RATES="/research-papers=0.1,/api/connection-requests=0.25"
+# keeps DEBUG/INFO lines for that share of requests (longest path prefix wins,
+# LOG_SAMPLE_DEFAULT otherwise). The decision is made once per request from its
+# trace id, so a sampled request keeps all of its lines and the same request is
+# sampled the same way in every worker. WARNING and above are never sampled out.
+#
+# Call sites should pass arguments lazily - logger.info("Fetched %d papers", n),
+# not f-strings - so nothing is formatted for records that are gated by
+# LOG_LEVEL or sampled out; extra={...} fields become top-level JSON keys.
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from metrics import LOG_RECORDS_DROPPED
+from tracing import install_log_request_id
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_DEFAULT = float(os.getenv("LOG_SAMPLE_DEFAULT", "1.0"))
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+_log_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def _parse_sample_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        prefix, _, rate = item.rpartition("=")
+        try:
+            rates[prefix.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+LOG_SAMPLE_RATES = _parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+# =====================
+# SAMPLING
+# =====================
+def sample_rate_for(path: str) -> float:
+    best = None
+    for prefix in LOG_SAMPLE_RATES:
+        if path.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return LOG_SAMPLE_RATES[best] if best is not None else LOG_SAMPLE_DEFAULT
+
+def start_request_log_sampling(path: str, trace_id: str) -> bool:
+    """Decide whether this request's DEBUG/INFO lines are kept (called by the HTTP middleware)"""
+    rate = sample_rate_for(path)
+    if rate >= 1.0:
+        sampled = True
+    elif rate <= 0.0:
+        sampled = False
+    else:
+        sampled = zlib.crc32(trace_id.encode("ascii")) / 0xFFFFFFFF < rate
+    _log_sampled.set(sampled)
+    return sampled
+
+class SamplingFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or _log_sampled.get():
+            return True
+        LOG_RECORDS_DROPPED.inc(reason="sampled")
+        return False
+
+# =====================
+# HANDLERS
+# =====================
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread and drops
+    records instead of waiting when the queue is full
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare() formats the message here, on the caller's thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+# =====================
+# SETUP
+# =====================
+def configure_logging():
+    """Route the root logger through the sampling filter and the background queue listener"""
+    global _listener
+    if _listener is not None:
+        return
+
+    install_log_request_id()
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,57 @@
+# Hot query plans - every HOT_QUERIES shape must be served by an index
+#
+# Runs against a scratch database on TEST_MONGO_URI (default
+# mongodb://localhost:27017) and is skipped when no server is reachable.
+#
+#   pytest Backend/tests
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pymongo = pytest.importorskip("pymongo")
+
+from indexes import HOT_QUERIES, INDEX_SPECS, ensure_indexes, explain_hot_queries  # noqa: E402
+
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017")
+
+@pytest.fixture(scope="module")
+def db():
+    client = pymongo.MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except pymongo.errors.PyMongoError as e:
+        pytest.skip(f"MongoDB not reachable at {TEST_MONGO_URI} ({type(e).__name__})")
+
+    name = f"test_indexes_{uuid.uuid4().hex[:8]}"
+    database = client[name]
+    ensure_indexes(database)
+    # A plan over a collection that doesn't exist is EOF, not an index scan
+    for collection_name in {collection for _, collection, _, _ in HOT_QUERIES} | set(INDEX_SPECS):
+        database[collection_name].insert_one({"_placeholder": True})
+    yield database
+    client.drop_database(name)
+    client.close()
+
+def _report_ids():
+    return [name for name, _, _, _ in HOT_QUERIES]
+
+@pytest.fixture(scope="module")
+def report(db):
+    return {entry["name"]: entry for entry in explain_hot_queries(db)}
+
+@pytest.mark.parametrize("name", _report_ids())
+def test_hot_query_uses_an_index(report, name):
+    entry = report[name]
+    # IXSCAN, or the single-document EXPRESS_IXSCAN / IDHACK fast paths
+    assert any("IXSCAN" in stage or stage == "IDHACK" for stage in entry["stages"]), \
+        f"{name}: {' <- '.join(entry['stages'])}"
+    assert not entry["collscan"], f"{name}: {' <- '.join(entry['stages'])}"
+
+@pytest.mark.parametrize("name", _report_ids())
+def test_hot_query_sort_is_not_blocking(report, name):
+    entry = report[name]
+    assert not entry["blocking_sort"], f"{name}: {' <- '.join(entry['stages'])}"
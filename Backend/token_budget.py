@@ -0,0 +1,150 @@
+# Token budgets for LLM calls - output size per task, prompt sizing, usage tracking
+#
+# Instead of a flat max_tokens=4000, each call asks output_budget(task) for a
+# limit. It starts from a static estimate of the task's output (a roadmap's
+# grows with its number of phases, which follows from the timeframe) and,
+# once LLM_BUDGET_MIN_SAMPLES completions of that task have been seen,
+# switches to the observed p95 completion size plus LLM_BUDGET_HEADROOM.
+# Samples are per process and start empty, so the estimates are what most
+# calls get; a completion cut off by its budget is retried once with
+# LLM_MAX_OUTPUT_TOKENS (llm_providers.chat_completion), so an estimate that
+# is too low costs a second call rather than a truncated answer.
+# Truncated completions (finish_reason "length") are recorded at the limit
+# they hit, so a budget that is too tight grows back on its own.
+#
+# record_usage() is fed the `usage` block of every response and exports
+# llm_tokens{provider,task,kind} and llm_truncated_completions_total, so the
+# budgets can be checked against real numbers on /metrics.
+#
+# Prompts are tokenized locally with tiktoken's cl100k_base when it is
+# installed (close to Llama 3's tokenizer) and estimated from word pieces
+# otherwise; providers with a small context window (a local llama.cpp
+# server) use this to cap max_tokens. compact_prompt() strips indentation,
+# markdown emphasis and blank lines from the static system prompts.
+import math
+import os
+import re
+import threading
+from collections import defaultdict, deque
+from functools import lru_cache
+from typing import Deque, Dict, Optional
+
+from metrics import LLM_TOKENS, LLM_TRUNCATED_COMPLETIONS
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to an estimate without tiktoken
+    tiktoken = None
+
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "4000"))
+LLM_MIN_OUTPUT_TOKENS = int(os.getenv("LLM_MIN_OUTPUT_TOKENS", "128"))
+LLM_BUDGET_MIN_SAMPLES = int(os.getenv("LLM_BUDGET_MIN_SAMPLES", "20"))
+LLM_BUDGET_HEADROOM = float(os.getenv("LLM_BUDGET_HEADROOM", "1.25"))
+# Recent completions kept per task for the p95
+USAGE_WINDOW = 200
+
+ROADMAP_PHASE_GUIDANCE = {
+    3: "focus on MVP and validation",
+    4: "include scaling preparation",
+    5: "comprehensive growth strategy",
+    6: "long-term vision and expansion",
+}
+
+# Static output estimates, used until enough real completions are recorded
+STATIC_OUTPUT_TOKENS = {
+    "validation": 1500,
+    "chat": 1000,
+    "search_terms": 50,
+    **{f"roadmap_{phases}_phases": 250 + 420 * phases for phases in ROADMAP_PHASE_GUIDANCE},
+}
+
+_usage: Dict[str, Deque[int]] = defaultdict(lambda: deque(maxlen=USAGE_WINDOW))
+_usage_lock = threading.Lock()
+
+# =====================
+# TOKENIZING
+# =====================
+_WORD_PIECES = re.compile(r"\w+|[^\w\s]")
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # The encoding file is downloaded on first use and may be unavailable offline
+        return None
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # BPE vocabularies keep common words whole and split long ones into ~4 character pieces
+    return sum(max(1, math.ceil(len(piece) / 4)) if piece[0].isalnum() else 1
+               for piece in _WORD_PIECES.findall(text))
+
+def count_message_tokens(messages) -> int:
+    """Prompt tokens of a chat request, including the few tokens of per-message framing"""
+    return sum(count_tokens(message["content"]) + 4 for message in messages) + 3
+
+@lru_cache(maxsize=64)
+def compact_prompt(text: str) -> str:
+    """Static prompt without indentation, blank lines or markdown emphasis (the model reads it the same)"""
+    lines = []
+    for line in text.splitlines():
+        line = re.sub(r"[ \t]+", " ", line.strip()).replace("**", "")
+        line = re.sub(r"^#+ ", "", line)
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+# =====================
+# BUDGETS
+# =====================
+def timeframe_months(timeframe: str) -> float:
+    match = re.search(r"(\d+(?:\.\d+)?)\s*(week|month|year)", timeframe.lower())
+    if not match:
+        return 6.0
+    value, unit = float(match.group(1)), match.group(2)
+    return value / 4.345 if unit == "week" else value * 12 if unit == "year" else value
+
+def roadmap_phase_count(timeframe: str) -> int:
+    months = timeframe_months(timeframe)
+    return 3 if months <= 3 else 4 if months <= 6 else 5 if months <= 12 else 6
+
+def roadmap_guidance(timeframe: str) -> str:
+    phases = roadmap_phase_count(timeframe)
+    return f"{phases} phases, {ROADMAP_PHASE_GUIDANCE[phases]}"
+
+def roadmap_task(timeframe: str) -> str:
+    return f"roadmap_{roadmap_phase_count(timeframe)}_phases"
+
+def output_budget(task: str) -> int:
+    """max_tokens for a task: observed p95 completion size with headroom, or the static estimate"""
+    with _usage_lock:
+        samples = sorted(_usage[task]) if task in _usage else []
+    if len(samples) >= LLM_BUDGET_MIN_SAMPLES:
+        p95 = samples[min(len(samples) - 1, math.ceil(0.95 * len(samples)) - 1)]
+        budget = math.ceil(p95 * LLM_BUDGET_HEADROOM / 64) * 64
+    else:
+        budget = STATIC_OUTPUT_TOKENS.get(task, LLM_MAX_OUTPUT_TOKENS)
+    return max(LLM_MIN_OUTPUT_TOKENS, min(budget, LLM_MAX_OUTPUT_TOKENS))
+
+def record_usage(task: Optional[str], provider: str, usage: Optional[Dict],
+                 finish_reason: Optional[str], max_tokens: int):
+    """Record one completion's token usage (the response's `usage` block)"""
+    task = task or "other"
+    usage = usage or {}
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    if prompt_tokens is not None:
+        LLM_TOKENS.observe(prompt_tokens, provider=provider, task=task, kind="prompt")
+    if completion_tokens is not None:
+        LLM_TOKENS.observe(completion_tokens, provider=provider, task=task, kind="completion")
+
+    truncated = finish_reason == "length"
+    if truncated:
+        LLM_TRUNCATED_COMPLETIONS.inc(provider=provider, task=task)
+    if completion_tokens is not None or truncated:
+        with _usage_lock:
+            _usage[task].append(max_tokens if truncated else completion_tokens)
@@ -0,0 +1,244 @@
+# Tracing - per-request spans exported as OpenTelemetry-shaped JSON lines
+#
+# Every request gets a root span (started by the HTTP middleware, continuing
+# an incoming W3C `traceparent` when there is one) and the code under it opens
+# child spans with `span(...)` / `@traced(...)`; upstream calls get spans from
+# metrics.observe_upstream, tagged with the response status, and cache lookups
+# tag the current span. The active span lives in a context variable, so spans
+# opened in asyncio tasks and worker threads nest under the request.
+#
+# When a request finishes its spans are queued (bounded by TRACE_QUEUE_SIZE;
+# spans that don't fit are dropped and counted rather than blocking the event
+# loop) and a background thread writes them as JSON lines using the OTLP field
+# names (traceId, spanId, parentSpanId, startTimeUnixNano, ...) to
+# TRACE_EXPORT: "console" (stderr), a file path, or unset to disable. Requests
+# slower than TRACE_SLOW_MS are also logged as a one-line breakdown of their
+# slowest spans. Every log record carries the request id (see
+# install_log_request_id), so a slow request's log lines can be pulled up
+# together.
+import atexit
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")
+TRACE_EXPORT_MIN_MS = float(os.getenv("TRACE_EXPORT_MIN_MS", "0"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "2000"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_export_queue: "queue.Queue[Optional[List[Dict]]]" = queue.Queue(TRACE_QUEUE_SIZE)
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+logger = logging.getLogger("tracing")
+
+class Span:
+    def __init__(self, name: str, trace: "_Trace", parent: Optional["Span"], kind: str, attributes: Dict):
+        self.name = name
+        self.trace = trace
+        self.parent_id = parent.span_id if parent else trace.remote_parent_id
+        self.span_id = secrets.token_hex(8)
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.status = "OK"
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration_ms = 0.0
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.status = "ERROR"
+        self.status_message = message
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        if exc is not None and getattr(exc, "status_code", 500) >= 500:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        _current_span.reset(self._token)
+        self.trace.finished.append(self)
+        return False
+
+    def to_otlp(self) -> Dict:
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": f"SPAN_KIND_{self.kind}",
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.start_ns + int(self.duration_ms * 1e6),
+            "attributes": self.attributes,
+            "status": {"code": f"STATUS_CODE_{self.status}", "message": self.status_message},
+        }
+
+class _Trace:
+    def __init__(self, trace_id: str, remote_parent_id: Optional[str] = None):
+        self.trace_id = trace_id
+        self.remote_parent_id = remote_parent_id
+        # list.append is atomic, so spans finishing in worker threads need no lock
+        self.finished: List[Span] = []
+
+def parse_traceparent(header: Optional[str]):
+    """(trace_id, parent_span_id) from a W3C traceparent header, or (None, None)"""
+    parts = (header or "").strip().split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16 and parts[1] != "0" * 32:
+        return parts[1], parts[2]
+    return None, None
+
+def start_request_span(name: str, traceparent: Optional[str] = None, **attributes) -> Span:
+    """Root span for an incoming request (use as a context manager, then finish_request_span)"""
+    trace_id, remote_parent = parse_traceparent(traceparent)
+    trace = _Trace(trace_id or secrets.token_hex(16), remote_parent)
+    return Span(name, trace, None, "SERVER", attributes)
+
+def span(name: str, kind: str = "INTERNAL", **attributes) -> Span:
+    """Child of the current span; outside a request it starts a trace of its own"""
+    parent = _current_span.get()
+    trace = parent.trace if parent else _Trace(secrets.token_hex(16))
+    return Span(name, trace, parent, kind, attributes)
+
+def traced(name: Optional[str] = None, kind: str = "INTERNAL"):
+    """Decorator wrapping a (sync or async) function in a span"""
+    def decorator(fn):
+        span_name = name or fn.__name__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, kind):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def set_span_attribute(key: str, value):
+    """Tag the current span, if any (e.g. cache hits, upstream status)"""
+    active = _current_span.get()
+    if active is not None:
+        active.set_attribute(key, value)
+
+def current_request_id() -> str:
+    active = _current_span.get()
+    return active.trace.trace_id if active else "-"
+
+def traceparent_for(root: Span) -> str:
+    return f"00-{root.trace.trace_id}-{root.span_id}-01"
+
+# =====================
+# EXPORT
+# =====================
+def finish_request_span(root: Span):
+    """Export a finished request's spans and log a breakdown if it was slow"""
+    spans = root.trace.finished
+    if TRACE_EXPORT and root.duration_ms >= TRACE_EXPORT_MIN_MS:
+        _export(spans)
+    if root.duration_ms >= TRACE_SLOW_MS:
+        logger.warning("Slow request %s %.0fms [%s]: %s",
+                       root.name, root.duration_ms, root.trace.trace_id, _breakdown(root, spans))
+
+def _breakdown(root: Span, spans: List[Span], top: int = 5) -> str:
+    children = sorted((s for s in spans if s is not root), key=lambda s: -s.duration_ms)[:top]
+    if not children:
+        return "no child spans"
+    parts = []
+    for child in children:
+        tags = [f"{key}={value}" for key, value in child.attributes.items()
+                if key.startswith(("http.", "cache.", "upstream", "research."))]
+        parts.append(f"{child.name} {child.duration_ms:.0f}ms" + (f" ({', '.join(tags)})" if tags else ""))
+    return "; ".join(parts)
+
+def _export(spans: List[Span]):
+    """Hand a request's spans to the writer thread (serializing and I/O happen there)"""
+    _start_writer()
+    try:
+        _export_queue.put_nowait([s.to_otlp() for s in spans])
+    except queue.Full:
+        from metrics import TRACE_SPANS_DROPPED  # metrics imports this module
+        TRACE_SPANS_DROPPED.inc(len(spans))
+
+def _start_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_spans, name="trace-export", daemon=True)
+            _writer.start()
+            atexit.register(stop_trace_export)
+
+def _write_spans():
+    output = sys.stderr if TRACE_EXPORT == "console" else open(TRACE_EXPORT, "a")
+    try:
+        while True:
+            # Drain whatever else is already queued into the same write
+            batches = [_export_queue.get()]
+            while batches[-1] is not None:
+                try:
+                    batches.append(_export_queue.get_nowait())
+                except queue.Empty:
+                    break
+            output.write("".join(
+                json.dumps(entry, default=str) + "\n" for batch in batches if batch is not None for entry in batch
+            ))
+            output.flush()
+            if batches[-1] is None:
+                return
+    except Exception as e:
+        logger.error("Trace export to %s stopped: %s", TRACE_EXPORT, e)
+    finally:
+        if output is not sys.stderr:
+            output.close()
+
+def stop_trace_export():
+    """Write the queued spans and stop the writer thread"""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        try:
+            _export_queue.put(None, timeout=5)
+        except queue.Full:
+            return
+        writer.join(timeout=5)
+
+# =====================
+# LOGGING
+# =====================
+def install_log_request_id():
+    """Give every log record a request_id attribute (the current trace id, or "-")"""
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, "_adds_request_id", False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.request_id = current_request_id()
+        return record
+
+    record_factory._adds_request_id = True
+    logging.setLogRecordFactory(record_factory)
@@ -81,6 +81,37 @@ class ApiService {
     }
   }
 
+  // Follows next_skip/has_more on paginated list endpoints and returns every item
+  private async fetchAllPages<T, K extends string>(
+    endpoint: string,
+    key: K,
+    pageSize = 200
+  ): Promise<ApiResponse<{ [P in K]: T[] } & { total: number }>> {
+    const items: T[] = [];
+    let skip = 0;
+    let status = 0;
+    for (;;) {
+      const separator = endpoint.includes("?") ? "&" : "?";
+      const page = await this.makeRequest<
+        { [P in K]: T[] } & { total: number; has_more?: boolean; next_skip?: number }
+      >(
+        `${endpoint}${separator}skip=${skip}&limit=${pageSize}`
+      );
+      if (page.error || !page.data) {
+        return { error: page.error, status: page.status };
+      }
+      status = page.status;
+      const pageItems = page.data[key] || [];
+      items.push(...pageItems);
+      // The server may skip rows it can't show, so resume where it says rather than after our items
+      const nextSkip = page.data.next_skip ?? skip + pageItems.length;
+      if (!page.data.has_more || nextSkip <= skip) break;
+      skip = nextSkip;
+    }
+    // Everything was fetched, so the item count is exact (the server's total may include hidden rows)
+    return { data: { [key]: items, total: items.length } as { [P in K]: T[] } & { total: number }, status };
+  }
+
   // ==============================================
   // CHATBOT API METHODS
   // ==============================================
@@ -270,7 +301,7 @@ class ApiService {
   }
 
   async getReceivedConnectionRequests() {
-    return this.makeRequest<{ requests: ConnectionRequest[]; total: number }>("/api/connection-requests/received");
+    return this.fetchAllPages<ConnectionRequest, "requests">("/api/connection-requests/received", "requests");
   }
 
   async getSentConnectionRequests() {
@@ -300,7 +331,7 @@ class ApiService {
   // ==============================================
 
   async getConnections() {
-    return this.makeRequest<{ connections: TeamMemberProfile[] }>("/api/connections");
+    return this.fetchAllPages<TeamMemberProfile, "connections">("/api/connections", "connections");
   }
 
   async removeConnection(targetUserId: string) {